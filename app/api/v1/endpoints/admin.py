@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from typing import Optional
+import hmac
+from app.core.config import settings
+from app.core.memory import process_memory
+from app.models import schemas
+from app.services.model_registry import get_model_registry
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Check the X-Admin-Token header; admin endpoints are disabled unless ADMIN_TOKEN is configured."""
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if not hmac.compare_digest(x_admin_token or '', settings.admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(dependencies=[Depends(require_admin_token)])
+
+
+@router.get("/admin/models", response_model=schemas.ModelsResponse)
+def get_models():
+    """Versions of the models currently used for scoring and explanations."""
+    return get_model_registry().current().describe()
+
+
+@router.post("/admin/models/reload", response_model=schemas.ModelsResponse)
+def reload_models(force: bool = True):
+    """Load the model files again and switch new requests to them without a restart.
+    
+    Requests already being scored finish on the previous models. With
+    force=false only files whose mtime or size changed are reloaded.
+    """
+    return get_model_registry().reload(force=force)
+
+
+@router.get("/admin/memory", response_model=schemas.WorkerMemoryResponse)
+def get_worker_memory():
+    """Memory use of the worker process serving this request (Linux only).
+    
+    Each request reaches one worker; scripts/report_worker_memory.py reports
+    every worker of a server at once.
+    """
+    try:
+        memory = process_memory(mapped_paths=get_model_registry().mapped_paths())
+    except OSError:
+        raise HTTPException(status_code=501, detail="Memory report requires /proc (Linux)")
+    return {'memory_mode': settings.model_memory_mode, **memory}
@@ -1,79 +1,268 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Dict, Any, Union
+import asyncio
+import json
+import zlib
+from app.core.config import settings
 from app.core.database import get_db
 from app.models import schemas
-from app.services.detection import DetectionService
+from app.models.database import Event
+from app.services.detection import DetectionService, SUMMARY_FIELDS
 from app.services.explainability import ExplainabilityService
 from app.services.alerting import AlertingService
+from app.services.explanation_worker import ExplanationWorker, STATUS_PENDING, STATUS_RUNNING
+from app.services.group_commit import GroupCommitDeferredError, GroupCommitFullError
 
 router = APIRouter()
 detection_service = DetectionService()
 explainability_service = ExplainabilityService()
 alerting_service = AlertingService()
+explanation_worker = ExplanationWorker(explainability_service, alerting_service)
+
+
+@router.on_event("shutdown")
+def shutdown_explanation_worker():
+    """Let queued scoring, explanation jobs and alerts finish before the process exits."""
+    detection_service.shutdown()
+    explanation_worker.shutdown(wait=True)
+    alerting_service.shutdown(wait=True)
+
+
+# Handlers that touch the database, models or explainers are plain `def` so
+# FastAPI runs them in its bounded threadpool instead of on the event loop.
+# Async handlers hand any blocking call to run_in_threadpool.
 
 
 @router.post("/events", response_model=schemas.DetectionResponse)
-async def create_detection(
+def create_detection(
     event: schemas.EventCreate,
     db: Session = Depends(get_db)
 ):
-    """Submit event for detection and analysis."""
+    """Submit event for detection and analysis.
+    
+    Returns as soon as scores are stored. Explanation methods selected by the
+    explanation policy for this score are generated by the background worker
+    pool (see GET /detections/{id}/explanation) unless ASYNC_EXPLANATIONS is
+    disabled.
+    """
     try:
         event_data = event.dict()
         detection = detection_service.detect(db, event_data)
         
-        # Generate explanations
-        explanations = explainability_service.generate_all_explanations(
-            event_data,
-            detection.features,
-            detection.malicious_score
-        )
-        
-        # Update detection with explanations
-        if 'shap' in explanations and 'shap_values' in explanations['shap']:
-            detection.shap_values = explanations['shap']['shap_values']
+        methods = explainability_service.policy.select_methods(detection.malicious_score)
+        # Explanations reused from an identical earlier event are not regenerated
+        missing = explanation_worker.missing_methods(detection)
+        methods = [method for method in methods if method in missing]
         
-        if 'lime' in explanations and 'lime_explanation' in explanations['lime']:
-            detection.lime_explanation = explanations['lime']['lime_explanation']
+        if not methods:
+            # Nothing to explain; alert immediately if threshold exceeded
+            if detection.is_malicious:
+                alerting_service.submit_alert(
+                    schemas.DetectionResponse.from_orm(detection),
+                    event_data
+                )
+            return detection
         
-        if 'openai' in explanations:
-            detection.openai_explanation = explanations['openai']
-        
-        db.commit()
-        db.refresh(detection)
-        
-        # Send alert if threshold exceeded
-        if detection.is_malicious:
-            alerting_service.send_alert(
-                schemas.DetectionResponse.from_orm(detection),
-                event_data
+        if settings.async_explanations:
+            explanation_worker.submit(
+                detection.id,
+                event_data,
+                detection.features,
+                detection.malicious_score,
+                methods=methods
             )
+            response = schemas.DetectionResponse.from_orm(detection)
+            response.explanation_status = STATUS_PENDING
+            return response
         
+        explanation_worker.explain_detection(
+            db,
+            detection,
+            event_data,
+            detection.features,
+            detection.malicious_score,
+            methods=methods
+        )
         return detection
+    except GroupCommitDeferredError as e:
+        # Accepted and spooled; resubmitting would store the events twice
+        return JSONResponse(status_code=202, content={"detail": str(e)})
+    except GroupCommitFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/detections", response_model=List[schemas.DetectionResponse])
-async def list_detections(
+@router.post("/events/batch", response_model=schemas.BatchDetectionResponse)
+async def create_detections_batch(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """Submit a batch of events (JSON array or NDJSON) for detection.
+    
+    Results are returned in input order. Explanations are not generated for
+    batch submissions; they can be requested per detection afterwards.
+    """
+    body = await request.body()
+    events_data = await run_in_threadpool(
+        _parse_event_batch,
+        body,
+        request.headers.get('content-type', ''),
+        request.headers.get('content-encoding', '')
+    )
+    
+    try:
+        results = await run_in_threadpool(_detect_batch, db, events_data)
+        
+        return {
+            "count": len(results),
+            "malicious_count": sum(1 for result in results if result['is_malicious']),
+            "results": results
+        }
+    except GroupCommitDeferredError as e:
+        # Accepted and spooled; resubmitting would store the events twice
+        return JSONResponse(status_code=202, content={"detail": str(e)})
+    except GroupCommitFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _detect_batch(db: Session, events_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Score and store a batch, queueing alerts for detections above the alert threshold."""
+    results = detection_service.detect_batch(db, events_data)
+    
+    for result in results:
+        if result['is_malicious'] and result['malicious_score'] >= settings.alert_threshold:
+            detection = detection_service.get_detection(db, result['detection_id'])
+            alerting_service.submit_alert(
+                schemas.DetectionResponse.from_orm(detection),
+                events_data[result['index']]
+            )
+    
+    return results
+
+
+def _parse_event_batch(body: bytes, content_type: str, content_encoding: str = '') -> List[Dict[str, Any]]:
+    """Parse a JSON array, {"events": [...]} object or NDJSON body, optionally gzip-compressed, into validated event dicts."""
+    body = _decode_body(body, content_encoding)
+    try:
+        text = body.decode('utf-8')
+        if 'ndjson' in content_type or 'jsonl' in content_type:
+            raw_events = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            raw_events = json.loads(text)
+            if isinstance(raw_events, dict):
+                raw_events = raw_events.get('events')
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch body: {e}")
+    
+    if not isinstance(raw_events, list):
+        raise HTTPException(status_code=400, detail="Batch body must be a JSON array, an object with 'events', or NDJSON")
+    
+    if len(raw_events) > settings.max_batch_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(raw_events)} events exceeds maximum of {settings.max_batch_size}"
+        )
+    
+    try:
+        return [schemas.EventCreate(**raw_event).dict() for raw_event in raw_events]
+    except (TypeError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def _decode_body(body: bytes, content_encoding: str) -> bytes:
+    """Undo a gzip Content-Encoding, refusing bodies that inflate beyond max_batch_bytes."""
+    encoding = content_encoding.strip().lower()
+    if encoding in ('', 'identity'):
+        return body
+    if encoding not in ('gzip', 'x-gzip'):
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {content_encoding}")
+    
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        decoded = decompressor.decompress(body, settings.max_batch_bytes)
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid gzip body: {e}")
+    if decompressor.unconsumed_tail:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Decompressed batch exceeds maximum of {settings.max_batch_bytes} bytes"
+        )
+    return decoded
+
+
+@router.get("/detections", response_model=Union[List[schemas.DetectionResponse], List[schemas.DetectionSummary]])
+def list_detections(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     malicious_only: bool = Query(False),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+    view: str = Query("full", pattern="^(full|summary)$"),
+    fields: Optional[str] = Query(None, description="Comma-separated summary fields; implies view=summary"),
     db: Session = Depends(get_db)
 ):
-    """List detections with pagination."""
+    """List detections newest first.
+    
+    Pass the X-Next-Cursor response header back as cursor for the next page;
+    unlike skip it stays fast on deep pages. view=summary (or fields=...)
+    returns only scalar columns and the process name, as DetectionSummary
+    objects, instead of full detections with their JSON explanations.
+    Summary rows are serialized directly, without per-row validation, and
+    carry only the requested fields.
+    """
+    if cursor is not None and skip:
+        raise HTTPException(status_code=400, detail="Use either cursor or skip, not both")
+    
+    try:
+        after = detection_service.decode_cursor(cursor) if cursor is not None else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    summary_fields = None
+    if fields is not None:
+        summary_fields = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [field for field in summary_fields if field not in SUMMARY_FIELDS]
+        if unknown:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Unknown fields {unknown}; choose from {list(SUMMARY_FIELDS)}"
+            )
+    elif view == "summary":
+        summary_fields = list(SUMMARY_FIELDS)
+    
     detections = detection_service.list_detections(
         db,
         skip=skip,
         limit=limit,
-        malicious_only=malicious_only
+        malicious_only=malicious_only,
+        cursor=after,
+        fields=summary_fields
     )
+    
+    headers = {}
+    if len(detections) == limit:
+        last = detections[-1]
+        if summary_fields is not None:
+            headers["X-Next-Cursor"] = detection_service.encode_cursor(last['timestamp'], last['id'])
+        else:
+            headers["X-Next-Cursor"] = detection_service.encode_cursor(last.timestamp, last.id)
+    
+    if summary_fields is not None:
+        return JSONResponse(content=jsonable_encoder(detections), headers=headers)
+    response.headers.update(headers)
     return detections
 
 
 @router.get("/detections/{detection_id}", response_model=schemas.DetectionResponse)
-async def get_detection(
+def get_detection(
     detection_id: int,
     db: Session = Depends(get_db)
 ):
@@ -84,8 +273,111 @@ async def get_detection(
     return detection
 
 
+@router.get("/detections/{detection_id}/explanation", response_model=schemas.ExplanationResponse)
+async def get_detection_explanation(
+    detection_id: int,
+    wait: float = Query(0.0, ge=0.0, le=60.0, description="Seconds to wait for a pending explanation"),
+    db: Session = Depends(get_db)
+):
+    """Get the explanation for a detection, optionally waiting for it to complete."""
+    detection = await run_in_threadpool(detection_service.get_detection, db, detection_id)
+    if not detection:
+        raise HTTPException(status_code=404, detail="Detection not found")
+    
+    future = explanation_worker.get_future(detection_id)
+    if wait > 0 and future is not None:
+        await _wait_for_explanation(future, wait)
+        await run_in_threadpool(db.refresh, detection)
+    
+    return _explanation_response(detection)
+
+
+@router.get("/detections/{detection_id}/explain", response_model=schemas.ExplanationResponse)
+async def explain_detection(
+    detection_id: int,
+    db: Session = Depends(get_db)
+):
+    """Generate any missing explanations for a detection on demand.
+    
+    Explanations already stored on the detection are returned as-is, so
+    repeated calls do not recompute them; methods that failed are retried
+    only after EXPLANATION_RETRY_COOLDOWN.
+    """
+    detection = await run_in_threadpool(detection_service.get_detection, db, detection_id)
+    if not detection:
+        raise HTTPException(status_code=404, detail="Detection not found")
+    
+    future = explanation_worker.get_future(detection_id)
+    if future is None:
+        methods = explanation_worker.missing_methods(detection)
+        if methods:
+            event = await run_in_threadpool(db.get, Event, detection.event_id)
+            future = explanation_worker.submit(
+                detection.id,
+                _event_data(event),
+                detection.features or {},
+                detection.malicious_score,
+                methods=methods,
+                send_alert=False
+            )
+    
+    if future is not None:
+        await _wait_for_explanation(future, settings.on_demand_explanation_timeout)
+        await run_in_threadpool(db.refresh, detection)
+    
+    return _explanation_response(detection)
+
+
+async def _wait_for_explanation(future, timeout: float):
+    """Wait for an explanation job without blocking the event loop or cancelling it."""
+    try:
+        await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+def _explanation_response(detection) -> Dict[str, Any]:
+    """Build the explanation payload, reporting queued jobs as pending."""
+    status = detection.explanation_status
+    future = explanation_worker.get_future(detection.id)
+    if future is not None and not future.done() and status != STATUS_RUNNING:
+        status = STATUS_PENDING
+    
+    return {
+        "detection_id": detection.id,
+        "status": status,
+        "shap_values": detection.shap_values,
+        "lime_explanation": detection.lime_explanation,
+        "openai_explanation": detection.openai_explanation,
+        "error": detection.explanation_error,
+        "explained_at": detection.explained_at
+    }
+
+
+def _event_data(event) -> Dict[str, Any]:
+    """Rebuild submitted event data from a stored Event row."""
+    if event is None:
+        return {}
+    return {
+        'event_id': event.event_id,
+        'timestamp': event.timestamp,
+        'process_name': event.process_name,
+        'command_line': event.command_line,
+        'parent_image': event.parent_image,
+        'user': event.user,
+        'integrity_level': event.integrity_level,
+        'raw_event_data': event.raw_event_data
+    }
+
+
+@router.get("/metrics")
+async def get_metrics() -> Dict[str, Any]:
+    """Runtime counters for the detection pipeline (score cache, micro-batch histograms)."""
+    return detection_service.get_metrics()
+
+
 @router.post("/feedback", response_model=schemas.FeedbackResponse)
-async def submit_feedback(
+def submit_feedback(
     feedback: schemas.FeedbackCreate,
     db: Session = Depends(get_db)
 ):
@@ -94,6 +386,9 @@ async def submit_feedback(
     if not detection:
         raise HTTPException(status_code=404, detail="Detection not found")
     
+    detection_service.stats_rollup.record_feedback(
+        db, detection.is_malicious, detection.analyst_feedback, feedback.feedback
+    )
     detection.analyst_feedback = feedback.feedback
     detection.analyst_notes = feedback.notes
     from datetime import datetime
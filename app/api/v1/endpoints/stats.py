@@ -1,41 +1,23 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
 from app.core.database import get_db
 from app.models import schemas, database
+from app.services.stats_rollup import StatsRollup
 
 router = APIRouter()
+stats_rollup = StatsRollup()
 
 
 @router.get("/stats", response_model=schemas.StatsResponse)
-async def get_stats(db: Session = Depends(get_db)):
+def get_stats(db: Session = Depends(get_db)):
     """Get system statistics."""
-    # Total events
-    total_events = db.query(func.count(database.Event.id)).scalar() or 0
-    
-    # Total detections
-    total_detections = db.query(func.count(database.Detection.id)).scalar() or 0
-    
-    # Malicious detections
-    malicious_detections = db.query(func.count(database.Detection.id)).filter(
-        database.Detection.is_malicious == True
-    ).scalar() or 0
-    
-    # False positives (malicious flagged but feedback says false positive)
-    false_positives = db.query(func.count(database.Detection.id)).filter(
-        and_(
-            database.Detection.is_malicious == True,
-            database.Detection.analyst_feedback == 'false_positive'
-        )
-    ).scalar() or 0
-    
-    # False negatives (not flagged but feedback says false negative)
-    false_negatives = db.query(func.count(database.Detection.id)).filter(
-        and_(
-            database.Detection.is_malicious == False,
-            database.Detection.analyst_feedback == 'false_negative'
-        )
-    ).scalar() or 0
+    # Counters are maintained on insert and feedback, so no table scans here
+    counters = stats_rollup.get(db)
+    total_events = counters['total_events']
+    total_detections = counters['total_detections']
+    malicious_detections = counters['malicious_detections']
+    false_positives = counters['false_positives']
+    false_negatives = counters['false_negatives']
     
     # Detection rate
     detection_rate = (malicious_detections / total_events * 100) if total_events > 0 else 0.0
@@ -43,8 +25,15 @@ async def get_stats(db: Session = Depends(get_db)):
     # False positive rate
     fp_rate = (false_positives / malicious_detections * 100) if malicious_detections > 0 else 0.0
     
-    # Recent detections (last 10)
-    recent_detections = db.query(database.Detection).filter(
+    # Recent detections (last 10), with their process names from one join
+    recent_detections = db.query(
+        database.Detection.id,
+        database.Detection.timestamp,
+        database.Detection.malicious_score,
+        database.Event.process_name
+    ).outerjoin(
+        database.Event, database.Event.id == database.Detection.event_id
+    ).filter(
         database.Detection.is_malicious == True
     ).order_by(database.Detection.timestamp.desc()).limit(10).all()
     
@@ -53,7 +42,7 @@ async def get_stats(db: Session = Depends(get_db)):
             "id": d.id,
             "timestamp": d.timestamp.isoformat(),
             "score": d.malicious_score,
-            "process": db.query(database.Event).filter(database.Event.id == d.event_id).first().process_name if db.query(database.Event).filter(database.Event.id == d.event_id).first() else "N/A"
+            "process": d.process_name or "N/A"
         }
         for d in recent_detections
     ]
@@ -1,10 +1,11 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import detections, stats
+from app.api.v1.endpoints import admin, detections, stats
 
 api_router = APIRouter()
 
 api_router.include_router(detections.router, prefix="/api/v1", tags=["detections"])
 api_router.include_router(stats.router, prefix="/api/v1", tags=["stats"])
+api_router.include_router(admin.router, prefix="/api/v1", tags=["admin"])
 
 
 
@@ -6,10 +6,33 @@ import os
 class Settings(BaseSettings):
     # Database
     database_url: str = "sqlite:///./lolbin_detection.db"
+    # Table layout: "none", or "daily" to range-partition new events and detections
+    # tables by day on created_at (PostgreSQL only; SQLite stays unpartitioned)
+    storage_partitioning: str = "none"
+    partition_days_ahead: int = 7
+    # Retention: remove events and detections created more than RETENTION_DAYS
+    # ago (0 keeps everything). Partitions are dropped, or with "detach" kept
+    # as standalone tables for cold storage; other tables use batched DELETEs
+    retention_days: int = 0
+    retention_mode: str = "drop"
+    retention_interval_minutes: float = 60.0
+    retention_delete_batch_size: int = 5000
+    # Raw EVTX payload in events.raw_event_data: "full", "compressed" (zlib) or "none"
+    raw_event_data_mode: str = "full"
+    # Parquet archive for historical hunts (scripts/archive_detections.py,
+    # scripts/query_archive.py); when enabled, retention archives before removing
+    archive_enabled: bool = False
+    archive_dir: str = "data/archive"
+    archive_batch_size: int = 50000
+    # Only archive detections older than this, so late-committing IDs are not skipped
+    archive_lag_seconds: float = 300.0
     
     # OpenAI
     openai_api_key: Optional[str] = None
     openai_model: str = "gpt-4-turbo-preview"
+    # LLM backend for explanations: "openai" or "stub" (local, deterministic; for testing)
+    llm_backend: str = "openai"
+    llm_stub_latency: float = 0.0
     
     # Alerting
     slack_webhook_url: Optional[str] = None
@@ -27,11 +50,126 @@ class Settings(BaseSettings):
     # Model Paths
     random_forest_model_path: str = "data/models/random_forest_model.pkl"
     lstm_model_path: str = "data/models/lstm_model.pth"
+    # Random Forest inference backend: "sklearn" or "compiled" (flat NumPy tree traversal)
+    rf_inference_backend: str = "sklearn"
+    # LSTM inference backend: "auto" (the module exported next to the checkpoint by
+    # scripts/export_lstm_model.py, int8-quantized before TorchScript, else eager),
+    # "eager", "scripted" or "quantized"
+    lstm_inference_backend: str = "auto"
+    # torch intra-op and inter-op threads per process (0: torch default of one per
+    # core); keep workers x TORCH_NUM_THREADS within the host's cores
+    torch_num_threads: int = 1
+    torch_interop_threads: int = 1
+    # Seconds between checks of the model files for changes to hot reload (0 disables;
+    # POST /api/v1/admin/models/reload reloads on demand)
+    model_watch_interval: float = 0.0
+    # Model memory with several uvicorn workers (--workers / WEB_CONCURRENCY):
+    # "private" loads a copy per worker; "mmap" exports the forest once per
+    # model version to flat arrays under MODEL_MMAP_DIR and memory-maps them
+    # and the LSTM weights, so all workers share one physical copy
+    model_memory_mode: str = "private"
+    model_mmap_dir: str = "data/models/mmap"
+    
+    # Startup: models load and a synthetic event is run through feature
+    # extraction, scoring and the explainers before /ready reports ready
+    # (in the background unless WARMUP_BACKGROUND is off); with REQUIRE_MODELS,
+    # /ready also requires both models to have loaded
+    warmup_enabled: bool = True
+    warmup_background: bool = True
+    require_models: bool = False
+    
+    # Explainability
+    # Fallback background data for models saved without it (.npy, rows in feature order)
+    explainer_background_path: str = "data/models/explainer_background.npy"
+    # Generate explanations in a background worker pool instead of the request
+    async_explanations: bool = True
+    explanation_workers: int = 2
+    # Explanation policy: each method runs automatically at or above its score
+    # threshold, and for a sampled fraction of events below it
+    shap_explanation_threshold: float = 0.5
+    lime_explanation_threshold: float = 0.7
+    llm_explanation_threshold: float = 0.7
+    shap_explanation_sample_rate: float = 0.01
+    lime_explanation_sample_rate: float = 0.0
+    llm_explanation_sample_rate: float = 0.0
+    # Seconds GET /detections/{id}/explain waits for on-demand explanations
+    on_demand_explanation_timeout: float = 30.0
+    # Seconds before an explanation method that failed is tried again
+    explanation_retry_cooldown: float = 300.0
+    
+    # Batch Ingestion
+    max_batch_size: int = 1000
+    # Largest batch body accepted after gzip decompression
+    max_batch_bytes: int = 64 * 1024 * 1024
+    
+    # Event collector: events are posted to /events/batch gzip-compressed in
+    # batches of up to COLLECTOR_BATCH_MAX_EVENTS events / _MAX_BYTES bytes,
+    # or whatever has accumulated after COLLECTOR_BATCH_MAX_WAIT seconds
+    collector_batch_max_events: int = 500
+    collector_batch_max_bytes: int = 1024 * 1024
+    collector_batch_max_wait: float = 2.0
+    collector_timeout: float = 30.0
+    # Retries with exponential backoff for connection errors, 429 and 5xx
+    collector_max_retries: int = 5
+    collector_backoff_base: float = 0.5
+    collector_backoff_max: float = 30.0
+    collector_stats_interval: float = 30.0
+    # Collector spool (one directory per collector): events are written to
+    # disk before they are sent and EVTX read positions are checkpointed
+    # there, so restarts resume without loss; reading pauses while the spool
+    # holds COLLECTOR_SPOOL_MAX_BYTES
+    collector_spool_dir: str = "data/collector_spool"
+    collector_spool_segment_bytes: int = 16 * 1024 * 1024
+    collector_spool_max_bytes: int = 1024 * 1024 * 1024
+    collector_spool_fsync: bool = False
+    
+    # Micro-batching: concurrent single-event requests share one model call
+    micro_batching_enabled: bool = False
+    micro_batch_max_size: int = 64
+    micro_batch_max_wait_ms: float = 2.0
+    
+    # LSTM sequence scoring: score each event after the recent events of its
+    # lineage (host and parent image, or host only with LSTM_SEQUENCE_KEY=host),
+    # carrying the LSTM state so each event costs one step; the context is
+    # LSTM_SEQUENCE_LENGTH to twice that many events. Lineages idle for
+    # LSTM_SEQUENCE_IDLE_SECONDS, or least recently seen beyond
+    # LSTM_SEQUENCE_MAX_KEYS, are dropped. Off by default, scoring each event alone
+    lstm_sequence_enabled: bool = False
+    lstm_sequence_length: int = 8
+    lstm_sequence_key: str = "host_parent"
+    lstm_sequence_max_keys: int = 10000
+    lstm_sequence_idle_seconds: float = 1800.0
+    
+    # Group commit: bulk insert scored events from all requests every
+    # GROUP_COMMIT_FLUSH_ROWS rows or GROUP_COMMIT_FLUSH_INTERVAL_MS; each
+    # request still waits for the commit that stores its rows
+    group_commit_enabled: bool = False
+    group_commit_flush_rows: int = 500
+    group_commit_flush_interval_ms: float = 20.0
+    group_commit_max_pending: int = 10000
+    group_commit_enqueue_timeout: float = 5.0
+    # Crash-recovery spool and per-append fsync; each worker process locks its
+    # own slot: this path, then group_commit.1.jsonl, group_commit.2.jsonl, ...
+    group_commit_spool_path: str = "data/spool/group_commit.jsonl"
+    group_commit_spool_fsync: bool = False
+    # The spool is rewritten without its committed rows once they take this many bytes
+    group_commit_spool_compact_bytes: int = 16 * 1024 * 1024
+    
+    # Score Cache (repeated events reuse features, scores and explanations)
+    score_cache_enabled: bool = True
+    score_cache_max_entries: int = 10000
+    score_cache_ttl_seconds: float = 3600.0
     
     # API
     api_host: str = "0.0.0.0"
     api_port: int = 8000
     api_reload: bool = True
+    # Threads available to sync request handlers (database, model and explainer work)
+    request_threads: int = 40
+    # Token required in the X-Admin-Token header by /api/v1/admin endpoints (empty: endpoints disabled)
+    admin_token: str = ""
+    # Threads delivering Slack/email alerts off the request path
+    alert_workers: int = 2
     
     # Logging
     log_level: str = "INFO"
@@ -0,0 +1,61 @@
+from pathlib import Path
+from typing import Dict, Any, Iterable, List, Optional
+import os
+
+# /proc/<pid>/smaps fields summed into the report (values are in kB)
+SMAPS_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty', 'Swap')
+
+
+def process_memory(pid: Optional[int] = None, mapped_paths: Iterable[str] = ()) -> Dict[str, Any]:
+    """Memory use of a process (default: this one) from /proc/<pid>/smaps; Linux only.
+    
+    RSS counts every resident page, including pages shared with other
+    processes; PSS divides shared pages between the processes mapping them,
+    so PSS summed over workers is their real footprint. model_rss_bytes and
+    model_pss_bytes cover the file mappings under mapped_paths (files or
+    directories), such as memory-mapped model arrays.
+    """
+    pid = pid or os.getpid()
+    prefixes = [str(Path(path).resolve()) for path in mapped_paths]
+    totals = dict.fromkeys(SMAPS_FIELDS, 0)
+    model = {'Rss': 0, 'Pss': 0}
+    in_model_mapping = False
+    
+    with open(f"/proc/{pid}/smaps") as f:
+        for line in f:
+            field, _, value = line.partition(':')
+            if field in totals:
+                kilobytes = int(value.split()[0])
+                totals[field] += kilobytes
+                if in_model_mapping and field in model:
+                    model[field] += kilobytes
+            elif ' ' in field:
+                # Mapping header: address perms offset dev inode [path]
+                parts = line.split(None, 5)
+                path = parts[5].strip() if len(parts) == 6 else ''
+                in_model_mapping = any(path == prefix or path.startswith(prefix + os.sep) for prefix in prefixes)
+    
+    return {
+        'pid': pid,
+        'rss_bytes': totals['Rss'] * 1024,
+        'pss_bytes': totals['Pss'] * 1024,
+        'shared_bytes': (totals['Shared_Clean'] + totals['Shared_Dirty']) * 1024,
+        'private_bytes': (totals['Private_Clean'] + totals['Private_Dirty']) * 1024,
+        'swap_bytes': totals['Swap'] * 1024,
+        'model_rss_bytes': model['Rss'] * 1024,
+        'model_pss_bytes': model['Pss'] * 1024
+    }
+
+
+def child_pids(pid: int) -> List[int]:
+    """Direct children of a process, e.g. the workers of a uvicorn master."""
+    children = []
+    for stat_path in Path('/proc').glob('[0-9]*/stat'):
+        try:
+            # The command name in parentheses can contain spaces; fields after it are fixed
+            fields = stat_path.read_text().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(stat_path.parent.name))
+    return sorted(children)
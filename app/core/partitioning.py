@@ -0,0 +1,139 @@
+from datetime import date, datetime, timedelta
+from typing import List, Tuple
+from sqlalchemy import Column, Index, MetaData, Table, inspect, text
+from sqlalchemy.engine import Engine
+from app.core.config import settings
+from app.core.database import Base
+import app.models.database  # noqa: F401 - registers the tables on Base.metadata
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tables range-partitioned by day, and the column they are partitioned on
+PARTITIONED_TABLES = ('events', 'detections')
+PARTITION_COLUMN = 'created_at'
+
+
+def partitioning_enabled(bind: Engine) -> bool:
+    """Whether daily partitions are configured and supported by this database."""
+    if settings.storage_partitioning == 'none':
+        return False
+    if settings.storage_partitioning != 'daily':
+        raise ValueError(f"Unknown storage_partitioning: {settings.storage_partitioning}")
+    return bind.dialect.name == 'postgresql'
+
+
+def create_partitioned_tables(bind: Engine):
+    """Create events and detections as daily range-partitioned tables, if they do not exist yet.
+    
+    Run before Base.metadata.create_all, which then skips them. Existing
+    unpartitioned tables are left alone and have to be migrated by hand.
+    The partition key must be part of the primary key, so the tables use
+    (id, created_at), and detections.event_id cannot be a database-level
+    foreign key; the ORM relationship still joins on it.
+    """
+    if not partitioning_enabled(bind):
+        if settings.storage_partitioning != 'none':
+            logger.warning(f"storage_partitioning=daily needs PostgreSQL; {bind.dialect.name} tables stay unpartitioned")
+        return
+    
+    inspector = inspect(bind)
+    metadata = MetaData()
+    for name in PARTITIONED_TABLES:
+        if inspector.has_table(name):
+            if not is_partitioned(bind, name):
+                logger.warning(f"Table {name} exists and is not partitioned; migrate it to use daily partitions")
+            continue
+        _partitioned_copy(Base.metadata.tables[name], metadata)
+    
+    if metadata.tables:
+        metadata.create_all(bind=bind)
+        with bind.begin() as conn:
+            for name in metadata.tables:
+                # Catches rows outside the created ranges, e.g. from clock skew
+                conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name}_default PARTITION OF {name} DEFAULT"))
+        logger.info(f"Created daily partitioned tables: {', '.join(metadata.tables)}")
+    
+    ensure_partitions(bind)
+
+
+def ensure_partitions(bind: Engine, days_ahead: int = None) -> List[str]:
+    """Create the partitions for today and the next days_ahead days; returns the ones created."""
+    if not partitioning_enabled(bind):
+        return []
+    
+    days_ahead = settings.partition_days_ahead if days_ahead is None else days_ahead
+    created = []
+    for name in PARTITIONED_TABLES:
+        if not is_partitioned(bind, name):
+            continue
+        existing = {partition for partition, _ in list_partitions(bind, name)}
+        for offset in range(days_ahead + 1):
+            day = date.today() + timedelta(days=offset)
+            partition = partition_name(name, day)
+            if partition in existing:
+                continue
+            try:
+                with bind.begin() as conn:
+                    conn.execute(text(
+                        f"CREATE TABLE {partition} PARTITION OF {name} "
+                        f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+                    ))
+                created.append(partition)
+            except Exception as e:
+                # Fails if the default partition already holds rows for that day
+                logger.error(f"Could not create partition {partition}: {e}")
+    
+    if created:
+        logger.info(f"Created partitions: {', '.join(created)}")
+    return created
+
+
+def list_partitions(bind: Engine, table: str) -> List[Tuple[str, date]]:
+    """Daily partitions of a table with the day each one holds, oldest first."""
+    with bind.connect() as conn:
+        names = conn.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+            "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+            "WHERE parent.relname = :table"
+        ), {'table': table}).scalars().all()
+    
+    partitions = []
+    prefix = f"{table}_p"
+    for name in names:
+        if name.startswith(prefix):
+            partitions.append((name, datetime.strptime(name[len(prefix):], '%Y%m%d').date()))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def is_partitioned(bind: Engine, table: str) -> bool:
+    """Whether a table exists as a partitioned table."""
+    with bind.connect() as conn:
+        return bool(conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table JOIN pg_class ON pg_partitioned_table.partrelid = pg_class.oid "
+            "WHERE pg_class.relname = :table"
+        ), {'table': table}).first())
+
+
+def partition_name(table: str, day: date) -> str:
+    """Name of the partition holding one day of a table."""
+    return f"{table}_p{day.strftime('%Y%m%d')}"
+
+
+def _partitioned_copy(table: Table, metadata: MetaData) -> Table:
+    """Copy of a model table, partitioned by day, with (id, created_at) as primary key and no foreign keys."""
+    columns = [
+        Column(
+            column.name,
+            column.type,
+            primary_key=column.name in ('id', PARTITION_COLUMN),
+            autoincrement=column.name == 'id',
+            nullable=column.nullable and column.name != PARTITION_COLUMN
+        )
+        for column in table.columns
+    ]
+    copy = Table(table.name, metadata, *columns, postgresql_partition_by=f"RANGE ({PARTITION_COLUMN})")
+    for index in table.indexes:
+        Index(index.name, *[copy.c[column.name] for column in index.columns])
+    return copy
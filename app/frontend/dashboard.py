@@ -25,9 +25,9 @@ REFRESH_INTERVAL = 30  # seconds
 
 
 def get_detections(malicious_only: bool = False, limit: int = 100) -> List[Dict]:
-    """Fetch detections from API."""
+    """Fetch detection summaries (scores and process name, no explanations) from API."""
     try:
-        params = {"malicious_only": malicious_only, "limit": limit}
+        params = {"malicious_only": malicious_only, "limit": limit, "view": "summary"}
         response = requests.get(f"{API_BASE}/detections", params=params, timeout=10)
         response.raise_for_status()
         return response.json()
@@ -195,7 +195,7 @@ def render_dashboard():
         table_data.append({
             "ID": d.get('id'),
             "Timestamp": d.get('timestamp', '')[:19] if d.get('timestamp') else '',
-            "Process": d.get('event', {}).get('process_name', 'N/A') if d.get('event') else 'N/A',
+            "Process": d.get('process_name') or 'N/A',
             "Score": f"{d.get('malicious_score', 0):.4f}",
             "RF Score": f"{d.get('random_forest_score', 0):.4f}",
             "LSTM Score": f"{d.get('lstm_score', 0):.4f}",
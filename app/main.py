@@ -1,18 +1,26 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+import anyio.to_thread
+import time
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from app.api.v1.routes import api_router
-from app.core.database import engine, Base
+from app.api.v1.endpoints.detections import detection_service, explainability_service
+from app.core.database import engine, Base, SessionLocal, create_indexes
 from app.core.config import settings
+from app.core.partitioning import create_partitioned_tables, partitioning_enabled
+from app.services.stats_rollup import StatsRollup
+from app.services.retention import RetentionService
+from app.services.model_registry import get_model_registry
+from app.services.warmup import WarmupService
 import logging
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
 # Configure logging
 logging.basicConfig(
     level=getattr(logging, settings.log_level),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="LOLBin Detection System API",
@@ -27,12 +35,88 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include API routes
 app.include_router(api_router)
 
 
+@app.on_event("startup")
+async def configure_threadpool():
+    """Bound the threadpool that runs sync handlers and blocking calls."""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.request_threads
+
+
+@app.on_event("startup")
+def initialize_database():
+    """Create database tables (partitioned ones first, if configured) and any indexes added to existing tables."""
+    attempts = 5
+    for attempt in range(1, attempts + 1):
+        try:
+            create_partitioned_tables(engine)
+            Base.metadata.create_all(bind=engine)
+            create_indexes()
+            return
+        except SQLAlchemyError as e:
+            # Workers starting together race to create the tables, each pass finds more of them created
+            if attempt == attempts:
+                raise
+            logger.info(f"Database tables were created concurrently, checking again: {e.__class__.__name__}")
+            time.sleep(0.1 * attempt)
+
+
+@app.on_event("startup")
+def initialize_stats_rollup():
+    """Count existing rows once so /stats can be served from the rollup rows."""
+    db = SessionLocal()
+    try:
+        StatsRollup().ensure(db)
+        db.commit()
+    except IntegrityError:
+        # Another worker inserted the rollup rows first
+        db.rollback()
+    finally:
+        db.close()
+
+
+retention_service = RetentionService()
+
+
+@app.on_event("startup")
+def start_retention():
+    """Keep daily partitions ahead and expire old data in the background, if configured."""
+    if settings.retention_days > 0 or partitioning_enabled(engine):
+        retention_service.start()
+
+
+@app.on_event("shutdown")
+def stop_retention():
+    """Let a running retention pass finish."""
+    retention_service.shutdown()
+
+
+@app.on_event("startup")
+def start_model_watcher():
+    """Hot reload models when their files change, if MODEL_WATCH_INTERVAL is set."""
+    get_model_registry().start_watching()
+
+
+@app.on_event("shutdown")
+def stop_model_watcher():
+    """Stop checking the model files."""
+    get_model_registry().shutdown()
+
+
+warmup_service = WarmupService(detection_service, explainability_service)
+
+
+@app.on_event("startup")
+def start_warmup():
+    """Load the models and warm up the pipeline, in the background unless WARMUP_BACKGROUND is off."""
+    warmup_service.start()
+
+
 @app.get("/")
 async def root():
     """Root endpoint."""
@@ -45,10 +129,17 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """Liveness: the process is up and serving requests."""
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: the database is reachable and the models are loaded and warmed up."""
+    status = warmup_service.status()
+    return JSONResponse(status_code=200 if status['ready'] else 503, content=status)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,175 @@
+import re
+from bisect import bisect_right
+from typing import Any, Dict, List, Tuple
+
+
+class CommandLineScanner:
+    """Computes all command-line indicator features in a single regex pass.
+    
+    Every indicator pattern used by FeatureExtractor is a set of alternatives,
+    each a sequence of literal keywords that must appear in order on the same
+    line (the regex `a.*b` form). One trie-factored regex walks the command
+    line once, recording every keyword occurrence (and any IP address); the
+    indicators are then evaluated from the recorded positions.
+    
+    Input is expected lowercased, as FeatureExtractor does before scanning.
+    """
+    
+    # The only lowercase characters that IGNORECASE matching equates with ASCII
+    # keyword characters; folding them allows plain case-sensitive matching.
+    CASE_FOLDS = str.maketrans({'\u0131': 'i', '\u017f': 's'})
+    
+    # One entry per FeatureExtractor.SUSPICIOUS_PATTERNS pattern, in the same order
+    SUSPICIOUS_RULES = [
+        [('-enc',), ('-e ',), ('-encodedcommand',)],
+        [('base64',)],
+        [('bypass',), ('hidden',), ('noprofile',)],
+        [('iex',), ('invoke-expression',)],
+        [('downloadstring',), ('downloadfile',)],
+        [('frombase64string',)],
+        [('new-object', 'net.webclient')],
+        [('wmi', 'process', 'create')],
+        [('reg', 'add', 'run')],
+        [('schtasks', 'create', '*')],
+        [('certutil', '-urlcache')],
+        [('bitsadmin', 'transfer')]
+    ]
+    
+    INDICATOR_RULES = {
+        'has_encoded_command': [('-enc',), ('-e ',), ('-encodedcommand',), ('base64',)],
+        'has_network_activity': [
+            ('http://',), ('https://',), ('ftp://',),
+            ('net.webclient',), ('downloadstring',), ('downloadfile',),
+            ('wget',), ('curl',), ('invoke-webrequest',),
+            ('bitsadmin',), ('certutil', 'urlcache')
+        ],
+        'has_file_operation': [
+            ('copy',), ('move',), ('del',), ('rmdir',), ('mkdir',),
+            ('type',), ('cat',), ('more',), ('less',),
+            ('out-file',), ('set-content',), ('add-content',)
+        ],
+        'has_registry_operation': [('reg', 'add'), ('reg', 'delete'), ('reg', 'query')],
+        'has_process_creation': [
+            ('start-process',), ('start',), ('invoke-item',),
+            ('wmi', 'process', 'create'),
+            ('cmd', '/c'), ('powershell', '-command')
+        ],
+        'has_url': [('http://',), ('https://',), ('ftp://',)]
+    }
+    
+    IP_PATTERN = r'\b(?:\d{1,3}\.){3}\d{1,3}\b'
+    
+    def __init__(self):
+        rules = [alternative for rule in self.SUSPICIOUS_RULES for alternative in rule]
+        rules += [alternative for rule in self.INDICATOR_RULES.values() for alternative in rule]
+        keywords = sorted({keyword for alternative in rules for keyword in alternative})
+        
+        # The trie form matches the longest keyword starting at each position; shorter
+        # keywords that are prefixes of it are implied at the same position. No keyword
+        # starts with a digit or dot, so consuming an IP address cannot hide one.
+        self.pattern = re.compile(f'(?P<keyword>{self._trie_pattern(keywords)})|(?P<ip>{self.IP_PATTERN})')
+        self.implied_keywords = {
+            keyword: [other for other in keywords if keyword.startswith(other)]
+            for keyword in keywords
+        }
+        self.suspicious_rules = [self._split_rule(rule) for rule in self.SUSPICIOUS_RULES]
+        self.indicator_rules = {name: self._split_rule(rule) for name, rule in self.INDICATOR_RULES.items()}
+    
+    def scan(self, command_line: str) -> Dict[str, float]:
+        """Return suspicious_pattern_count and every boolean indicator for a command line."""
+        hits, has_ip = self._find_keywords(command_line.translate(self.CASE_FOLDS))
+        
+        features = {
+            'suspicious_pattern_count': float(sum(
+                1 for rule in self.suspicious_rules if self._rule_matches(rule, hits)
+            ))
+        }
+        for name, rule in self.indicator_rules.items():
+            features[name] = 1.0 if self._rule_matches(rule, hits) else 0.0
+        features['has_ip_address'] = 1.0 if has_ip else 0.0
+        
+        return features
+    
+    def _find_keywords(self, text: str) -> Tuple[Dict[str, List[Tuple[int, int]]], bool]:
+        """Map each keyword to its (line, start) occurrences in order, and report IP presence."""
+        newlines = [i for i, char in enumerate(text) if char == '\n'] if '\n' in text else None
+        hits: Dict[str, List[Tuple[int, int]]] = {}
+        has_ip = False
+        
+        position = 0
+        match = self.pattern.search(text, position)
+        while match is not None:
+            if match.lastgroup == 'ip':
+                has_ip = True
+                position = match.end()
+            else:
+                start = match.start()
+                line = bisect_right(newlines, start) if newlines else 0
+                for keyword in self.implied_keywords[match.group('keyword')]:
+                    hits.setdefault(keyword, []).append((line, start))
+                # Resume one character later so overlapping keywords are still found
+                position = start + 1
+            match = self.pattern.search(text, position)
+        
+        return hits, has_ip
+    
+    @classmethod
+    def _trie_pattern(cls, keywords: List[str]) -> str:
+        """Build a regex that factors shared prefixes, e.g. `start(?:-process)?`."""
+        trie: Dict[str, Any] = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        return cls._trie_node_pattern(trie)
+    
+    @classmethod
+    def _trie_node_pattern(cls, node: Dict[str, Any]) -> str:
+        """Regex for one trie node; optional children make the match greedy (longest keyword)."""
+        branches = [re.escape(char) + cls._trie_node_pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            pattern = f'(?:{pattern})?'
+        return pattern
+    
+    def _split_rule(self, rule: List[Tuple[str, ...]]) -> Tuple[frozenset, List[Tuple[str, ...]]]:
+        """Separate single-keyword alternatives (a set lookup) from ordered keyword sequences."""
+        singles = frozenset(keywords[0] for keywords in rule if len(keywords) == 1)
+        sequences = [keywords for keywords in rule if len(keywords) > 1]
+        return singles, sequences
+    
+    def _rule_matches(self, rule: Tuple[frozenset, List[Tuple[str, ...]]], hits: Dict[str, List[Tuple[int, int]]]) -> bool:
+        """True if any alternative's keywords occur in order on one line."""
+        singles, sequences = rule
+        if not singles.isdisjoint(hits):
+            return True
+        for keywords in sequences:
+            if all(keyword in hits for keyword in keywords) and self._sequence_found(keywords, hits):
+                return True
+        return False
+    
+    def _sequence_found(self, keywords: Tuple[str, ...], hits: Dict[str, List[Tuple[int, int]]]) -> bool:
+        """Greedy earliest-match check for the `k1.*k2.*k3` form (`.` does not cross newlines)."""
+        seen_lines = set()
+        for line, start in hits[keywords[0]]:
+            if line in seen_lines:
+                continue
+            seen_lines.add(line)
+            
+            end = start + len(keywords[0])
+            for keyword in keywords[1:]:
+                next_start = next(
+                    (s for l, s in hits[keyword] if l == line and s >= end),
+                    None
+                )
+                if next_start is None:
+                    break
+                end = next_start + len(keyword)
+            else:
+                return True
+        
+        return False
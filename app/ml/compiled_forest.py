@@ -0,0 +1,154 @@
+import json
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict
+
+
+class CompiledForest:
+    """Random Forest flattened into NumPy arrays for low-overhead inference.
+    
+    All trees are concatenated into flat node arrays (feature, threshold,
+    children, leaf class probabilities). Scoring walks every tree for every
+    row at once with vectorized indexing, one step per tree level, avoiding
+    sklearn's per-call validation and joblib thread dispatch.
+    
+    The arrays can be saved as .npy files and loaded memory-mapped, so
+    processes scoring with the same forest share one copy in the page cache.
+    The per-node training sample weights (cover) are kept too, so SHAP can
+    explain the forest from these arrays without the sklearn model.
+    """
+    
+    ARRAYS = ('feature', 'threshold', 'children_left', 'children_right', 'value', 'roots', 'classes')
+    # Saved when present; not needed for scoring
+    OPTIONAL_ARRAYS = ('cover',)
+    
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        children_left: np.ndarray,
+        children_right: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        classes: np.ndarray,
+        cover: np.ndarray = None
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes = classes
+        self.cover = cover
+    
+    @classmethod
+    def from_sklearn(cls, model: Any) -> "CompiledForest":
+        """Export a fitted sklearn RandomForestClassifier into flat arrays."""
+        features, thresholds, lefts, rights, values, roots, covers = [], [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            
+            # Leaves point to themselves so extra traversal steps are no-ops
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            
+            # Normalize per-node class weights into probabilities, as tree.predict_proba does
+            node_values = tree.value[:, 0, :].astype(np.float64)
+            totals = node_values.sum(axis=1, keepdims=True)
+            totals[totals == 0] = 1.0
+            values.append(node_values / totals)
+            covers.append(tree.weighted_n_node_samples)
+            
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+        
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children_left=np.concatenate(lefts).astype(np.intp),
+            children_right=np.concatenate(rights).astype(np.intp),
+            value=np.concatenate(values),
+            roots=np.array(roots, dtype=np.intp),
+            max_depth=max_depth,
+            classes=np.asarray(model.classes_),
+            cover=np.concatenate(covers).astype(np.float64)
+        )
+    
+    def save(self, directory: str):
+        """Write the arrays as .npy files, plus forest.json, into an existing directory."""
+        directory = Path(directory)
+        for name in self.ARRAYS + self.OPTIONAL_ARRAYS:
+            if getattr(self, name) is not None:
+                np.save(directory / f"{name}.npy", getattr(self, name))
+        (directory / 'forest.json').write_text(json.dumps({'max_depth': int(self.max_depth)}))
+    
+    @classmethod
+    def load(cls, directory: str, mmap_mode: str = None) -> "CompiledForest":
+        """Load arrays written by save; with mmap_mode='r' they are mapped read-only instead of read."""
+        directory = Path(directory)
+        # np.asarray drops the memmap subclass but keeps the mapped buffer
+        arrays = {name: np.asarray(np.load(directory / f"{name}.npy", mmap_mode=mmap_mode)) for name in cls.ARRAYS}
+        for name in cls.OPTIONAL_ARRAYS:
+            if (directory / f"{name}.npy").exists():
+                arrays[name] = np.asarray(np.load(directory / f"{name}.npy", mmap_mode=mmap_mode))
+        max_depth = json.loads((directory / 'forest.json').read_text())['max_depth']
+        return cls(max_depth=max_depth, **arrays)
+    
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Class probabilities averaged over trees, matching RandomForestClassifier.predict_proba."""
+        # sklearn evaluates trees on float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.repeat(self.roots[None, :], X.shape[0], axis=0)
+        
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.children_left[nodes], self.children_right[nodes])
+        
+        return self.value[nodes].mean(axis=1)
+    
+    def to_shap_model(self) -> Dict[str, Any]:
+        """The forest in shap.TreeExplainer's dictionary model format; needs cover."""
+        if self.cover is None:
+            raise ValueError("Forest was compiled without node cover, which SHAP needs")
+        
+        trees = []
+        ends = list(self.roots[1:]) + [len(self.feature)]
+        for root, end in zip(self.roots, ends):
+            node_ids = np.arange(end - root)
+            # Leaves point to themselves here; shap expects -1 children and -2 features, as in sklearn
+            is_leaf = self.children_left[root:end] - root == node_ids
+            trees.append({
+                'children_left': np.where(is_leaf, -1, self.children_left[root:end] - root),
+                'children_right': np.where(is_leaf, -1, self.children_right[root:end] - root),
+                'children_default': np.where(is_leaf, -1, self.children_left[root:end] - root),
+                'features': np.where(is_leaf, -2, self.feature[root:end]),
+                'thresholds': np.asarray(self.threshold[root:end]),
+                # Trees output class probabilities, averaged over the forest
+                'values': self.value[root:end] / self.n_trees,
+                'node_sample_weight': np.asarray(self.cover[root:end])
+            })
+        return {
+            'trees': trees,
+            'input_dtype': np.float32,
+            'internal_dtype': np.float64,
+            'tree_output': 'probability'
+        }
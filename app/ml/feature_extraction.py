@@ -1,11 +1,37 @@
 import re
 import math
-from typing import Dict, Any, List
+from typing import TYPE_CHECKING, Dict, Any, List, Tuple
 import numpy as np
+from app.ml.command_scanner import CommandLineScanner
+
+if TYPE_CHECKING:
+    # pandas is only needed for batch extraction, imported there
+    import pandas as pd
+
+_COMPUTER_PATTERN = re.compile(r'<Computer>([^<]+)</Computer>')
+
+
+def event_host(raw_event_data: Any) -> str:
+    """Host an event came from: the EVTX <Computer> element or a host/computer key, else "unknown"."""
+    if isinstance(raw_event_data, dict):
+        for key in ('host', 'computer', 'Computer', 'hostname'):
+            if raw_event_data.get(key):
+                return str(raw_event_data[key])
+        raw_event_data = raw_event_data.get('xml')
+    if isinstance(raw_event_data, str):
+        match = _COMPUTER_PATTERN.search(raw_event_data)
+        if match:
+            return match.group(1).strip()
+    return 'unknown'
 
 
 class FeatureExtractor:
-    """Extracts features from Windows event data for ML model inference."""
+    """Extracts features from Windows event data for ML model inference.
+    
+    Command-line indicators are computed in one pass by CommandLineScanner. The
+    per-feature regex helpers below are the reference implementation it is
+    verified against (scripts/verify_feature_scanner.py).
+    """
     
     # Common LOLBin process names
     LOLBIN_PROCESSES = {
@@ -31,14 +57,22 @@ class FeatureExtractor:
         r'bitsadmin.*transfer'
     ]
     
+    RARE_CHARACTERS = frozenset('~`!@#$%^&*()_+-=[]{}|;:,.<>?')
+    SPECIAL_CHARACTERS = frozenset('!@#$%^&*()_+-=[]{}|;:,.<>?/~`')
+    
+    # Event columns used by extract_batch; missing columns are treated as empty
+    BATCH_COLUMNS = ['command_line', 'process_name', 'parent_image', 'user', 'integrity_level']
+    
     def __init__(self):
         self.patterns = [re.compile(pattern, re.IGNORECASE) for pattern in self.SUSPICIOUS_PATTERNS]
+        self.scanner = CommandLineScanner()
+        self._feature_names = None
     
     def extract_features(self, event_data: Dict[str, Any]) -> Dict[str, float]:
         """Extract feature vector from event data."""
-        command_line = event_data.get('command_line', '').lower()
-        process_name = event_data.get('process_name', '').lower()
-        parent_image = event_data.get('parent_image', '').lower()
+        command_line = (event_data.get('command_line') or '').lower()
+        process_name = (event_data.get('process_name') or '').lower()
+        parent_image = (event_data.get('parent_image') or '').lower()
         
         features = {}
         
@@ -54,13 +88,14 @@ class FeatureExtractor:
         features['is_wmic'] = 1.0 if 'wmic' in process_name else 0.0
         features['is_scripting'] = 1.0 if any(x in process_name for x in ['cscript', 'wscript', 'mshta']) else 0.0
         
-        # Command line features
-        features['suspicious_pattern_count'] = self._count_suspicious_patterns(command_line)
-        features['has_encoded_command'] = 1.0 if self._has_encoded_command(command_line) else 0.0
-        features['has_network_activity'] = 1.0 if self._has_network_activity(command_line) else 0.0
-        features['has_file_operation'] = 1.0 if self._has_file_operation(command_line) else 0.0
-        features['has_registry_operation'] = 1.0 if self._has_registry_operation(command_line) else 0.0
-        features['has_process_creation'] = 1.0 if self._has_process_creation(command_line) else 0.0
+        # Command line features (single scan for all pattern-based indicators)
+        indicators = self.scanner.scan(command_line)
+        features['suspicious_pattern_count'] = indicators['suspicious_pattern_count']
+        features['has_encoded_command'] = indicators['has_encoded_command']
+        features['has_network_activity'] = indicators['has_network_activity']
+        features['has_file_operation'] = indicators['has_file_operation']
+        features['has_registry_operation'] = indicators['has_registry_operation']
+        features['has_process_creation'] = indicators['has_process_creation']
         
         # Entropy features
         features['command_line_entropy'] = self._calculate_entropy(command_line)
@@ -73,8 +108,8 @@ class FeatureExtractor:
         features['special_char_ratio'] = self._calculate_special_char_ratio(command_line)
         
         # URL and IP features
-        features['has_url'] = 1.0 if self._has_url(command_line) else 0.0
-        features['has_ip_address'] = 1.0 if self._has_ip_address(command_line) else 0.0
+        features['has_url'] = indicators['has_url']
+        features['has_ip_address'] = indicators['has_ip_address']
         
         # Parent process features
         features['parent_is_explorer'] = 1.0 if 'explorer' in parent_image else 0.0
@@ -83,8 +118,8 @@ class FeatureExtractor:
         features['parent_is_lolbin'] = 1.0 if parent_image and any(x in parent_image for x in self.LOLBIN_PROCESSES) else 0.0
         
         # User and integrity features
-        user = event_data.get('user', '').lower()
-        integrity_level = event_data.get('integrity_level', '').lower()
+        user = (event_data.get('user') or '').lower()
+        integrity_level = (event_data.get('integrity_level') or '').lower()
         features['is_system_user'] = 1.0 if 'system' in user or 'nt authority' in user else 0.0
         features['is_high_integrity'] = 1.0 if 'high' in integrity_level else 0.0
         features['is_medium_integrity'] = 1.0 if 'medium' in integrity_level else 0.0
@@ -168,8 +203,7 @@ class FeatureExtractor:
     
     def _count_rare_characters(self, text: str) -> float:
         """Count rare/uncommon characters."""
-        rare_chars = set('~`!@#$%^&*()_+-=[]{}|;:,.<>?')
-        count = sum(1 for char in text if char in rare_chars)
+        count = sum(1 for char in text if char in self.RARE_CHARACTERS)
         return float(count)
     
     def _calculate_digit_ratio(self, text: str) -> float:
@@ -191,8 +225,7 @@ class FeatureExtractor:
         """Calculate ratio of special characters to total characters."""
         if not text:
             return 0.0
-        special_chars = set('!@#$%^&*()_+-=[]{}|;:,.<>?/~`')
-        special_count = sum(1 for char in text if char in special_chars)
+        special_count = sum(1 for char in text if char in self.SPECIAL_CHARACTERS)
         return special_count / len(text)
     
     def _has_url(self, text: str) -> bool:
@@ -222,18 +255,167 @@ class FeatureExtractor:
     
     def get_feature_names(self) -> List[str]:
         """Get list of feature names in order."""
-        # Create a dummy event to extract feature names
-        dummy_event = {
-            'command_line': '',
-            'process_name': '',
-            'parent_image': '',
-            'user': '',
-            'integrity_level': '',
-            'timestamp': None
+        if self._feature_names is None:
+            # Create a dummy event to extract feature names
+            dummy_event = {
+                'command_line': '',
+                'process_name': '',
+                'parent_image': '',
+                'user': '',
+                'integrity_level': '',
+                'timestamp': None
+            }
+            features = self.extract_features(dummy_event)
+            self._feature_names = list(features.keys())
+        return list(self._feature_names)
+    
+    def to_vector(self, features: Dict[str, float], feature_names: List[str]) -> np.ndarray:
+        """Order an extracted feature dict into a vector matching feature_names."""
+        return np.array([features.get(name, 0.0) for name in feature_names], dtype=np.float32)
+    
+    def build_matrix(self, feature_dicts: List[Dict[str, float]], feature_names: List[str]) -> np.ndarray:
+        """Stack extracted feature dicts into a matrix ordered by feature_names."""
+        matrix = np.zeros((len(feature_dicts), len(feature_names)), dtype=np.float32)
+        for i, features in enumerate(feature_dicts):
+            matrix[i] = self.to_vector(features, feature_names)
+        return matrix
+    
+    def extract_batch(self, df: "pd.DataFrame") -> np.ndarray:
+        """Extract the feature matrix for a DataFrame of events, in get_feature_names() order.
+        
+        Produces the same values as extract_features row by row. Every column is
+        lowercased and featurized once per distinct value (training data is
+        heavily duplicated) and the results are broadcast back to the rows:
+        command lines with NumPy reductions over a flat code point array,
+        process, parent, user and integrity values with string ops over the
+        distinct values. Missing values are treated as empty strings.
+        """
+        import pandas as pd
+        
+        def distinct_lowered(name: str) -> Tuple[np.ndarray, List[str]]:
+            """Row codes into the column's distinct values, lowercased."""
+            if name not in df.columns:
+                return np.zeros(len(df), dtype=np.intp), ['']
+            codes, distinct = pd.factorize(df[name].fillna('').astype(str), sort=False)
+            # Python's str.lower as in extract_features; .str.lower maps e.g. 'İ' differently
+            return codes, [value.lower() for value in distinct]
+        
+        columns = {name: distinct_lowered(name) for name in self.BATCH_COLUMNS}
+        
+        # Per-command-line features, computed on distinct values and broadcast back
+        codes, command_lines = columns['command_line']
+        command_features = self._command_line_batch(command_lines)
+        features = {name: values[codes] for name, values in command_features.items()}
+        
+        def per_row(column: str, predicate) -> np.ndarray:
+            codes, values = columns[column]
+            return np.fromiter(map(predicate, values), dtype=bool, count=len(values))[codes]
+        
+        def contains(column: str, pattern: str, regex: bool = False) -> np.ndarray:
+            if regex:
+                compiled = re.compile(pattern)
+                return per_row(column, lambda value: compiled.search(value) is not None)
+            return per_row(column, lambda value: pattern in value)
+        
+        features['has_parent_process'] = per_row('parent_image', bool)
+        features['is_lolbin_process'] = per_row('process_name', self.LOLBIN_PROCESSES.__contains__)
+        features['is_powershell'] = contains('process_name', 'powershell')
+        features['is_cmd'] = contains('process_name', 'cmd')
+        features['is_wmic'] = contains('process_name', 'wmic')
+        features['is_scripting'] = contains('process_name', 'cscript|wscript|mshta', regex=True)
+        
+        features['parent_is_explorer'] = contains('parent_image', 'explorer')
+        features['parent_is_svchost'] = contains('parent_image', 'svchost')
+        features['parent_is_services'] = contains('parent_image', 'services')
+        lolbin_pattern = '|'.join(re.escape(name) for name in sorted(self.LOLBIN_PROCESSES))
+        features['parent_is_lolbin'] = contains('parent_image', lolbin_pattern, regex=True)
+        
+        features['is_system_user'] = contains('user', 'system') | contains('user', 'nt authority')
+        features['is_high_integrity'] = contains('integrity_level', 'high')
+        features['is_medium_integrity'] = contains('integrity_level', 'medium')
+        features['is_low_integrity'] = contains('integrity_level', 'low')
+        
+        feature_names = self.get_feature_names()
+        matrix = np.empty((len(df), len(feature_names)), dtype=np.float32)
+        for i, name in enumerate(feature_names):
+            matrix[:, i] = features[name]
+        return matrix
+    
+    def _command_line_batch(self, command_lines: List[str]) -> Dict[str, np.ndarray]:
+        """Command-line features for a list of lowercased command lines, one array per feature."""
+        n = len(command_lines)
+        
+        # Pattern indicators from the single-pass scanner
+        indicator_names = ['suspicious_pattern_count', 'has_encoded_command', 'has_network_activity',
+                           'has_file_operation', 'has_registry_operation', 'has_process_creation',
+                           'has_url', 'has_ip_address']
+        scans = [self.scanner.scan(command_line) for command_line in command_lines]
+        features = {
+            name: np.fromiter((scan[name] for scan in scans), dtype=np.float64, count=n)
+            for name in indicator_names
         }
-        features = self.extract_features(dummy_event)
-        return list(features.keys())
-
-
-
-
+        
+        # Flatten all command lines into one code point array with a row index per character
+        lengths = np.fromiter(map(len, command_lines), dtype=np.int64, count=n)
+        text = ''.join(command_lines).encode('utf-32-le', 'surrogatepass')
+        code_points = np.frombuffer(text, dtype=np.uint32)
+        rows = np.repeat(np.arange(n), lengths)
+        
+        # Classify each distinct code point once with the same str methods the
+        # per-row helpers use, then broadcast the classes to every character
+        distinct, char_ids = np.unique(code_points, return_inverse=True)
+        chars = [chr(code_point) for code_point in distinct]
+        
+        def char_class(predicate) -> np.ndarray:
+            return np.fromiter(map(predicate, chars), dtype=bool, count=len(chars))[char_ids]
+        
+        is_space = char_class(str.isspace)
+        is_alpha = char_class(str.isalpha)
+        
+        def count_per_row(mask: np.ndarray) -> np.ndarray:
+            return np.bincount(rows[mask], minlength=n).astype(np.float64)
+        
+        safe_lengths = np.maximum(lengths, 1)
+        letters = count_per_row(is_alpha)
+        features['command_line_length'] = lengths.astype(np.float64)
+        features['rare_char_count'] = count_per_row(char_class(self.RARE_CHARACTERS.__contains__))
+        features['digit_ratio'] = count_per_row(char_class(str.isdigit)) / safe_lengths
+        features['uppercase_ratio'] = np.divide(
+            count_per_row(is_alpha & char_class(str.isupper)), letters,
+            out=np.zeros(n), where=letters > 0
+        )
+        features['special_char_ratio'] = count_per_row(char_class(self.SPECIAL_CHARACTERS.__contains__)) / safe_lengths
+        
+        # Shannon entropy over characters other than ' ', from (row, char) pair counts
+        non_blank = distinct[char_ids] != ord(' ')
+        pair_keys = rows[non_blank] * len(distinct) + char_ids[non_blank]
+        pairs, pair_counts = np.unique(pair_keys, return_counts=True)
+        pair_rows = pairs // max(len(distinct), 1)
+        non_blank_lengths = np.bincount(rows[non_blank], minlength=n)
+        probabilities = pair_counts / non_blank_lengths[pair_rows]
+        entropy = np.bincount(pair_rows, weights=-probabilities * np.log2(probabilities), minlength=n)
+        features['command_line_entropy'] = entropy
+        features['has_high_entropy'] = entropy > 4.5
+        
+        # Whitespace tokens as str.split() yields them: a token starts at a
+        # non-space character that begins its line or follows whitespace
+        starts = np.cumsum(lengths) - lengths
+        follows_space = np.ones(len(code_points), dtype=bool)
+        follows_space[1:] = is_space[:-1]
+        follows_space[starts[lengths > 0]] = True
+        token_starts = ~is_space & follows_space
+        token_counts = count_per_row(token_starts)
+        features['command_line_token_count'] = token_counts
+        features['argument_count'] = np.maximum(token_counts - 1, 0)
+        
+        # Arguments are every token after the first; flag rows with one over 100 characters
+        token_ids = np.cumsum(token_starts) - 1
+        token_lengths = np.bincount(token_ids[~is_space], minlength=int(token_starts.sum()))
+        token_rows = rows[token_starts]
+        first_tokens = np.cumsum(token_counts).astype(np.int64) - token_counts.astype(np.int64)
+        is_argument = np.arange(len(token_rows)) > first_tokens[token_rows]
+        features['has_long_arguments'] = np.bincount(
+            token_rows[is_argument & (token_lengths > 100)], minlength=n
+        ) > 0
+        
+        return features
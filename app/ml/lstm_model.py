@@ -1,10 +1,48 @@
+import copy
+import hashlib
+import json
+import logging
+import os
 import torch
 import torch.nn as nn
 import numpy as np
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from pathlib import Path
 from app.ml.feature_extraction import FeatureExtractor
 
+logger = logging.getLogger(__name__)
+
+# Exported inference modules live next to the checkpoint: lstm_model.pth -> lstm_model.scripted.pt
+EXPORT_SUFFIXES = {'scripted': '.scripted.pt', 'quantized': '.int8.pt'}
+
+_threads_configured = False
+
+
+def configure_threads(num_threads: int, interop_threads: int):
+    """Size torch's intra-op and inter-op thread pools, once per process (0 keeps torch's default).
+    
+    torch defaults to one intra-op thread per core in every process, which
+    oversubscribes the CPU when several workers run on one host.
+    """
+    global _threads_configured
+    if _threads_configured:
+        return
+    _threads_configured = True
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            # Only allowed before the process does any inter-op parallel work
+            logger.warning(f"Could not set torch inter-op threads: {e}")
+
+
+def export_path(model_path: str, backend: str) -> Path:
+    """Path of the exported module for an inference backend ("scripted" or "quantized")."""
+    path = Path(model_path)
+    return path.with_name(path.stem + EXPORT_SUFFIXES[backend])
+
 
 class LSTMModel(nn.Module):
     """LSTM model architecture for sequence-based detection."""
@@ -30,7 +68,20 @@ class LSTMModel(nn.Module):
     
     def forward(self, x):
         lstm_out, _ = self.lstm(x)
-        last_output = lstm_out[:, -1, :]
+        return self.head(lstm_out[:, -1, :])
+    
+    @torch.jit.export
+    def step(
+        self,
+        x: torch.Tensor,
+        state: Optional[Tuple[torch.Tensor, torch.Tensor]] = None
+    ) -> Tuple[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]:
+        """Run x (batch, steps, input) on from state ((h, c), or None for zeros); returns the last step's score and the new state."""
+        lstm_out, state = self.lstm(x, state)
+        return self.head(lstm_out[:, -1, :]), state
+    
+    def head(self, last_output: torch.Tensor) -> torch.Tensor:
+        """Score from the top LSTM layer's output at one step."""
         x = self.fc1(last_output)
         x = self.relu(x)
         x = self.dropout(x)
@@ -40,15 +91,34 @@ class LSTMModel(nn.Module):
 
 
 class LSTMDetector:
-    """LSTM model for LOLBin detection."""
+    """LSTM model for LOLBin detection.
     
-    def __init__(self, model_path: str = None, device: str = None):
+    On CPU the model can run from a module exported next to the checkpoint
+    with export(): TorchScript ("scripted") or TorchScript with dynamically
+    int8-quantized LSTM and Linear layers ("quantized"). inference_backend
+    "auto" prefers the quantized module, then the scripted one, and falls
+    back to the eager model; an export made from a different checkpoint is
+    ignored. With mmap on a CPU device, eager weights are used in place from
+    a read-only memory map of the checkpoint file, so worker processes share
+    them.
+    """
+    
+    INFERENCE_BACKENDS = ('auto', 'eager', 'scripted', 'quantized')
+    
+    def __init__(self, model_path: str = None, device: str = None, mmap: bool = False, inference_backend: str = 'eager'):
+        if inference_backend not in self.INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend: {inference_backend}")
         self.model_path = model_path
         self.device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+        self.mmap = mmap and self.device == 'cpu'
+        self.inference_backend = inference_backend
+        # Backend actually in use after load_model or train
+        self.backend = None
         self.model = None
         self.feature_extractor = FeatureExtractor()
         self.feature_names = None
         self.input_size = None
+        self.model_version = None
         self.is_loaded = False
     
     def load_model(self, model_path: str = None):
@@ -59,7 +129,91 @@ class LSTMDetector:
         if not self.model_path or not Path(self.model_path).exists():
             raise FileNotFoundError(f"Model file not found: {self.model_path}")
         
-        checkpoint = torch.load(self.model_path, map_location=self.device)
+        # Version identifies this exact model file so caches built on it can be invalidated
+        stat = Path(self.model_path).stat()
+        self.model_version = f"{Path(self.model_path).name}@{stat.st_mtime_ns}-{stat.st_size}"
+        
+        for backend in self._exported_backends():
+            if self._load_exported(backend):
+                # Quantized scores differ slightly, so the backend is part of the version
+                self.model_version += f"+{backend}"
+                self.is_loaded = True
+                return
+        
+        self._load_checkpoint()
+        self.backend = 'eager'
+        self.is_loaded = True
+    
+    def export(self, quantize: bool = False) -> Dict[str, str]:
+        """Save the scripted module, and with quantize the int8 one, next to the checkpoint; returns their paths."""
+        if self.backend != 'eager' or not self.model_path:
+            raise ValueError("Export needs the eager model loaded from a checkpoint (inference_backend='eager').")
+        
+        metadata = json.dumps({
+            'source_digest': self._checkpoint_digest(),
+            'input_size': self.input_size,
+            'feature_names': list(self.feature_names)
+        })
+        written = {}
+        for backend in ('scripted', 'quantized') if quantize else ('scripted',):
+            path = export_path(self.model_path, backend)
+            tmp_path = path.with_suffix('.tmp')
+            torch.jit.save(self.script_module(quantize=backend == 'quantized'), str(tmp_path), _extra_files={'metadata.json': metadata})
+            os.replace(tmp_path, path)
+            written[backend] = str(path)
+        return written
+    
+    def script_module(self, quantize: bool = False) -> torch.jit.ScriptModule:
+        """TorchScript copy of the eager model on CPU, with dynamically int8-quantized LSTM and Linear layers if quantize."""
+        model = copy.deepcopy(self.model).cpu().eval()
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+        return torch.jit.script(model)
+    
+    def _exported_backends(self) -> List[str]:
+        """Exported modules to try, in order of preference."""
+        if self.device != 'cpu' or self.inference_backend == 'eager':
+            return []
+        if self.inference_backend == 'auto':
+            return ['quantized', 'scripted']
+        return [self.inference_backend]
+    
+    def _load_exported(self, backend: str) -> bool:
+        """Load the exported module for backend if it exists and was made from this checkpoint."""
+        path = export_path(self.model_path, backend)
+        if not path.exists():
+            if self.inference_backend == backend:
+                logger.warning(f"{path} not found, using the eager LSTM model; create it with scripts/export_lstm_model.py")
+            return False
+        
+        extra_files = {'metadata.json': ''}
+        try:
+            module = torch.jit.load(str(path), map_location='cpu', _extra_files=extra_files)
+            metadata = json.loads(extra_files['metadata.json'])
+        except (RuntimeError, ValueError) as e:
+            logger.warning(f"Could not load {path}, ignoring it: {e}")
+            return False
+        if metadata.get('source_digest') != self._checkpoint_digest():
+            logger.warning(f"{path} was exported from a different checkpoint, ignoring it; export it again")
+            return False
+        
+        self.model = module.eval()
+        self.input_size = metadata['input_size']
+        self.feature_names = metadata['feature_names']
+        self.backend = backend
+        return True
+    
+    def _checkpoint_digest(self) -> str:
+        """Content hash of the checkpoint, tying exported modules to it even across copies."""
+        digest = hashlib.sha256()
+        with open(self.model_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def _load_checkpoint(self):
+        """Build the eager model from the checkpoint file."""
+        checkpoint = torch.load(self.model_path, map_location=self.device, mmap=self.mmap)
         
         self.input_size = checkpoint.get('input_size', len(self.feature_extractor.get_feature_names()))
         hidden_size = checkpoint.get('hidden_size', 128)
@@ -71,12 +225,12 @@ class LSTMDetector:
             num_layers=num_layers
         )
         
-        self.model.load_state_dict(checkpoint['model_state_dict'])
+        # assign keeps the mapped tensors instead of copying them into fresh parameters
+        self.model.load_state_dict(checkpoint['model_state_dict'], assign=self.mmap)
         self.model.to(self.device)
         self.model.eval()
         
         self.feature_names = checkpoint.get('feature_names', self.feature_extractor.get_feature_names())
-        self.is_loaded = True
     
     def predict(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
         """Predict malicious score for event."""
@@ -87,21 +241,57 @@ class LSTMDetector:
         features = self.feature_extractor.extract_features(event_data)
         
         # Convert to feature vector
-        feature_vector = np.array([features.get(name, 0.0) for name in self.feature_names], dtype=np.float32)
+        feature_vector = self.feature_extractor.to_vector(features, self.feature_names)
         
-        # Reshape for LSTM: (batch_size, sequence_length, input_size)
+        return {
+            'score': self.predict_vector(feature_vector),
+            'features': features,
+            'feature_vector': feature_vector.tolist()
+        }
+    
+    def predict_vector(self, feature_vector: np.ndarray) -> float:
+        """Predict malicious score for an already extracted vector in feature_names order."""
         # For single event, we use sequence_length=1
-        feature_tensor = torch.FloatTensor(feature_vector).unsqueeze(0).unsqueeze(0).to(self.device)
+        return float(self.predict_batch(np.asarray(feature_vector).reshape(1, -1))[0])
+    
+    def predict_batch(self, feature_matrix: np.ndarray) -> np.ndarray:
+        """Predict malicious scores for a matrix of feature vectors in one forward pass."""
+        if not self.is_loaded:
+            raise ValueError("Model not loaded. Call load_model() first.")
+        
+        if len(feature_matrix) == 0:
+            return np.zeros(0, dtype=np.float64)
+        
+        # Each event is a sequence of length 1: (batch_size, 1, input_size)
+        feature_tensor = torch.from_numpy(np.asarray(feature_matrix, dtype=np.float32)).unsqueeze(1).to(self.device)
         
         with torch.no_grad():
             output = self.model(feature_tensor)
-            malicious_score = float(output.cpu().numpy()[0][0])
         
-        return {
-            'score': malicious_score,
-            'features': features,
-            'feature_vector': feature_vector.tolist()
-        }
+        return output.cpu().numpy()[:, 0].astype(np.float64)
+    
+    def predict_sequence(
+        self,
+        sequences: np.ndarray,
+        state: Optional[Tuple[np.ndarray, np.ndarray]] = None
+    ) -> Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        """Advance sequences (batch, steps, features) from state and score the last step of each.
+        
+        state is the (h, c) pair returned by an earlier call, both shaped
+        (num_layers, batch, hidden_size); None starts from zeros. Scoring one
+        new event of a sequence is a one-step call with the sequence's state.
+        """
+        if not self.is_loaded:
+            raise ValueError("Model not loaded. Call load_model() first.")
+        
+        sequence_tensor = torch.from_numpy(np.asarray(sequences, dtype=np.float32)).to(self.device)
+        if state is not None:
+            state = tuple(torch.from_numpy(np.ascontiguousarray(part)).to(self.device) for part in state)
+        
+        with torch.no_grad():
+            output, (h, c) = self.model.step(sequence_tensor, state)
+        
+        return output.cpu().numpy()[:, 0].astype(np.float64), (h.cpu().numpy(), c.cpu().numpy())
     
     def train(self, X: np.ndarray, y: np.ndarray, feature_names: List[str], **kwargs):
         """Train LSTM model."""
@@ -148,12 +338,15 @@ class LSTMDetector:
                 print(f"Epoch {epoch + 1}/{epochs}, Loss: {epoch_loss / len(dataloader):.4f}")
         
         self.model.eval()
+        self.backend = 'eager'
         self.is_loaded = True
     
     def save_model(self, model_path: str):
         """Save trained model."""
         if not self.model:
             raise ValueError("No model to save. Train model first.")
+        if self.backend != 'eager':
+            raise ValueError("Only the eager model can be saved as a checkpoint; exported modules are saved with export().")
         
         checkpoint = {
             'model_state_dict': self.model.state_dict(),
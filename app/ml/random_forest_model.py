@@ -1,19 +1,53 @@
 import joblib
+import json
+import os
+import shutil
+import threading
+import time
 import numpy as np
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from pathlib import Path
 from sklearn.ensemble import RandomForestClassifier
 from app.ml.feature_extraction import FeatureExtractor
+from app.ml.compiled_forest import CompiledForest
 
 
 class RandomForestDetector:
-    """Random Forest model for LOLBin detection."""
+    """Random Forest model for LOLBin detection.
     
-    def __init__(self, model_path: str = None):
+    With mmap_dir set, the forest is exported once per model file version to
+    flat .npy arrays under mmap_dir and scored from read-only memory maps of
+    them (the compiled backend), so every worker process on the host shares
+    one physical copy. The SHAP and LIME explainers work from the mapped
+    arrays as well (explainer_model, predict_proba). The export keeps a hard
+    link (or copy) of the model file, and the sklearn forest is only
+    unpickled from it when something asks for model, so it is always the
+    exported version even if the file at model_path has been replaced since.
+    """
+    
+    INFERENCE_BACKENDS = ('sklearn', 'compiled')
+    
+    # Name of the model file kept in an export directory
+    EXPORTED_MODEL_FILE = 'model.pkl'
+    # Part of export directory names; bumped when their contents change so older exports are replaced
+    EXPORT_LAYOUT = 'v2'
+    
+    def __init__(self, model_path: str = None, inference_backend: str = 'sklearn', mmap_dir: str = None):
+        if inference_backend not in self.INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend: {inference_backend}")
         self.model_path = model_path
-        self.model = None
+        self.inference_backend = 'compiled' if mmap_dir else inference_backend
+        self.mmap_dir = mmap_dir
+        self.export_dir = None
+        self._model = None
+        # Open exported model file, read on first access of model; open so a newer version removing the export cannot lose it
+        self._model_file = None
+        self._model_lock = threading.Lock()
+        self.compiled_model = None
         self.feature_extractor = FeatureExtractor()
         self.feature_names = None
+        self.background_data = None
+        self.model_version = None
         self.is_loaded = False
     
     def load_model(self, model_path: str = None):
@@ -24,17 +58,31 @@ class RandomForestDetector:
         if not self.model_path or not Path(self.model_path).exists():
             raise FileNotFoundError(f"Model file not found: {self.model_path}")
         
-        model_data = joblib.load(self.model_path)
+        # Version identifies this exact model file so caches built on it can be invalidated
+        self.model_version = self._file_version()
         
-        if isinstance(model_data, dict):
-            self.model = model_data.get('model')
-            self.feature_names = model_data.get('feature_names')
+        if self.mmap_dir:
+            self._load_mapped()
         else:
-            self.model = model_data
-            self.feature_names = self.feature_extractor.get_feature_names()
-        
+            self.model, self.feature_names, self.background_data = self._read_model_file()
+            self._compile()
         self.is_loaded = True
     
+    @property
+    def model(self):
+        """The sklearn forest; with mmap_dir it is unpickled from the exported model file on first access."""
+        if self._model is None and self._model_file is not None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = self._read_model_file(self._model_file)[0]
+                    self._model_file.close()
+                    self._model_file = None
+        return self._model
+    
+    @model.setter
+    def model(self, model):
+        self._model = model
+    
     def predict(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
         """Predict malicious score for event."""
         if not self.is_loaded:
@@ -44,18 +92,40 @@ class RandomForestDetector:
         features = self.feature_extractor.extract_features(event_data)
         
         # Convert to feature vector in correct order
-        feature_vector = np.array([features.get(name, 0.0) for name in self.feature_names]).reshape(1, -1)
-        
-        # Predict
-        probability = self.model.predict_proba(feature_vector)[0]
-        malicious_score = float(probability[1])  # Probability of malicious class
+        feature_vector = self.feature_extractor.to_vector(features, self.feature_names)
         
         return {
-            'score': malicious_score,
+            'score': self.predict_vector(feature_vector),
             'features': features,
-            'feature_vector': feature_vector.tolist()[0]
+            'feature_vector': feature_vector.tolist()
         }
     
+    def predict_vector(self, feature_vector: np.ndarray) -> float:
+        """Predict malicious score for an already extracted vector in feature_names order."""
+        return float(self.predict_batch(np.asarray(feature_vector).reshape(1, -1))[0])
+    
+    def predict_batch(self, feature_matrix: np.ndarray) -> np.ndarray:
+        """Predict malicious scores for a matrix of feature vectors in feature_names order."""
+        if not self.is_loaded:
+            raise ValueError("Model not loaded. Call load_model() first.")
+        
+        if len(feature_matrix) == 0:
+            return np.zeros(0, dtype=np.float64)
+        
+        return self.predict_proba(feature_matrix)[:, 1].astype(np.float64)
+    
+    def predict_proba(self, feature_matrix: np.ndarray) -> np.ndarray:
+        """Class probabilities for a matrix of feature vectors, from the backend that scores events."""
+        if self.compiled_model is not None:
+            return self.compiled_model.predict_proba(feature_matrix)
+        return self.model.predict_proba(feature_matrix)
+    
+    def explainer_model(self):
+        """Model for shap.TreeExplainer: with mmap_dir the mapped trees, so no private sklearn forest is unpickled."""
+        if self.export_dir is not None and self.compiled_model.cover is not None:
+            return self.compiled_model.to_shap_model()
+        return self.model
+    
     def train(self, X: np.ndarray, y: np.ndarray, feature_names: List[str], **kwargs):
         """Train Random Forest model."""
         n_estimators = kwargs.get('n_estimators', 100)
@@ -75,8 +145,96 @@ class RandomForestDetector:
         
         self.model.fit(X, y)
         self.feature_names = feature_names
+        self.background_data = self.sample_background(X, random_state=random_state)
+        self.model_version = f"trained@{time.time_ns()}"
+        self._compile()
         self.is_loaded = True
     
+    def _file_version(self) -> str:
+        """Version of the file at model_path: name, mtime and size."""
+        stat = Path(self.model_path).stat()
+        return f"{Path(self.model_path).name}@{stat.st_mtime_ns}-{stat.st_size}"
+    
+    def _read_model_file(self, source=None) -> Tuple[Any, List[str], Optional[np.ndarray]]:
+        """Unpickle the model file (or source, a path or open file) into (forest, feature names, background data)."""
+        model_data = joblib.load(self.model_path if source is None else source)
+        if isinstance(model_data, dict):
+            return model_data.get('model'), model_data.get('feature_names'), model_data.get('background_data')
+        return model_data, self.feature_extractor.get_feature_names(), None
+    
+    def _load_mapped(self):
+        """Memory-map the exported arrays of this model version, exporting them first if needed."""
+        export_dir = Path(self.mmap_dir) / f"{self.model_version.replace('@', '-')}.{self.EXPORT_LAYOUT}"
+        if not (export_dir / 'manifest.json').exists():
+            self._export(export_dir)
+        
+        manifest = json.loads((export_dir / 'manifest.json').read_text())
+        self.compiled_model = CompiledForest.load(export_dir, mmap_mode='r')
+        self.feature_names = manifest['feature_names']
+        self.background_data = None
+        if (export_dir / 'background_data.npy').exists():
+            self.background_data = np.load(export_dir / 'background_data.npy', mmap_mode='r')
+        self._model = None
+        self._model_file = open(export_dir / self.EXPORTED_MODEL_FILE, 'rb')
+        self.export_dir = export_dir
+        self._remove_stale_exports()
+    
+    def _export(self, export_dir: Path):
+        """Write the flat arrays of the model file and the file itself to export_dir, published with a rename."""
+        tmp_dir = export_dir.with_name(f"{export_dir.name}.tmp-{os.getpid()}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        
+        try:
+            exported_model_file = tmp_dir / self.EXPORTED_MODEL_FILE
+            try:
+                os.link(self.model_path, exported_model_file)
+            except OSError:
+                # Hard links need the same file system; a copy keeps the bytes just as well
+                shutil.copy2(self.model_path, exported_model_file)
+            if self._file_version() != self.model_version:
+                raise ValueError(f"Model file changed while loading: {self.model_path}")
+            
+            model, feature_names, background_data = self._read_model_file(exported_model_file)
+            CompiledForest.from_sklearn(model).save(tmp_dir)
+            if background_data is not None:
+                np.save(tmp_dir / 'background_data.npy', np.asarray(background_data))
+            (tmp_dir / 'manifest.json').write_text(json.dumps({
+                'model_version': self.model_version,
+                'feature_names': list(feature_names)
+            }))
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        
+        try:
+            os.rename(tmp_dir, export_dir)
+        except OSError:
+            # Another worker published the same version first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    
+    def _remove_stale_exports(self):
+        """Delete exports of earlier versions of this model file; processes mapping them keep their pages."""
+        prefix = f"{Path(self.model_path).name}-"
+        for path in Path(self.mmap_dir).iterdir():
+            if path.name.startswith(prefix) and path != self.export_dir and '.tmp-' not in path.name:
+                shutil.rmtree(path, ignore_errors=True)
+    
+    def _compile(self):
+        """Export the forest to flat arrays when the compiled backend is selected."""
+        self.compiled_model = None
+        if self.inference_backend == 'compiled':
+            self.compiled_model = CompiledForest.from_sklearn(self.model)
+    
+    @staticmethod
+    def sample_background(X: np.ndarray, size: int = 100, random_state: int = 42) -> np.ndarray:
+        """Sample training rows used as explainer background data."""
+        if len(X) <= size:
+            return np.asarray(X, dtype=np.float32)
+        rng = np.random.default_rng(random_state)
+        indices = rng.choice(len(X), size=size, replace=False)
+        return np.asarray(X[indices], dtype=np.float32)
+    
     def save_model(self, model_path: str):
         """Save trained model."""
         if not self.model:
@@ -84,7 +242,8 @@ class RandomForestDetector:
         
         model_data = {
             'model': self.model,
-            'feature_names': self.feature_names
+            'feature_names': self.feature_names,
+            'background_data': self.background_data
         }
         
         Path(model_path).parent.mkdir(parents=True, exist_ok=True)
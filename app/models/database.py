@@ -1,8 +1,35 @@
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime, Boolean, JSON, ForeignKey, Index
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from sqlalchemy.types import TypeDecorator
+import base64
+import json
+import zlib
+from app.core.config import settings
 from app.core.database import Base
 
 
+class RawEventJSON(TypeDecorator):
+    """JSON column for raw event payloads, zlib-compressed when RAW_EVENT_DATA_MODE is "compressed".
+    
+    Compressed values are stored as {"_zlib": "<base64>"} and expanded on read
+    whatever the current mode, so rows written under either mode stay readable.
+    """
+    impl = JSON
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None or settings.raw_event_data_mode != "compressed":
+            return value
+        payload = zlib.compress(json.dumps(value).encode("utf-8"))
+        return {"_zlib": base64.b64encode(payload).decode("ascii")}
+    
+    def process_result_value(self, value, dialect):
+        if isinstance(value, dict) and set(value) == {"_zlib"}:
+            return json.loads(zlib.decompress(base64.b64decode(value["_zlib"])))
+        return value
+
+
 class Event(Base):
     __tablename__ = "events"
     
@@ -14,15 +41,21 @@ class Event(Base):
     parent_image = Column(String)
     user = Column(String)
     integrity_level = Column(String)
-    raw_event_data = Column(JSON)
-    created_at = Column(DateTime, default=func.now())
+    raw_event_data = Column(RawEventJSON)
+    # Partition key and retention cutoff
+    created_at = Column(DateTime, default=func.now(), index=True)
+    
+    detections = relationship("Detection", back_populates="event")
+    
+    # Fetch server-generated defaults in the INSERT (RETURNING) instead of a later SELECT
+    __mapper_args__ = {"eager_defaults": True}
 
 
 class Detection(Base):
     __tablename__ = "detections"
     
     id = Column(Integer, primary_key=True, index=True)
-    event_id = Column(Integer, index=True)
+    event_id = Column(Integer, ForeignKey("events.id"), index=True)
     timestamp = Column(DateTime, default=func.now(), index=True)
     malicious_score = Column(Float, index=True)
     random_forest_score = Column(Float)
@@ -32,10 +65,23 @@ class Detection(Base):
     shap_values = Column(JSON)
     lime_explanation = Column(JSON)
     openai_explanation = Column(Text)
+    explanation_status = Column(String, default='skipped', index=True)
+    explanation_error = Column(Text)
+    explained_at = Column(DateTime)
     analyst_feedback = Column(String)
     analyst_notes = Column(Text)
     feedback_timestamp = Column(DateTime)
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now(), index=True)
+    
+    event = relationship("Event", back_populates="detections")
+    
+    __mapper_args__ = {"eager_defaults": True}
+    
+    # Keyset pagination of GET /detections: newest first, optionally malicious only
+    __table_args__ = (
+        Index("ix_detections_timestamp_id", "timestamp", "id"),
+        Index("ix_detections_malicious_timestamp_id", "is_malicious", "timestamp", "id"),
+    )
 
 
 class SystemStats(Base):
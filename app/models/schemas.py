@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 
 
@@ -30,6 +30,22 @@ class EventResponse(BaseModel):
         from_attributes = True
 
 
+class BatchDetectionResult(BaseModel):
+    index: int
+    event_id: str
+    detection_id: int
+    malicious_score: float
+    random_forest_score: float
+    lstm_score: float
+    is_malicious: bool
+
+
+class BatchDetectionResponse(BaseModel):
+    count: int
+    malicious_count: int
+    results: List[BatchDetectionResult]
+
+
 class DetectionCreate(BaseModel):
     event_id: int
     malicious_score: float
@@ -54,6 +70,8 @@ class DetectionResponse(BaseModel):
     shap_values: Optional[Dict[str, Any]]
     lime_explanation: Optional[Dict[str, Any]]
     openai_explanation: Optional[str]
+    explanation_status: Optional[str] = None
+    explained_at: Optional[datetime] = None
     analyst_feedback: Optional[str]
     analyst_notes: Optional[str]
     feedback_timestamp: Optional[datetime]
@@ -64,6 +82,32 @@ class DetectionResponse(BaseModel):
         from_attributes = True
 
 
+class DetectionSummary(BaseModel):
+    """Scalar detection columns for list views; only requested fields are returned."""
+    id: int
+    timestamp: datetime
+    event_id: Optional[int] = None
+    malicious_score: Optional[float] = None
+    random_forest_score: Optional[float] = None
+    lstm_score: Optional[float] = None
+    is_malicious: Optional[bool] = None
+    explanation_status: Optional[str] = None
+    analyst_feedback: Optional[str] = None
+    feedback_timestamp: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    process_name: Optional[str] = None
+
+
+class ExplanationResponse(BaseModel):
+    detection_id: int
+    status: Optional[str]
+    shap_values: Optional[Dict[str, Any]] = None
+    lime_explanation: Optional[Dict[str, Any]] = None
+    openai_explanation: Optional[str] = None
+    error: Optional[str] = None
+    explained_at: Optional[datetime] = None
+
+
 class FeedbackCreate(BaseModel):
     detection_id: int
     feedback: str = Field(..., pattern="^(true_positive|false_positive|true_negative|false_negative)$")
@@ -94,3 +138,24 @@ class StatsResponse(BaseModel):
 
 
 
+
+
+class ModelsResponse(BaseModel):
+    version: int
+    model_version: str
+    loaded_at: datetime
+    random_forest: Optional[str]
+    lstm: Optional[str]
+    reloaded: Optional[bool] = None
+
+
+class WorkerMemoryResponse(BaseModel):
+    pid: int
+    memory_mode: str
+    rss_bytes: int
+    pss_bytes: int
+    shared_bytes: int
+    private_bytes: int
+    swap_bytes: int
+    model_rss_bytes: int
+    model_pss_bytes: int
@@ -1,5 +1,6 @@
 import requests
 import smtplib
+from concurrent.futures import ThreadPoolExecutor, Future
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import Dict, Any, Optional
@@ -23,6 +24,21 @@ class AlertingService:
             'username': settings.email_username,
             'password': settings.email_password
         }
+        # Slack and SMTP calls block, so request handlers queue alerts here
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.alert_workers,
+            thread_name_prefix="alert"
+        )
+    
+    def submit_alert(self, detection: DetectionResponse, event_data: Dict[str, Any]) -> Optional[Future]:
+        """Queue an alert for delivery off the request path; returns None below the alert threshold."""
+        if detection.malicious_score < settings.alert_threshold:
+            return None
+        return self.executor.submit(self.send_alert, detection, event_data)
+    
+    def shutdown(self, wait: bool = True):
+        """Stop accepting alerts and optionally wait for queued ones to be delivered."""
+        self.executor.shutdown(wait=wait)
     
     def send_alert(self, detection: DetectionResponse, event_data: Dict[str, Any]) -> bool:
         """Send alert for high-priority detection."""
@@ -173,7 +189,7 @@ Please investigate this detection immediately.
         msg.attach(MIMEText(body, 'plain'))
         
         # Send email
-        server = smtplib.SMTP(self.email_config['host'], self.email_config['port'])
+        server = smtplib.SMTP(self.email_config['host'], self.email_config['port'], timeout=10)
         server.starttls()
         
         if self.email_config['username'] and self.email_config['password']:
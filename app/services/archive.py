@@ -0,0 +1,208 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+import json
+import os
+import re
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.ml.feature_extraction import event_host
+from app.models.database import Event, Detection
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Archived columns: scalar detection fields plus the event fields hunts filter on
+ARCHIVE_COLUMNS = [
+    ('detection_id', Detection.id),
+    ('event_id', Detection.event_id),
+    ('timestamp', Detection.timestamp),
+    ('malicious_score', Detection.malicious_score),
+    ('random_forest_score', Detection.random_forest_score),
+    ('lstm_score', Detection.lstm_score),
+    ('is_malicious', Detection.is_malicious),
+    ('explanation_status', Detection.explanation_status),
+    ('analyst_feedback', Detection.analyst_feedback),
+    ('created_at', Detection.created_at),
+    ('event_record_id', Event.event_id),
+    ('event_timestamp', Event.timestamp),
+    ('process_name', Event.process_name),
+    ('command_line', Event.command_line),
+    ('parent_image', Event.parent_image),
+    ('user', Event.user),
+    ('integrity_level', Event.integrity_level),
+]
+
+_PART_PATTERN = re.compile(r'part-(\d+)-(\d+)-\d+\.parquet$')
+
+
+class ParquetArchiver:
+    """Appends detections joined with their events to a Parquet archive for historical hunts.
+    
+    Files are laid out as <archive_dir>/detections/date=YYYY-MM-DD/host=NAME/
+    part-<first id>-<last id>-N.parquet. A watermark file records the last
+    archived detection ID; each export appends the detections after it in ID
+    order, stopping at the first one created less than lag_seconds ago so
+    IDs of transactions still committing are not skipped. Files from an
+    export that died before moving the watermark are removed on the next
+    run. Rows are archived once: later feedback is not reflected.
+    """
+    
+    def __init__(
+        self,
+        archive_dir: str = None,
+        session_factory=SessionLocal,
+        batch_size: int = None,
+        lag_seconds: float = None
+    ):
+        if not PYARROW_AVAILABLE:
+            raise ImportError("pyarrow is required for the Parquet archive: pip install pyarrow")
+        
+        self.archive_dir = Path(archive_dir or settings.archive_dir)
+        self.dataset_dir = self.archive_dir / 'detections'
+        self.watermark_path = self.archive_dir / 'watermark.json'
+        self.session_factory = session_factory
+        self.batch_size = max(1, batch_size or settings.archive_batch_size)
+        self.lag_seconds = settings.archive_lag_seconds if lag_seconds is None else lag_seconds
+    
+    def export(self) -> Dict[str, Any]:
+        """Archive every detection after the watermark that is older than the lag."""
+        watermark = self.read_watermark()
+        self._remove_uncommitted(watermark)
+        horizon = datetime.now() - timedelta(seconds=self.lag_seconds)
+        
+        exported = 0
+        files = 0
+        while True:
+            rows = self._fetch(watermark)
+            # Keep ID order: stop at the first row still inside the lag
+            cutoff = next((i for i, row in enumerate(rows) if row.created_at and row.created_at >= horizon), len(rows))
+            rows = rows[:cutoff]
+            if not rows:
+                break
+            
+            files += self._write(rows, watermark + 1, rows[-1].detection_id)
+            watermark = rows[-1].detection_id
+            self._write_watermark(watermark)
+            exported += len(rows)
+            if cutoff < self.batch_size:
+                break
+        
+        if exported:
+            logger.info(f"Archived {exported} detections in {files} files up to detection {watermark}")
+        return {'exported': exported, 'files': files, 'watermark': watermark}
+    
+    def read_watermark(self) -> int:
+        """Last archived detection ID (0 if nothing is archived yet)."""
+        try:
+            return int(json.loads(self.watermark_path.read_text())['detection_id'])
+        except FileNotFoundError:
+            return 0
+    
+    def _fetch(self, watermark: int) -> List[Any]:
+        """Next batch of detections after the watermark, with their events."""
+        db = self.session_factory()
+        try:
+            return db.query(
+                *[column.label(name) for name, column in ARCHIVE_COLUMNS],
+                Event.raw_event_data.label('raw_event_data')
+            ).outerjoin(
+                Event, Event.id == Detection.event_id
+            ).filter(
+                Detection.id > watermark
+            ).order_by(Detection.id).limit(self.batch_size).all()
+        finally:
+            db.close()
+    
+    def _write(self, rows: List[Any], first_id: int, last_id: int) -> int:
+        """Write one batch as Parquet files partitioned by date and host; returns the file count."""
+        columns = {name: [getattr(row, name) for row in rows] for name, _ in ARCHIVE_COLUMNS}
+        columns['date'] = [(row.timestamp or row.created_at).date() for row in rows]
+        columns['host'] = [event_host(row.raw_event_data) for row in rows]
+        table = pa.table(columns)
+        
+        written = []
+        ds.write_dataset(
+            table,
+            self.dataset_dir,
+            format='parquet',
+            partitioning=ds.partitioning(table.select(['date', 'host']).schema, flavor='hive'),
+            basename_template=f"part-{first_id:012d}-{last_id:012d}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore',
+            file_visitor=lambda written_file: written.append(written_file.path)
+        )
+        return len(written)
+    
+    def _write_watermark(self, detection_id: int):
+        """Atomically record the last archived detection ID."""
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.watermark_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps({'detection_id': detection_id, 'updated_at': datetime.now().isoformat()}))
+        os.replace(tmp_path, self.watermark_path)
+    
+    def _remove_uncommitted(self, watermark: int):
+        """Delete files written after the watermark by an export that did not finish."""
+        for path in self.dataset_dir.glob('**/part-*.parquet'):
+            match = _PART_PATTERN.search(path.name)
+            if match and int(match.group(1)) > watermark:
+                logger.warning(f"Removing unfinished archive file {path}")
+                path.unlink()
+
+
+class ArchiveQuery:
+    """Runs SQL over the Parquet archive with DuckDB.
+    
+    The archive is exposed as the view "detections", including the date and
+    host partition columns; filters on date only read the matching
+    partitions.
+    """
+    
+    def __init__(self, archive_dir: str = None):
+        if not DUCKDB_AVAILABLE:
+            raise ImportError("duckdb is required to query the archive: pip install duckdb")
+        
+        self.dataset_dir = Path(archive_dir or settings.archive_dir) / 'detections'
+        self.connection = duckdb.connect()
+        # Views cannot take bound parameters; quote the path as a SQL literal
+        pattern = str(self.dataset_dir / '**' / '*.parquet').replace("'", "''")
+        self.connection.execute(
+            f"CREATE VIEW detections AS SELECT * FROM read_parquet('{pattern}', hive_partitioning = true, union_by_name = true)"
+        )
+    
+    def sql(self, query: str, parameters: Optional[Any] = None):
+        """Run a query and return the result as a pandas DataFrame."""
+        return self.connection.execute(query, parameters or []).df()
+    
+    def top_processes(self, days: int = 90, bucket_width: float = 0.1, limit: int = 10):
+        """Most frequent process names per malicious-score bucket over the last days."""
+        return self.sql(
+            """
+            SELECT bucket, process_name, detections
+            FROM (
+                SELECT
+                    round(floor(malicious_score / $width) * $width, 6) AS bucket,
+                    process_name,
+                    count(*) AS detections,
+                    row_number() OVER (PARTITION BY bucket ORDER BY count(*) DESC, process_name) AS rank
+                FROM detections
+                WHERE date >= current_date - CAST($days AS INTEGER)
+                GROUP BY bucket, process_name
+            )
+            WHERE rank <= $limit
+            ORDER BY bucket DESC, detections DESC
+            """,
+            {'width': bucket_width, 'days': days, 'limit': limit}
+        )
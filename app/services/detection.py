@@ -1,111 +1,399 @@
-from typing import Dict, Any, Optional
-from sqlalchemy.orm import Session
+from typing import Dict, Any, Optional, List, Tuple
+import base64
+import json
+import numpy as np
+from sqlalchemy import String, and_, or_, type_coerce
+from sqlalchemy.orm import Session, joinedload
 from app.models.database import Event, Detection
-from app.ml.random_forest_model import RandomForestDetector
-from app.ml.lstm_model import LSTMDetector
 from app.ml.feature_extraction import FeatureExtractor
+from app.services.score_cache import ScoreCache
+from app.services.micro_batcher import MicroBatchScheduler
+from app.services.sequence_scorer import SequenceScorer
+from app.services.model_registry import ModelSet, get_model_registry
+from app.services.group_commit import GroupCommitWriter
+from app.services.stats_rollup import StatsRollup
+from app.services.explanation_worker import STATUS_COMPLETED
 from app.core.config import settings
 from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Scalar columns a summary listing may return; process_name comes from the joined event
+SUMMARY_FIELDS = (
+    'id', 'event_id', 'timestamp', 'malicious_score', 'random_forest_score', 'lstm_score',
+    'is_malicious', 'explanation_status', 'analyst_feedback', 'feedback_timestamp', 'created_at',
+    'process_name'
+)
+
 
 class DetectionService:
     """Service for detecting malicious events using ML models."""
     
     def __init__(self):
-        self.rf_detector = None
-        self.lstm_detector = None
+        self.model_registry = get_model_registry()
         self.feature_extractor = FeatureExtractor()
-        self._load_models()
-    
-    def _load_models(self):
-        """Load ML models."""
-        try:
-            self.rf_detector = RandomForestDetector()
-            self.rf_detector.load_model(settings.random_forest_model_path)
-            logger.info("Random Forest model loaded successfully")
-        except Exception as e:
-            logger.warning(f"Failed to load Random Forest model: {e}")
+        self.score_cache = ScoreCache() if settings.score_cache_enabled else None
+        self.stats_rollup = StatsRollup()
+        self.rf_scheduler = None
+        self.lstm_scheduler = None
+        self.writer = GroupCommitWriter() if settings.group_commit_enabled else None
+        self.sequence_scorer = SequenceScorer() if settings.lstm_sequence_enabled else None
+        if self.score_cache is not None:
+            # Keys include the model version, so old entries could never hit again
+            self.model_registry.add_listener(lambda models: self.score_cache.clear())
         
-        try:
-            self.lstm_detector = LSTMDetector()
-            self.lstm_detector.load_model(settings.lstm_model_path)
-            logger.info("LSTM model loaded successfully")
-        except Exception as e:
-            logger.warning(f"Failed to load LSTM model: {e}")
+        if settings.micro_batching_enabled:
+            # Each vector is scored by the detector of the model set it was built for
+            self.rf_scheduler = MicroBatchScheduler(
+                lambda matrix, detector: detector.predict_batch(matrix), name='random_forest'
+            )
+            self.lstm_scheduler = MicroBatchScheduler(
+                lambda matrix, detector: detector.predict_batch(matrix), name='lstm'
+            )
     
-    def detect(self, db: Session, event_data: Dict[str, Any]) -> Detection:
-        """Detect malicious activity in event and store results."""
-        # Store event in database
-        event = Event(
-            event_id=event_data.get('event_id', ''),
-            timestamp=event_data.get('timestamp', datetime.now()),
-            process_name=event_data.get('process_name', ''),
-            command_line=event_data.get('command_line', ''),
-            parent_image=event_data.get('parent_image'),
-            user=event_data.get('user'),
-            integrity_level=event_data.get('integrity_level'),
-            raw_event_data=event_data.get('raw_event_data')
-        )
-        db.add(event)
-        db.commit()
-        db.refresh(event)
+    def reload_models(self) -> Dict[str, Any]:
+        """Reload ML models from disk; requests already scoring finish on the old models."""
+        return self.model_registry.reload()
+    
+    def model_version(self) -> str:
+        """Combined version of the loaded models, part of every score cache key."""
+        return self.model_registry.current().model_version
+    
+    def warm_up(self, event_data: Dict[str, Any]) -> Dict[str, float]:
+        """Run an event through feature extraction and the single and batch scoring paths without storing it.
         
-        # Extract features
+        Returns the extracted features.
+        """
+        models = self.model_registry.current()
         features = self.feature_extractor.extract_features(event_data)
+        self._combine_scores(*self._score_features(features, models), features)
+        for detector in (models.rf_detector, models.lstm_detector):
+            if detector:
+                detector.predict_batch(self.feature_extractor.build_matrix([features], detector.feature_names))
+        if self.sequence_scorer is not None and models.lstm_detector:
+            # Exercise the stateful path without adding the event to a lineage
+            matrix = self.feature_extractor.build_matrix([features], models.lstm_detector.feature_names)
+            models.lstm_detector.predict_sequence(matrix[:, None, :])
+        return features
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Runtime counters for the detection pipeline."""
+        return {
+            'model_version': self.model_version(),
+            'models': self.model_registry.current().describe(),
+            'score_cache': self.score_cache.stats() if self.score_cache is not None else None,
+            'micro_batching': {
+                scheduler.name: scheduler.stats()
+                for scheduler in (self.rf_scheduler, self.lstm_scheduler)
+                if scheduler is not None
+            },
+            'group_commit': self.writer.stats() if self.writer is not None else None,
+            'lstm_sequences': self.sequence_scorer.stats() if self.sequence_scorer is not None else None
+        }
+    
+    def shutdown(self):
+        """Stop the micro-batch schedulers, then write any buffered detections."""
+        for scheduler in (self.rf_scheduler, self.lstm_scheduler):
+            if scheduler is not None:
+                scheduler.shutdown()
+        if self.writer is not None:
+            self.writer.shutdown()
+    
+    def detect(self, db: Session, event_data: Dict[str, Any]) -> Detection:
+        """Detect malicious activity in event and store the event and detection in one transaction."""
+        # One model set for the whole request, even if a reload happens meanwhile
+        models = self.model_registry.current()
         
-        # Run ML models
-        rf_score = 0.0
-        lstm_score = 0.0
-        
-        if self.rf_detector:
-            try:
-                rf_result = self.rf_detector.predict(event_data)
-                rf_score = rf_result['score']
-            except Exception as e:
-                logger.error(f"Random Forest prediction error: {e}")
+        sequence_key = self.sequence_scorer.key_for(event_data) if self.sequence_scorer is not None else None
         
-        if self.lstm_detector:
-            try:
-                lstm_result = self.lstm_detector.predict(event_data)
-                lstm_score = lstm_result['score']
-            except Exception as e:
-                logger.error(f"LSTM prediction error: {e}")
+        # Repeated events reuse the cached features and scores
+        cache_key = None
+        cached = None
+        if self.score_cache is not None:
+            cache_key = ScoreCache.make_key(event_data, models.model_version)
+            cached = self.score_cache.get(cache_key)
         
-        # Combine scores (weighted average)
-        if rf_score > 0 and lstm_score > 0:
-            malicious_score = (rf_score * 0.6) + (lstm_score * 0.4)
-        elif rf_score > 0:
-            malicious_score = rf_score
-        elif lstm_score > 0:
-            malicious_score = lstm_score
+        if cached is not None:
+            features = dict(cached['features'])
+            rf_score = cached['random_forest_score']
+            lstm_score = cached['lstm_score']
+            malicious_score = cached['malicious_score']
+            if sequence_key is not None:
+                # The LSTM score depends on the lineage's earlier events, so it is never reused
+                lstm_score = float(self._sequence_scores(models, [sequence_key], [features])[0])
+                malicious_score = self._combine_scores(rf_score, lstm_score, features)
         else:
-            # Fallback: use feature-based heuristic
-            malicious_score = self._heuristic_score(features)
+            # Extract features once; every model scores from this dict
+            features = self.feature_extractor.extract_features(event_data)
+            rf_score, lstm_score = self._score_features(features, models, sequence_key)
+            malicious_score = self._combine_scores(rf_score, lstm_score, features)
         
         # Determine if malicious
         is_malicious = malicious_score >= settings.detection_threshold
         
-        # Create detection record
+        # Create event and detection records
+        event = self._build_event(event_data)
         detection = Detection(
-            event_id=event.id,
             malicious_score=malicious_score,
             random_forest_score=rf_score,
             lstm_score=lstm_score,
             is_malicious=is_malicious,
             features=features
         )
+        # Explanations cite the score, so they carry over only if it is unchanged
+        if cached is not None and malicious_score == cached['malicious_score']:
+            self._reuse_explanations(db, [(detection, cached['detection_id'])])
         
-        db.add(detection)
-        db.commit()
-        db.refresh(detection)
+        detection = self._store(db, [event], [detection])[0]
+        
+        if cache_key and cached is None:
+            self.score_cache.put(cache_key, self._cache_entry(detection, features))
         
         logger.info(f"Detection created: ID={detection.id}, Score={malicious_score:.4f}, Malicious={is_malicious}")
         
         return detection
     
+    def detect_batch(self, db: Session, events_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Score a batch of events with one model call each and store results in one transaction.
+        
+        Returns one result dict per input event, in input order.
+        """
+        if not events_data:
+            return []
+        
+        models = self.model_registry.current()
+        keys = [ScoreCache.make_key(event_data, models.model_version) for event_data in events_data]
+        
+        # Look up each distinct event once; identical events within the batch share one scoring
+        cached_entries: Dict[str, Optional[Dict[str, Any]]] = {}
+        first_index: Dict[str, int] = {}
+        for index, key in enumerate(keys):
+            if key not in first_index:
+                first_index[key] = index
+                cached_entries[key] = self.score_cache.get(key) if self.score_cache is not None else None
+        
+        miss_keys = [key for key, entry in cached_entries.items() if entry is None]
+        miss_features = [self.feature_extractor.extract_features(events_data[first_index[key]]) for key in miss_keys]
+        
+        rf_scores = np.zeros(len(miss_keys))
+        lstm_scores = np.zeros(len(miss_keys))
+        
+        if models.rf_detector and miss_keys:
+            try:
+                rf_matrix = self.feature_extractor.build_matrix(miss_features, models.rf_detector.feature_names)
+                rf_scores = models.rf_detector.predict_batch(rf_matrix)
+            except Exception as e:
+                logger.error(f"Random Forest batch prediction error: {e}")
+        
+        # With sequence scoring every event gets its own LSTM score below
+        if models.lstm_detector and miss_keys and self.sequence_scorer is None:
+            try:
+                lstm_matrix = self.feature_extractor.build_matrix(miss_features, models.lstm_detector.feature_names)
+                lstm_scores = models.lstm_detector.predict_batch(lstm_matrix)
+            except Exception as e:
+                logger.error(f"LSTM batch prediction error: {e}")
+        
+        scored = {}
+        for key, features, rf_score, lstm_score in zip(miss_keys, miss_features, rf_scores, lstm_scores):
+            rf_score = float(rf_score)
+            lstm_score = float(lstm_score)
+            scored[key] = {
+                'features': features,
+                'random_forest_score': rf_score,
+                'lstm_score': lstm_score,
+                'malicious_score': self._combine_scores(rf_score, lstm_score, features)
+            }
+        
+        events = [self._build_event(event_data) for event_data in events_data]
+        entries = [cached_entries[key] or scored[key] for key in keys]
+        
+        sequence_scores = None
+        if self.sequence_scorer is not None:
+            sequence_scores = self._sequence_scores(
+                models,
+                [self.sequence_scorer.key_for(event_data) for event_data in events_data],
+                [entry['features'] for entry in entries]
+            )
+        
+        detections = []
+        reused = []
+        for index, (event, key, entry) in enumerate(zip(events, keys, entries)):
+            lstm_score = entry['lstm_score']
+            malicious_score = entry['malicious_score']
+            if sequence_scores is not None:
+                lstm_score = float(sequence_scores[index])
+                malicious_score = self._combine_scores(entry['random_forest_score'], lstm_score, entry['features'])
+            detection = Detection(
+                malicious_score=malicious_score,
+                random_forest_score=entry['random_forest_score'],
+                lstm_score=lstm_score,
+                is_malicious=malicious_score >= settings.detection_threshold,
+                features=dict(entry['features'])
+            )
+            detections.append(detection)
+            if cached_entries[key] is not None and malicious_score == cached_entries[key]['malicious_score']:
+                reused.append((detection, cached_entries[key]['detection_id']))
+        
+        self._reuse_explanations(db, reused)
+        detections = self._store(db, events, detections)
+        
+        if self.score_cache is not None:
+            for key, index in first_index.items():
+                if key in scored:
+                    self.score_cache.put(key, self._cache_entry(detections[index], scored[key]['features']))
+        
+        results = [
+            {
+                'index': index,
+                'event_id': event.event_id,
+                'detection_id': detection.id,
+                'malicious_score': detection.malicious_score,
+                'random_forest_score': detection.random_forest_score,
+                'lstm_score': detection.lstm_score,
+                'is_malicious': detection.is_malicious
+            }
+            for index, (event, detection) in enumerate(zip(events, detections))
+        ]
+        
+        malicious_count = sum(1 for result in results if result['is_malicious'])
+        logger.info(f"Batch detection created: {len(results)} events, {malicious_count} malicious")
+        
+        return results
+    
+    def _store(self, db: Session, events: List[Event], detections: List[Detection]) -> List[Detection]:
+        """Persist events with their detections in one transaction and return the stored detections.
+        
+        With group commit enabled the rows join the writer's next bulk insert;
+        this waits for that commit and attaches the results to db without a reload.
+        """
+        if self.writer is not None:
+            # Return the request's pooled connection first; waiting while holding it
+            # could starve the writer of connections under load
+            db.commit()
+            futures = self.writer.submit_many(list(zip(events, detections)))
+            stored = [future.result() for future in futures]
+            db.add_all(stored)
+            return stored
+        
+        # The relationship links each pair at flush time; one commit inserts all rows and,
+        # as the session does not expire them on commit, no reload is needed
+        for event, detection in zip(events, detections):
+            detection.event = event
+        db.add_all(detections)
+        self.stats_rollup.record_inserts(db, len(events), [detection.is_malicious for detection in detections])
+        db.commit()
+        return detections
+    
+    def _score_features(
+        self,
+        features: Dict[str, float],
+        models: ModelSet,
+        sequence_key: Optional[str] = None
+    ) -> Tuple[float, float]:
+        """Random Forest and LSTM scores for one feature dict (0.0 for unavailable models).
+        
+        With a sequence key the LSTM scores the event after its lineage's earlier events.
+        """
+        rf_score = 0.0
+        lstm_score = 0.0
+        
+        if models.rf_detector:
+            try:
+                rf_vector = self.feature_extractor.to_vector(features, models.rf_detector.feature_names)
+                if self.rf_scheduler is not None:
+                    rf_score = self.rf_scheduler.predict(rf_vector, models.rf_detector)
+                else:
+                    rf_score = models.rf_detector.predict_vector(rf_vector)
+            except Exception as e:
+                logger.error(f"Random Forest prediction error: {e}")
+        
+        if models.lstm_detector and sequence_key is not None:
+            lstm_score = float(self._sequence_scores(models, [sequence_key], [features])[0])
+        elif models.lstm_detector:
+            try:
+                lstm_vector = self.feature_extractor.to_vector(features, models.lstm_detector.feature_names)
+                if self.lstm_scheduler is not None:
+                    lstm_score = self.lstm_scheduler.predict(lstm_vector, models.lstm_detector)
+                else:
+                    lstm_score = models.lstm_detector.predict_vector(lstm_vector)
+            except Exception as e:
+                logger.error(f"LSTM prediction error: {e}")
+        
+        return rf_score, lstm_score
+    
+    def _sequence_scores(self, models: ModelSet, keys: List[str], features_list: List[Dict[str, float]]) -> np.ndarray:
+        """LSTM scores of events in their lineages, in order (zeros if the LSTM is unavailable)."""
+        scores = np.zeros(len(keys))
+        if not models.lstm_detector:
+            return scores
+        try:
+            matrix = self.feature_extractor.build_matrix(features_list, models.lstm_detector.feature_names)
+            scores = self.sequence_scorer.score_batch(models.lstm_detector, keys, matrix)
+        except Exception as e:
+            logger.error(f"LSTM sequence prediction error: {e}")
+        return scores
+    
+    def _cache_entry(self, detection: Detection, features: Dict[str, float]) -> Dict[str, Any]:
+        """Score cache entry; the detection ID is the reference for reusing its explanations."""
+        return {
+            'features': dict(features),
+            'random_forest_score': detection.random_forest_score,
+            'lstm_score': detection.lstm_score,
+            'malicious_score': detection.malicious_score,
+            'detection_id': detection.id
+        }
+    
+    def _reuse_explanations(self, db: Session, pairs: List[Tuple[Detection, int]]):
+        """Copy completed explanations from the detection each cache entry was scored for.
+        
+        Identical events have identical feature vectors, so their explanations
+        carry over; methods the source lacks are still generated as usual.
+        """
+        source_ids = {source_id for _, source_id in pairs if source_id}
+        if not source_ids:
+            return
+        
+        sources = {
+            source.id: source
+            for source in db.query(Detection).filter(Detection.id.in_(source_ids))
+        }
+        for detection, source_id in pairs:
+            source = sources.get(source_id)
+            if source is None or source.explanation_status != STATUS_COMPLETED:
+                continue
+            detection.shap_values = source.shap_values
+            detection.lime_explanation = source.lime_explanation
+            detection.openai_explanation = source.openai_explanation
+            detection.explanation_status = STATUS_COMPLETED
+            detection.explained_at = source.explained_at
+    
+    def _build_event(self, event_data: Dict[str, Any]) -> Event:
+        """Build an Event row from submitted event data."""
+        return Event(
+            event_id=event_data.get('event_id', ''),
+            timestamp=event_data.get('timestamp', datetime.now()),
+            process_name=event_data.get('process_name', ''),
+            command_line=event_data.get('command_line', ''),
+            parent_image=event_data.get('parent_image'),
+            user=event_data.get('user'),
+            integrity_level=event_data.get('integrity_level'),
+            # Scoring only uses the parsed fields, so the raw payload can be left out
+            raw_event_data=event_data.get('raw_event_data') if settings.raw_event_data_mode != 'none' else None
+        )
+    
+    def _combine_scores(self, rf_score: float, lstm_score: float, features: Dict[str, float]) -> float:
+        """Combine model scores (weighted average), falling back to the heuristic score."""
+        if rf_score > 0 and lstm_score > 0:
+            return (rf_score * 0.6) + (lstm_score * 0.4)
+        elif rf_score > 0:
+            return rf_score
+        elif lstm_score > 0:
+            return lstm_score
+        
+        # Fallback: use feature-based heuristic
+        return self._heuristic_score(features)
+    
     def _heuristic_score(self, features: Dict[str, float]) -> float:
         """Calculate heuristic score based on features when models unavailable."""
         score = 0.0
@@ -142,15 +430,67 @@ class DetectionService:
         db: Session,
         skip: int = 0,
         limit: int = 100,
-        malicious_only: bool = False
+        malicious_only: bool = False,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        fields: Optional[List[str]] = None
     ):
-        """List detections with pagination."""
-        query = db.query(Detection)
+        """List detections newest first, by offset or after a (timestamp, id) cursor.
+        
+        With fields (from SUMMARY_FIELDS), only those columns plus id and
+        timestamp are selected, with no JSON blobs, and rows come back as
+        dicts; otherwise full detections with their events are loaded.
+        """
+        if fields is None:
+            query = db.query(Detection).options(joinedload(Detection.event))
+        else:
+            columns = [Detection.id, Detection.timestamp]
+            columns += [getattr(Detection, field) for field in fields if field not in ('id', 'timestamp', 'process_name')]
+            query = db.query(*columns)
+            if 'process_name' in fields:
+                query = query.add_columns(Event.process_name).outerjoin(Event, Event.id == Detection.event_id)
         
         if malicious_only:
             query = query.filter(Detection.is_malicious == True)
+        if cursor is not None:
+            query = query.filter(self._after_cursor(db, *cursor))
         
-        return query.order_by(Detection.timestamp.desc()).offset(skip).limit(limit).all()
+        query = query.order_by(Detection.timestamp.desc(), Detection.id.desc())
+        if skip:
+            query = query.offset(skip)
+        rows = query.limit(limit).all()
+        
+        if fields is None:
+            return rows
+        # id and timestamp are always returned; clients page with them
+        return [dict({'id': row.id, 'timestamp': row.timestamp}, **{field: getattr(row, field) for field in fields}) for row in rows]
+    
+    @staticmethod
+    def encode_cursor(timestamp: datetime, detection_id: int) -> str:
+        """Opaque cursor for the page after the detection with this timestamp and ID."""
+        payload = json.dumps([timestamp.isoformat(), detection_id]).encode('utf-8')
+        return base64.urlsafe_b64encode(payload).decode('ascii')
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        """Parse a cursor from encode_cursor; raises ValueError if it is malformed."""
+        try:
+            timestamp, detection_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return datetime.fromisoformat(timestamp), int(detection_id)
+        except (TypeError, ValueError, UnicodeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+    
+    def _after_cursor(self, db: Session, timestamp: datetime, detection_id: int):
+        """Rows after the cursor in (timestamp desc, id desc) order, as a range the (timestamp, id) index serves."""
+        earlier = timestamp
+        if db.get_bind().dialect.name == 'sqlite' and not timestamp.microsecond:
+            # SQLite stores CURRENT_TIMESTAMP defaults as text without fractional seconds, which
+            # sorts before the bound value '...:SS.000000'; compare with the same spelling
+            # (a Python-written '...:SS.000000' row at that second could still be misplaced)
+            earlier = type_coerce(timestamp.strftime('%Y-%m-%d %H:%M:%S'), String)
+        return and_(
+            Detection.timestamp <= timestamp,
+            or_(Detection.timestamp < earlier, Detection.id < detection_id)
+        )
 
 
 
@@ -1,35 +1,111 @@
-import shap
+import threading
+import time
 import numpy as np
-from typing import Dict, Any, Optional
-from lime import lime_tabular
-from openai import OpenAI
+from types import SimpleNamespace
+from pathlib import Path
+import random
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Any, Optional, List
 from app.core.config import settings
 from app.ml.feature_extraction import FeatureExtractor
-from app.ml.random_forest_model import RandomForestDetector
+from app.services.model_registry import get_model_registry
 import logging
 
+# shap, lime and openai are imported where they are first used, keeping API startup fast
+if TYPE_CHECKING:
+    from app.ml.random_forest_model import RandomForestDetector
+
 logger = logging.getLogger(__name__)
 
 
+class StubLLMClient:
+    """Local stand-in for the OpenAI client that returns deterministic explanations.
+    
+    Mirrors the `client.chat.completions.create(...)` call used by the service so
+    the explanation pipeline can be exercised without network access.
+    """
+    
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+    
+    def _create(self, model: str, messages: list, **kwargs):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        prompt = messages[-1]['content'] if messages else ''
+        details = [line.strip() for line in prompt.splitlines() if line.strip().startswith('- ')][:3]
+        content = f"[stub:{model}] Automated explanation. " + " ".join(details)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class ExplanationPolicy:
+    """Decides which explanation methods run automatically for a detection score.
+    
+    A method runs when the score reaches its threshold; below it, a sampling
+    rate lets a small fraction of low-scoring events be explained for monitoring.
+    """
+    
+    METHODS = ('shap', 'lime', 'openai')
+    
+    def __init__(self, thresholds: Dict[str, float], sample_rates: Optional[Dict[str, float]] = None):
+        self.thresholds = thresholds
+        self.sample_rates = sample_rates or {}
+    
+    @classmethod
+    def from_settings(cls) -> "ExplanationPolicy":
+        """Build the policy from configured thresholds and sampling rates."""
+        return cls(
+            thresholds={
+                'shap': settings.shap_explanation_threshold,
+                'lime': settings.lime_explanation_threshold,
+                'openai': settings.llm_explanation_threshold
+            },
+            sample_rates={
+                'shap': settings.shap_explanation_sample_rate,
+                'lime': settings.lime_explanation_sample_rate,
+                'openai': settings.llm_explanation_sample_rate
+            }
+        )
+    
+    def select_methods(self, malicious_score: float) -> List[str]:
+        """Return the explanation methods to run for a detection with this score."""
+        methods = []
+        for method in self.METHODS:
+            if malicious_score >= self.thresholds.get(method, 0.0):
+                methods.append(method)
+            elif random.random() < self.sample_rates.get(method, 0.0):
+                methods.append(method)
+        return methods
+
+
 class ExplainabilityService:
     """Service for generating explanations using SHAP, LIME, and OpenAI."""
     
     def __init__(self):
         self.feature_extractor = FeatureExtractor()
-        self.rf_detector = None
+        # The RF model is shared with detection through the process-wide registry
+        self.model_registry = get_model_registry()
         self.openai_client = None
+        self.policy = ExplanationPolicy.from_settings()
+        # Explainers are expensive to build, so they are cached per RF model
+        # version; the previous version is kept for requests still using it
+        self._explainer_lock = threading.Lock()
+        self._explainers: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
         self._initialize()
     
+    @property
+    def rf_detector(self) -> Optional["RandomForestDetector"]:
+        """The RF detector of the current model set."""
+        return self.model_registry.current().rf_detector
+    
     def _initialize(self):
         """Initialize explainability components."""
-        try:
-            self.rf_detector = RandomForestDetector()
-            self.rf_detector.load_model(settings.random_forest_model_path)
-        except Exception as e:
-            logger.warning(f"Failed to load RF model for explainability: {e}")
-        
-        if settings.openai_api_key and settings.openai_api_key != "sk-test-key-please-replace":
+        if settings.llm_backend == "stub":
+            self.openai_client = StubLLMClient(latency=settings.llm_stub_latency)
+            logger.info("Using stub LLM backend for explanations")
+        elif settings.openai_api_key and settings.openai_api_key != "sk-test-key-please-replace":
             try:
+                from openai import OpenAI
                 self.openai_client = OpenAI(api_key=settings.openai_api_key)
             except TypeError as e:
                 # Handle OpenAI client version compatibility
@@ -44,32 +120,37 @@ class ExplainabilityService:
     def generate_shap_explanation(
         self,
         event_data: Dict[str, Any],
-        background_data: Optional[np.ndarray] = None
+        background_data: Optional[np.ndarray] = None,
+        features: Optional[Dict[str, float]] = None
     ) -> Dict[str, Any]:
-        """Generate SHAP explanation for event."""
-        if not self.rf_detector:
+        """Generate SHAP explanation for event.
+        
+        Pass already extracted features to avoid re-running feature extraction.
+        """
+        rf_detector = self.rf_detector
+        if not rf_detector:
             return {"error": "Random Forest model not available for SHAP"}
         
         try:
-            # Extract features
-            features = self.feature_extractor.extract_features(event_data)
-            feature_vector = np.array([features.get(name, 0.0) for name in self.rf_detector.feature_names]).reshape(1, -1)
+            feature_vector = self._feature_vector(event_data, features, rf_detector)
             
-            # Use TreeExplainer for Random Forest
-            explainer = shap.TreeExplainer(self.rf_detector.model)
+            # Use cached TreeExplainer for Random Forest
+            explainer = self._get_shap_explainer(rf_detector)
             
             # Generate SHAP values
             shap_values = explainer.shap_values(feature_vector)
             
             # Handle binary classification output
             if isinstance(shap_values, list):
-                shap_values = shap_values[1]  # Get values for positive class
-            
-            shap_values = shap_values[0]  # Get first (and only) sample
+                shap_values = shap_values[1][0]  # Positive class, first (and only) sample
+            elif shap_values.ndim == 3:
+                shap_values = shap_values[0, :, 1]  # Newer SHAP: (samples, features, classes)
+            else:
+                shap_values = shap_values[0]
             
             # Create feature importance mapping
             feature_importance = {}
-            for i, feature_name in enumerate(self.rf_detector.feature_names):
+            for i, feature_name in enumerate(rf_detector.feature_names):
                 feature_importance[feature_name] = float(shap_values[i])
             
             # Get top contributing features
@@ -84,10 +165,14 @@ class ExplainabilityService:
                 'negative': [f for f, v in sorted_features[:10] if v < 0]
             }
             
+            expected_value = explainer.expected_value
+            if isinstance(expected_value, (list, np.ndarray)):
+                expected_value = expected_value[1]
+            
             return {
                 'shap_values': feature_importance,
                 'top_features': top_features,
-                'base_value': float(explainer.expected_value[1] if isinstance(explainer.expected_value, np.ndarray) else explainer.expected_value)
+                'base_value': float(expected_value)
             }
         except Exception as e:
             logger.error(f"SHAP explanation error: {e}")
@@ -96,32 +181,29 @@ class ExplainabilityService:
     def generate_lime_explanation(
         self,
         event_data: Dict[str, Any],
-        training_data: Optional[np.ndarray] = None
+        training_data: Optional[np.ndarray] = None,
+        features: Optional[Dict[str, float]] = None
     ) -> Dict[str, Any]:
-        """Generate LIME explanation for event."""
-        if not self.rf_detector:
+        """Generate LIME explanation for event.
+        
+        Pass already extracted features to avoid re-running feature extraction.
+        """
+        rf_detector = self.rf_detector
+        if not rf_detector:
             return {"error": "Random Forest model not available for LIME"}
         
         try:
-            # Extract features
-            features = self.feature_extractor.extract_features(event_data)
-            feature_vector = np.array([features.get(name, 0.0) for name in self.rf_detector.feature_names]).reshape(1, -1)
+            feature_vector = self._feature_vector(event_data, features, rf_detector)
             
-            # Create dummy training data if not provided
+            # Reuse the cached explainer unless caller supplies its own training data
             if training_data is None:
-                # Generate random background data
-                training_data = np.random.rand(100, len(self.rf_detector.feature_names))
-            
-            # Create LIME explainer
-            explainer = lime_tabular.LimeTabularExplainer(
-                training_data,
-                feature_names=self.rf_detector.feature_names,
-                mode='classification'
-            )
+                explainer = self._get_lime_explainer(rf_detector)
+            else:
+                explainer = self._build_lime_explainer(training_data, rf_detector)
             
             # Define prediction function
             def predict_fn(X):
-                return self.rf_detector.model.predict_proba(X)
+                return rf_detector.predict_proba(X)
             
             # Generate explanation
             explanation = explainer.explain_instance(
@@ -143,6 +225,81 @@ class ExplainabilityService:
             logger.error(f"LIME explanation error: {e}")
             return {"error": str(e)}
     
+    def warm_up(self, event_data: Dict[str, Any], features: Dict[str, float]):
+        """Build the SHAP and LIME explainers for the current RF model and run SHAP once."""
+        rf_detector = self.rf_detector
+        if not rf_detector:
+            return
+        self.generate_shap_explanation(event_data, features=features)
+        self._get_lime_explainer(rf_detector)
+    
+    def _get_shap_explainer(self, rf_detector: "RandomForestDetector"):
+        """Return the TreeExplainer for an RF model, building it once per model version."""
+        import shap
+        
+        with self._explainer_lock:
+            explainers = self._explainers_for(rf_detector)
+            if 'shap' not in explainers:
+                explainers['shap'] = shap.TreeExplainer(rf_detector.explainer_model())
+                logger.info(f"SHAP explainer built for model {rf_detector.model_version}")
+            return explainers['shap']
+    
+    def _get_lime_explainer(self, rf_detector: "RandomForestDetector"):
+        """Return the LIME explainer for an RF model, building it once per model version."""
+        with self._explainer_lock:
+            explainers = self._explainers_for(rf_detector)
+            if 'lime' not in explainers:
+                explainers['lime'] = self._build_lime_explainer(self._load_background_data(rf_detector), rf_detector)
+                logger.info(f"LIME explainer built for model {rf_detector.model_version}")
+            return explainers['lime']
+    
+    def _explainers_for(self, rf_detector: "RandomForestDetector") -> Dict[str, Any]:
+        """Cached explainers of one RF model version; caller holds the explainer lock."""
+        version = rf_detector.model_version
+        if version not in self._explainers:
+            self._explainers[version] = {}
+            # Keep the newest two versions: the current one and the one in-flight requests may still use
+            while len(self._explainers) > 2:
+                self._explainers.popitem(last=False)
+        self._explainers.move_to_end(version)
+        return self._explainers[version]
+    
+    def _build_lime_explainer(self, training_data: np.ndarray, rf_detector: "RandomForestDetector"):
+        """Create a LIME explainer over the given background rows."""
+        from lime import lime_tabular
+        
+        return lime_tabular.LimeTabularExplainer(
+            training_data,
+            feature_names=rf_detector.feature_names,
+            mode='classification'
+        )
+    
+    def _load_background_data(self, rf_detector: "RandomForestDetector") -> np.ndarray:
+        """Load training-set background rows saved with the model, or from the configured file."""
+        if rf_detector.background_data is not None:
+            return np.asarray(rf_detector.background_data)
+        
+        background_path = Path(settings.explainer_background_path)
+        if background_path.exists():
+            background_data = np.load(background_path)
+            if background_data.ndim == 2 and background_data.shape[1] == len(rf_detector.feature_names):
+                return background_data
+            logger.warning(f"Ignoring explainer background {background_path}: shape {background_data.shape} does not match model")
+        
+        logger.warning("No training background data available for LIME; using random background. Retrain to save one with the model.")
+        return np.random.default_rng(42).random((100, len(rf_detector.feature_names)))
+    
+    def _feature_vector(
+        self,
+        event_data: Dict[str, Any],
+        features: Optional[Dict[str, float]],
+        rf_detector: "RandomForestDetector"
+    ) -> np.ndarray:
+        """Build a 1-row RF feature matrix, extracting features only if not supplied."""
+        if features is None:
+            features = self.feature_extractor.extract_features(event_data)
+        return self.feature_extractor.to_vector(features, rf_detector.feature_names).reshape(1, -1)
+    
     def generate_openai_explanation(
         self,
         event_data: Dict[str, Any],
@@ -185,7 +342,7 @@ Provide a professional security analyst explanation covering:
 4. Recommended investigation steps
 
 Keep the explanation concise, technical but accessible, and focused on actionable insights."""
-
+            
             response = self.openai_client.chat.completions.create(
                 model=settings.openai_model,
                 messages=[
@@ -206,28 +363,40 @@ Keep the explanation concise, technical but accessible, and focused on actionabl
         event_data: Dict[str, Any],
         features: Dict[str, float],
         malicious_score: float,
-        background_data: Optional[np.ndarray] = None
+        background_data: Optional[np.ndarray] = None,
+        methods: Optional[List[str]] = None,
+        shap_values: Optional[Dict[str, float]] = None
     ) -> Dict[str, Any]:
-        """Generate all types of explanations."""
+        """Generate explanations for the requested methods (all types by default).
+        
+        shap_values from an earlier run can be supplied so the OpenAI prompt
+        still gets them when SHAP itself is not requested.
+        """
+        if methods is None:
+            methods = ExplanationPolicy.METHODS
+        
         results = {}
         
         # SHAP
-        shap_result = self.generate_shap_explanation(event_data, background_data)
-        results['shap'] = shap_result
+        if 'shap' in methods:
+            shap_result = self.generate_shap_explanation(event_data, background_data, features=features)
+            results['shap'] = shap_result
+            shap_values = shap_result.get('shap_values', shap_values)
         
         # LIME
-        lime_result = self.generate_lime_explanation(event_data)
-        results['lime'] = lime_result
+        if 'lime' in methods:
+            lime_result = self.generate_lime_explanation(event_data, features=features)
+            results['lime'] = lime_result
         
         # OpenAI
-        shap_values = shap_result.get('shap_values') if 'shap_values' in shap_result else None
-        openai_explanation = self.generate_openai_explanation(
-            event_data,
-            features,
-            shap_values,
-            malicious_score
-        )
-        results['openai'] = openai_explanation
+        if 'openai' in methods:
+            openai_explanation = self.generate_openai_explanation(
+                event_data,
+                features,
+                shap_values,
+                malicious_score
+            )
+            results['openai'] = openai_explanation
         
         return results
 
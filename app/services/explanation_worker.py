@@ -0,0 +1,227 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, Optional, List
+from datetime import datetime
+import re
+import threading
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.database import Detection
+from app.models.schemas import DetectionResponse
+from app.services.explainability import ExplainabilityService
+from app.services.alerting import AlertingService
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+STATUS_SKIPPED = 'skipped'
+
+# Column holding each explanation method's result
+METHOD_COLUMNS = {
+    'shap': 'shap_values',
+    'lime': 'lime_explanation',
+    'openai': 'openai_explanation'
+}
+
+# explanation_error holds "method: error" entries joined by "; "
+_METHOD_ERROR = re.compile(r"(?:^|; )(%s): " % '|'.join(METHOD_COLUMNS))
+
+
+class ExplanationWorker:
+    """Background worker pool that fills in explanations after detections are stored.
+    
+    Each job runs in its own database session, writes SHAP, LIME and LLM
+    explanations onto the detection, records their status and sends the alert
+    for malicious detections once the analysis text is available. Methods
+    that fail are recorded in explanation_error as "method: error" entries
+    and are not tried again until explanation_retry_cooldown has passed.
+    """
+    
+    def __init__(
+        self,
+        explainability_service: ExplainabilityService,
+        alerting_service: AlertingService,
+        max_workers: int = None
+    ):
+        self.explainability_service = explainability_service
+        self.alerting_service = alerting_service
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.explanation_workers,
+            thread_name_prefix="explanation"
+        )
+        self._futures: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+    
+    def submit(
+        self,
+        detection_id: int,
+        event_data: Dict[str, Any],
+        features: Dict[str, float],
+        malicious_score: float,
+        methods: Optional[List[str]] = None,
+        send_alert: bool = True
+    ) -> Future:
+        """Queue explanation generation for a stored detection."""
+        with self._lock:
+            future = self._futures.get(detection_id)
+            if future is not None and not future.done():
+                return future
+            
+            future = self.executor.submit(
+                self.explain, detection_id, event_data, features, malicious_score, methods, send_alert
+            )
+            self._futures[detection_id] = future
+        
+        future.add_done_callback(lambda f: self._forget(detection_id, f))
+        return future
+    
+    def get_future(self, detection_id: int) -> Optional[Future]:
+        """Return the in-flight job for a detection, if any."""
+        with self._lock:
+            return self._futures.get(detection_id)
+    
+    def pending_count(self) -> int:
+        """Number of queued or running explanation jobs."""
+        with self._lock:
+            return len(self._futures)
+    
+    def explain(
+        self,
+        detection_id: int,
+        event_data: Dict[str, Any],
+        features: Dict[str, float],
+        malicious_score: float,
+        methods: Optional[List[str]] = None,
+        send_alert: bool = True
+    ) -> Optional[str]:
+        """Generate and store explanations for a detection; returns the final status.
+        
+        Only the requested methods are generated (all by default); explanations
+        already stored on the detection are kept.
+        """
+        db = SessionLocal()
+        try:
+            detection = db.get(Detection, detection_id)
+            if detection is None:
+                logger.warning(f"Explanation skipped, detection {detection_id} not found")
+                return None
+            
+            detection.explanation_status = STATUS_RUNNING
+            db.commit()
+            
+            return self.explain_detection(
+                db, detection, event_data, features, malicious_score, methods, send_alert
+            )
+        except Exception as e:
+            logger.error(f"Explanation job error for detection {detection_id}: {e}")
+            db.rollback()
+            return STATUS_FAILED
+        finally:
+            db.close()
+    
+    def explain_detection(
+        self,
+        db: Session,
+        detection: Detection,
+        event_data: Dict[str, Any],
+        features: Dict[str, float],
+        malicious_score: float,
+        methods: Optional[List[str]] = None,
+        send_alert: bool = True
+    ) -> str:
+        """Generate explanations for a detection in the caller's session and store them with one commit."""
+        try:
+            explanations = self.explainability_service.generate_all_explanations(
+                event_data,
+                features,
+                malicious_score,
+                methods=methods,
+                shap_values=detection.shap_values
+            )
+            self._apply_explanations(detection, explanations)
+            detection.explanation_status = STATUS_COMPLETED
+        except Exception as e:
+            logger.error(f"Explanation failed for detection {detection.id}: {e}")
+            detection.explanation_status = STATUS_FAILED
+            attempted = list(METHOD_COLUMNS) if methods is None else methods
+            self._record_errors(detection, {method: str(e) for method in attempted}, attempted)
+        
+        detection.explained_at = datetime.now()
+        db.commit()
+        
+        # Send alert if threshold exceeded, now that the analysis is attached
+        if send_alert and detection.is_malicious:
+            self.alerting_service.submit_alert(
+                DetectionResponse.from_orm(detection),
+                event_data
+            )
+        
+        return detection.explanation_status
+    
+    def missing_methods(self, detection: Detection) -> List[str]:
+        """Explanation methods worth running for the detection.
+        
+        These are methods without a stored result that were never tried, or
+        that failed at least explanation_retry_cooldown seconds ago.
+        """
+        failed = self.method_errors(detection)
+        retry_failed = (
+            detection.explained_at is None
+            or (datetime.now() - detection.explained_at).total_seconds() >= settings.explanation_retry_cooldown
+        )
+        return [
+            method for method, column in METHOD_COLUMNS.items()
+            if getattr(detection, column) is None and (method not in failed or retry_failed)
+        ]
+    
+    @staticmethod
+    def method_errors(detection: Detection) -> Dict[str, str]:
+        """Error of each method whose last attempt failed, parsed from explanation_error."""
+        if not detection.explanation_error:
+            return {}
+        parts = _METHOD_ERROR.split(detection.explanation_error)
+        if parts[0]:
+            # Written before errors were recorded per method: count it against every method
+            return {method: detection.explanation_error for method in METHOD_COLUMNS}
+        return dict(zip(parts[1::2], parts[2::2]))
+    
+    def shutdown(self, wait: bool = True):
+        """Stop accepting jobs and optionally wait for queued ones to finish."""
+        self.executor.shutdown(wait=wait)
+    
+    def _apply_explanations(self, detection: Detection, explanations: Dict[str, Any]):
+        """Copy generated explanations onto the detection row."""
+        if 'shap' in explanations and 'shap_values' in explanations['shap']:
+            detection.shap_values = explanations['shap']['shap_values']
+        
+        if 'lime' in explanations and 'lime_explanation' in explanations['lime']:
+            detection.lime_explanation = explanations['lime']['lime_explanation']
+        
+        if 'openai' in explanations:
+            detection.openai_explanation = explanations['openai']
+        
+        errors = {
+            method: result['error']
+            for method, result in explanations.items()
+            if isinstance(result, dict) and 'error' in result
+        }
+        self._record_errors(detection, errors, explanations)
+    
+    def _record_errors(self, detection: Detection, errors: Dict[str, str], attempted):
+        """Store the errors of this run, keeping earlier errors of methods not attempted and still missing."""
+        kept = {
+            method: error for method, error in self.method_errors(detection).items()
+            if method not in attempted and getattr(detection, METHOD_COLUMNS[method]) is None
+        }
+        kept.update(errors)
+        detection.explanation_error = "; ".join(f"{method}: {error}" for method, error in kept.items()) or None
+    
+    def _forget(self, detection_id: int, future: Future):
+        """Drop a finished job from the in-flight table."""
+        with self._lock:
+            if self._futures.get(detection_id) is future:
+                del self._futures[detection_id]
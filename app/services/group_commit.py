@@ -0,0 +1,582 @@
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from sqlalchemy import insert
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.database import Event, Detection
+from app.services.stats_rollup import StatsRollup
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Sentinel that stops the writer thread
+_STOP = object()
+
+# Columns stored as ISO strings in the spool file
+_DATETIME_FIELDS = ('timestamp', 'created_at', 'explained_at', 'feedback_timestamp')
+
+# Spool slots per spool path: group_commit.jsonl, group_commit.1.jsonl, ...
+MAX_SPOOL_SLOTS = 64
+
+# Seconds to wait before retrying a failed database write, doubled per attempt up to the maximum
+RETRY_BACKOFF_INITIAL = 0.5
+RETRY_BACKOFF_MAX = 30.0
+
+
+class GroupCommitFullError(RuntimeError):
+    """Raised when the group-commit buffer stays full for longer than the enqueue timeout."""
+
+
+class GroupCommitDeferredError(RuntimeError):
+    """Set on futures whose rows could not be written yet; they stay spooled and are written later."""
+
+
+class GroupCommitWriter:
+    """Commits scored events from many callers in shared bulk transactions.
+    
+    This is group commit, not write-behind: callers wait on their futures
+    until the transaction holding their rows has committed, since responses,
+    explanations and alerts need the detection IDs.
+    
+    Callers submit an Event and its Detection and get a Future. A writer
+    thread collects submissions until flush_rows are buffered or
+    flush_interval_ms has passed, inserts all events and then all detections
+    with one multi-row INSERT ... RETURNING each, commits once and resolves
+    each future with its detection, now carrying its database ID and
+    attachable to a session without a reload.
+    
+    At most max_pending submissions are buffered; further submits wait for
+    room and raise GroupCommitFullError after enqueue_timeout seconds. Every
+    submission is appended to a JSONL spool file before it is buffered and
+    the highest committed sequence number is kept in an offset file, so rows
+    buffered when the process died are inserted on the next start. Rows are
+    committed in sequence order, so committed rows are a prefix of the
+    spool; it is emptied whenever nothing is buffered, and rewritten without
+    that prefix once it reaches spool_compact_bytes, which bounds the file
+    under sustained load.
+    
+    Each writer locks a spool slot of its own for its lifetime: the first
+    of spool_path, then spool_path with .1, .2, ... before the suffix, that
+    no other process holds, so uvicorn workers sharing one setting each
+    get their own spool and offset file. A restarted worker takes over a
+    free slot and replays it, and at start a writer also replays spools of
+    higher slots no process holds, e.g. after the worker count dropped.
+    
+    If a database write fails, the batch's futures fail with
+    GroupCommitDeferredError and the writer retries the same batch with
+    exponential backoff, holding its buffer room so new submissions back
+    up. Rows stay spooled and the committed offset only advances past rows
+    that were written, so a writer shut down during an outage leaves them
+    to be replayed at the next start.
+    """
+    
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        flush_rows: int = None,
+        flush_interval_ms: float = None,
+        max_pending: int = None,
+        enqueue_timeout: float = None,
+        spool_path: str = None,
+        spool_compact_bytes: int = None
+    ):
+        self.session_factory = session_factory
+        self.stats_rollup = StatsRollup()
+        self.flush_rows = max(1, flush_rows or settings.group_commit_flush_rows)
+        self.flush_interval_ms = flush_interval_ms if flush_interval_ms is not None else settings.group_commit_flush_interval_ms
+        self.max_pending = max(1, max_pending or settings.group_commit_max_pending)
+        self.enqueue_timeout = enqueue_timeout if enqueue_timeout is not None else settings.group_commit_enqueue_timeout
+        
+        self._queue: "queue.Queue" = queue.Queue()
+        self._capacity = threading.BoundedSemaphore(self.max_pending)
+        self._closed = False
+        self._stopping = threading.Event()
+        
+        # Spool state; the lock keeps sequence numbers, spool order and queue order identical
+        self.base_spool_path = Path(spool_path or settings.group_commit_spool_path)
+        self.base_spool_path.parent.mkdir(parents=True, exist_ok=True)
+        self.spool_path, self._slot_lock = self._claim_spool_slot()
+        self.offset_path = self._offset_path(self.spool_path)
+        self.spool_compact_bytes = max(1, spool_compact_bytes or settings.group_commit_spool_compact_bytes)
+        self._spool_lock = threading.Lock()
+        self._committed_seq = self._read_offset(self.offset_path)
+        self._last_seq = self._committed_seq
+        self._spool = None
+        # (seq, end offset) of each uncommitted spool record in order, the spool size, and the end of its committed prefix
+        self._spool_ends: "deque[Tuple[int, int]]" = deque()
+        self._spool_size = 0
+        self._committed_end = 0
+        self._replay_records = self._load_spool()
+        
+        self._stats_lock = threading.Lock()
+        self.rows_written = 0
+        self.batches = 0
+        self.errors = 0
+        self.rejected = 0
+        self.replayed = 0
+        
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+    
+    def submit(self, event: Event, detection: Detection) -> Future:
+        """Buffer one event and its detection; the future resolves to the stored detection."""
+        return self.submit_many([(event, detection)])[0]
+    
+    def submit_many(self, pairs: List[Tuple[Event, Detection]]) -> List[Future]:
+        """Buffer (event, detection) pairs, waiting for room if the buffer is full."""
+        if self._closed:
+            raise RuntimeError("Group-commit writer is shut down")
+        
+        deadline = time.monotonic() + self.enqueue_timeout
+        acquired = 0
+        try:
+            for _ in pairs:
+                if not self._capacity.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                    raise GroupCommitFullError(
+                        f"Group-commit buffer full ({self.max_pending} pending rows)"
+                    )
+                acquired += 1
+        except GroupCommitFullError:
+            for _ in range(acquired):
+                self._capacity.release()
+            with self._stats_lock:
+                self.rejected += len(pairs)
+            raise
+        
+        items = []
+        for event, detection in pairs:
+            items.append({
+                'event': event,
+                'detection': detection,
+                'event_row': self._column_values(event),
+                'detection_row': self._column_values(detection),
+                'future': Future()
+            })
+        
+        with self._spool_lock:
+            records = []
+            for item in items:
+                self._last_seq += 1
+                item['seq'] = self._last_seq
+                records.append({
+                    'seq': item['seq'],
+                    'event': self._encode_row(item['event_row']),
+                    'detection': self._encode_row(item['detection_row'])
+                })
+            self._append_spool(records)
+            for item in items:
+                self._queue.put(item)
+        
+        return [item['future'] for item in items]
+    
+    def pending_count(self) -> int:
+        """Rows buffered but not yet committed."""
+        return self._queue.qsize()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Buffer, flush and spool counters."""
+        with self._stats_lock:
+            return {
+                'pending': self.pending_count(),
+                'max_pending': self.max_pending,
+                'flush_rows': self.flush_rows,
+                'flush_interval_ms': self.flush_interval_ms,
+                'rows_written': self.rows_written,
+                'batches': self.batches,
+                'mean_batch_size': self.rows_written / self.batches if self.batches else 0.0,
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'replayed': self.replayed,
+                'committed_seq': self._committed_seq,
+                'spool_path': str(self.spool_path)
+            }
+    
+    def shutdown(self, wait: bool = True):
+        """Stop accepting rows and write everything still buffered."""
+        if self._closed:
+            return
+        self._closed = True
+        self._stopping.set()
+        self._queue.put(_STOP)
+        if wait:
+            self._thread.join()
+    
+    def _run(self):
+        """Writer thread: replay spools and write batches until stopped, then release the spool slot."""
+        try:
+            self._replay_orphaned_spools()
+            self._write_until_stopped()
+        finally:
+            if self._spool is not None:
+                self._spool.close()
+            self._slot_lock.close()
+    
+    def _write_until_stopped(self):
+        """Writer loop: replay the spool, then collect and write batches until stopped."""
+        # New rows wait until spooled rows are stored, so the committed offset never skips them
+        attempt = 0
+        while self._replay_records and not self._replay_spool():
+            if not self._wait_to_retry(attempt):
+                self._fail_pending(GroupCommitDeferredError(
+                    "Group-commit writer stopped before the spool was replayed; rows stay spooled for the next start"
+                ))
+                return
+            attempt += 1
+        
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval_ms / 1000.0
+            while len(batch) < self.flush_rows:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            if not self._flush(batch):
+                self._fail_pending(GroupCommitDeferredError(
+                    "Group-commit writer stopped while the database was failing; rows stay spooled for the next start"
+                ))
+                return
+    
+    def _flush(self, batch: List[Dict[str, Any]]) -> bool:
+        """Write one batch in a single transaction, retrying until it succeeds; returns False if stopped first."""
+        attempt = 0
+        while True:
+            try:
+                event_ids, detection_ids = self._write_rows(
+                    [item['event_row'] for item in batch],
+                    [item['detection_row'] for item in batch]
+                )
+                break
+            except Exception as e:
+                logger.error(f"Group-commit flush of {len(batch)} rows failed, retrying: {e}")
+                with self._stats_lock:
+                    self.errors += 1
+                if attempt == 0:
+                    # The rows stay spooled and are written on a later attempt, so callers must not resubmit
+                    error = GroupCommitDeferredError(
+                        f"Database write failed ({e}); {len(batch)} rows are spooled and will be written when it succeeds"
+                    )
+                    for item in batch:
+                        item['future'].set_exception(error)
+                if not self._wait_to_retry(attempt):
+                    return False
+                attempt += 1
+        
+        with self._stats_lock:
+            self.rows_written += len(batch)
+            self.batches += 1
+        for item, event_id, detection_id in zip(batch, event_ids, detection_ids):
+            if not item['future'].done():
+                item['future'].set_result(self._stored_detection(item, event_id, detection_id))
+        for _ in batch:
+            self._capacity.release()
+        self._mark_committed(batch[-1]['seq'])
+        return True
+    
+    def _wait_to_retry(self, attempt: int) -> bool:
+        """Back off before retrying a failed write; returns False if the writer was shut down meanwhile."""
+        delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_INITIAL * 2 ** attempt)
+        return not self._stopping.wait(delay)
+    
+    def _write_rows(self, event_rows: List[Dict[str, Any]], detection_rows: List[Dict[str, Any]]) -> Tuple[List[int], List[int]]:
+        """Bulk insert events, then detections pointing at them, and commit; returns the new IDs."""
+        db = self.session_factory()
+        try:
+            event_ids = db.execute(
+                insert(Event).returning(Event.id, sort_by_parameter_order=True),
+                event_rows
+            ).scalars().all()
+            
+            detection_rows = [dict(row, event_id=event_id) for row, event_id in zip(detection_rows, event_ids)]
+            detection_ids = db.execute(
+                insert(Detection).returning(Detection.id, sort_by_parameter_order=True),
+                detection_rows
+            ).scalars().all()
+            
+            self.stats_rollup.record_inserts(db, len(event_ids), [row.get('is_malicious') for row in detection_rows])
+            db.commit()
+            return event_ids, detection_ids
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    
+    def _stored_detection(self, item: Dict[str, Any], event_id: int, detection_id: int) -> Detection:
+        """Give the submitted objects their row values and IDs, detached and ready to add to a session."""
+        event, detection = item['event'], item['detection']
+        for key, value in item['event_row'].items():
+            setattr(event, key, value)
+        for key, value in item['detection_row'].items():
+            setattr(detection, key, value)
+        event.id = event_id
+        detection.id = detection_id
+        detection.event_id = event_id
+        
+        make_transient_to_detached(event)
+        make_transient_to_detached(detection)
+        set_committed_value(detection, 'event', event)
+        return detection
+    
+    @staticmethod
+    def _column_values(instance) -> Dict[str, Any]:
+        """Column values for an unsaved ORM instance, with column defaults applied."""
+        values = {}
+        for column in instance.__table__.columns:
+            if column.primary_key:
+                continue
+            value = getattr(instance, column.key)
+            if value is None and column.default is not None:
+                # Scalar defaults are used as-is; SQL defaults here are all func.now()
+                value = column.default.arg if column.default.is_scalar else datetime.now()
+            values[column.key] = value
+        return values
+    
+    def _load_spool(self) -> List[Dict[str, Any]]:
+        """Read spooled records newer than the committed offset and continue their sequence."""
+        if not self.spool_path.exists():
+            return []
+        
+        records, ends, self._committed_end, size = self._scan_spool(self.spool_path, self._committed_seq)
+        self._spool_ends.extend(ends)
+        if records:
+            self._last_seq = records[-1]['seq']
+            # Cut a torn line so appended records start on a line of their own
+            os.truncate(self.spool_path, size)
+            self._spool_size = size
+            logger.warning(f"{len(records)} spooled detections were not committed before shutdown, replaying")
+        else:
+            self._committed_end = 0
+            open(self.spool_path, 'w').close()
+        return records
+    
+    @staticmethod
+    def _scan_spool(path: Path, committed_seq: int) -> Tuple[List[Dict[str, Any]], List[Tuple[int, int]], int, int]:
+        """Records of a spool file newer than committed_seq, their (seq, end offset), the end of the committed prefix and the size without a torn line."""
+        records, ends = [], []
+        committed_end = size = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # A torn final line from a crash mid-write
+                    break
+                size += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record['seq'] > committed_seq:
+                    records.append(record)
+                    ends.append((record['seq'], size))
+                elif not records:
+                    committed_end = size
+        return records, ends, committed_end, size
+    
+    def _replay_orphaned_spools(self):
+        """Insert and remove uncommitted rows of spool slots no process holds; a slot that fails is left for the next start."""
+        for slot in range(MAX_SPOOL_SLOTS):
+            path = self._slot_path(slot)
+            if path == self.spool_path or not path.exists():
+                continue
+            lock = self._lock_slot(path)
+            if lock is None:
+                continue
+            try:
+                offset_path = self._offset_path(path)
+                records = self._scan_spool(path, self._read_offset(offset_path))[0]
+                if records:
+                    logger.warning(f"{len(records)} detections in the spool of a stopped process ({path}), replaying")
+                for start in range(0, len(records), self.flush_rows):
+                    chunk = records[start:start + self.flush_rows]
+                    self._write_rows(
+                        [self._decode_row(record['event']) for record in chunk],
+                        [self._decode_row(record['detection']) for record in chunk]
+                    )
+                    self._write_offset(chunk[-1]['seq'], offset_path)
+                    with self._stats_lock:
+                        self.replayed += len(chunk)
+                path.unlink()
+                offset_path.unlink(missing_ok=True)
+            except Exception as e:
+                logger.error(f"Group-commit replay of {path} failed, leaving it for the next start: {e}")
+            finally:
+                lock.close()
+    
+    def _replay_spool(self) -> bool:
+        """Insert spooled rows that were never committed; returns False if the database write failed."""
+        try:
+            while self._replay_records:
+                chunk = self._replay_records[:self.flush_rows]
+                self._write_rows(
+                    [self._decode_row(record['event']) for record in chunk],
+                    [self._decode_row(record['detection']) for record in chunk]
+                )
+                del self._replay_records[:len(chunk)]
+                with self._stats_lock:
+                    self.replayed += len(chunk)
+                self._mark_committed(chunk[-1]['seq'])
+        except Exception as e:
+            logger.error(f"Group-commit spool replay failed, retrying: {e}")
+            return False
+        return True
+    
+    def _fail_pending(self, error: Exception):
+        """Fail every buffered submission."""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP:
+                item['future'].set_exception(error)
+    
+    def _append_spool(self, records: List[Dict[str, Any]]):
+        """Append records to the spool file; caller holds the spool lock."""
+        if self._spool is None:
+            self._spool = open(self.spool_path, 'a', encoding='utf-8', newline='\n')
+        lines = [json.dumps(record) + '\n' for record in records]
+        self._spool.write(''.join(lines))
+        self._spool.flush()
+        for record, line in zip(records, lines):
+            # json.dumps escapes non-ASCII characters, so each character is one byte
+            self._spool_size += len(line)
+            self._spool_ends.append((record['seq'], self._spool_size))
+        if settings.group_commit_spool_fsync:
+            os.fsync(self._spool.fileno())
+    
+    def _mark_committed(self, seq: int):
+        """Record the highest handled sequence number; empty the spool once nothing is buffered, or compact it."""
+        with self._spool_lock:
+            self._committed_seq = max(self._committed_seq, seq)
+            self._write_offset(self._committed_seq)
+            while self._spool_ends and self._spool_ends[0][0] <= self._committed_seq:
+                self._committed_end = self._spool_ends.popleft()[1]
+            if self._committed_seq >= self._last_seq:
+                self._truncate_spool()
+            elif self._committed_end >= self.spool_compact_bytes:
+                self._compact_spool()
+    
+    def _truncate_spool(self):
+        """Empty the spool file; caller holds the spool lock."""
+        if self._spool is not None:
+            self._spool.truncate(0)
+            self._spool.flush()
+        elif self.spool_path.exists():
+            open(self.spool_path, 'w').close()
+        self._spool_ends.clear()
+        self._spool_size = 0
+        self._committed_end = 0
+    
+    def _compact_spool(self):
+        """Replace the spool with a copy of its uncommitted records; caller holds the spool lock."""
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        
+        tmp_path = self.spool_path.with_suffix(self.spool_path.suffix + '.compact')
+        with open(self.spool_path, 'rb') as source, open(tmp_path, 'wb') as target:
+            source.seek(self._committed_end)
+            shutil.copyfileobj(source, target)
+            if settings.group_commit_spool_fsync:
+                target.flush()
+                os.fsync(target.fileno())
+        os.replace(tmp_path, self.spool_path)
+        
+        self._spool_ends = deque((seq, end - self._committed_end) for seq, end in self._spool_ends)
+        self._spool_size -= self._committed_end
+        self._committed_end = 0
+    
+    def _claim_spool_slot(self) -> Tuple[Path, Any]:
+        """Spool path of the first slot no other process holds, and its open lock file."""
+        for slot in range(MAX_SPOOL_SLOTS):
+            path = self._slot_path(slot)
+            lock = self._lock_slot(path)
+            if lock is not None:
+                return path, lock
+        raise RuntimeError(f"All {MAX_SPOOL_SLOTS} group-commit spool slots of {self.base_spool_path} are in use")
+    
+    def _slot_path(self, slot: int) -> Path:
+        """Spool path of a slot: the configured path for slot 0, name.N.suffix for the others."""
+        if slot == 0:
+            return self.base_spool_path
+        return self.base_spool_path.with_name(f"{self.base_spool_path.stem}.{slot}{self.base_spool_path.suffix}")
+    
+    @staticmethod
+    def _lock_slot(path: Path):
+        """Open and lock the lock file of a spool path without waiting; None if another process holds it.
+        
+        The operating system releases the lock when the file is closed or the process exits.
+        """
+        lock = open(path.with_suffix(path.suffix + '.lock'), 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock.close()
+            return None
+        return lock
+    
+    @staticmethod
+    def _offset_path(spool_path: Path) -> Path:
+        return spool_path.with_suffix(spool_path.suffix + '.offset')
+    
+    @staticmethod
+    def _read_offset(offset_path: Path) -> int:
+        """Highest committed sequence number from a previous run."""
+        try:
+            return int(offset_path.read_text().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+    
+    def _write_offset(self, seq: int, offset_path: Path = None):
+        """Atomically replace the offset file (default: this writer's)."""
+        offset_path = offset_path or self.offset_path
+        tmp_path = offset_path.with_suffix('.tmp')
+        tmp_path.write_text(str(seq))
+        os.replace(tmp_path, offset_path)
+    
+    @staticmethod
+    def _encode_row(row: Dict[str, Any]) -> Dict[str, Any]:
+        """JSON-safe copy of a row for the spool."""
+        return {
+            key: value.isoformat() if key in _DATETIME_FIELDS and isinstance(value, datetime) else value
+            for key, value in row.items()
+        }
+    
+    @staticmethod
+    def _decode_row(row: Dict[str, Any]) -> Dict[str, Any]:
+        """Inverse of _encode_row."""
+        return {
+            key: datetime.fromisoformat(value) if key in _DATETIME_FIELDS and isinstance(value, str) else value
+            for key, value in row.items()
+        }
@@ -0,0 +1,173 @@
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, List, Tuple
+import queue
+import threading
+import time
+import numpy as np
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Sentinel that stops the dispatch thread
+_STOP = object()
+
+
+class MicroBatchScheduler:
+    """Coalesces concurrent single-row predictions into one vectorized model call.
+    
+    Callers submit a feature vector and get a Future. A dispatch thread takes
+    the first queued vector and, if nothing else is queued, scores it at once,
+    so a lone request never waits; vectors submitted meanwhile queue up and
+    form the next batch. If more are already queued it keeps collecting
+    until max_batch_size vectors are queued or max_wait_ms has passed. It
+    then scores the stacked matrix with one
+    predict_batch(matrix, model) call per distinct model the vectors were
+    submitted for (one, except across a model reload) and resolves every
+    caller's future. Queue depth seen by
+    callers and dispatched batch sizes are kept as power-of-two histograms.
+    """
+    
+    def __init__(
+        self,
+        predict_batch: Callable[[np.ndarray, Any], np.ndarray],
+        name: str,
+        max_batch_size: int = None,
+        max_wait_ms: float = None
+    ):
+        self.predict_batch = predict_batch
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size or settings.micro_batch_max_size)
+        self.max_wait_ms = max_wait_ms if max_wait_ms is not None else settings.micro_batch_max_wait_ms
+        
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._queue_depths: Dict[str, int] = {}
+        self._batch_sizes: Dict[str, int] = {}
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        # Makes the closed check and the put atomic with shutdown, so nothing is queued behind the stop sentinel
+        self._submit_lock = threading.Lock()
+        self._closed = False
+        
+        self._thread = threading.Thread(target=self._run, name=f"micro-batch-{name}", daemon=True)
+        self._thread.start()
+    
+    def submit(self, feature_vector: np.ndarray, model: Any = None) -> Future:
+        """Queue one feature vector to be scored by model; the future resolves to its score."""
+        item = (np.asarray(feature_vector, dtype=np.float32).reshape(-1), Future(), model)
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError(f"Micro-batch scheduler '{self.name}' is shut down")
+            with self._stats_lock:
+                self._record(self._queue_depths, self._queue.qsize())
+                self.requests += 1
+            self._queue.put(item)
+        return item[1]
+    
+    def predict(self, feature_vector: np.ndarray, model: Any = None) -> float:
+        """Score one feature vector, waiting for the batch it joins."""
+        return self.submit(feature_vector, model).result()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Request and batch counters with queue-depth and batch-size histograms."""
+        with self._stats_lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait_ms,
+                'requests': self.requests,
+                'batches': self.batches,
+                'errors': self.errors,
+                'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+                'queue_depth': self._sorted_histogram(self._queue_depths),
+                'batch_size': self._sorted_histogram(self._batch_sizes)
+            }
+    
+    def shutdown(self, wait: bool = True):
+        """Stop accepting vectors; queued vectors are still scored."""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        if wait:
+            self._thread.join()
+    
+    def _run(self):
+        """Dispatch loop: collect a batch, score it, resolve futures."""
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait_ms / 1000.0
+            # Only wait for more vectors when there is concurrent load to batch
+            while len(batch) < self.max_batch_size and (len(batch) > 1 or not self._queue.empty()):
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            self._dispatch(batch)
+        
+        self._fail_pending(RuntimeError(f"Micro-batch scheduler '{self.name}' is shut down"))
+    
+    def _fail_pending(self, error: Exception):
+        """Fail every vector still queued, so no caller waits on a future that will never resolve."""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP:
+                item[1].set_exception(error)
+    
+    def _dispatch(self, batch: List[Tuple[np.ndarray, Future, Any]]):
+        """Score one batch with a single model call per model."""
+        with self._stats_lock:
+            self._record(self._batch_sizes, len(batch))
+            self.batches += 1
+        
+        groups: Dict[int, List[Tuple[np.ndarray, Future, Any]]] = {}
+        for item in batch:
+            groups.setdefault(id(item[2]), []).append(item)
+        
+        for group in groups.values():
+            try:
+                scores = self.predict_batch(np.vstack([vector for vector, _, _ in group]), group[0][2])
+            except Exception as e:
+                logger.error(f"Micro-batch prediction error ({self.name}, {len(group)} rows): {e}")
+                with self._stats_lock:
+                    self.errors += 1
+                for _, future, _ in group:
+                    future.set_exception(e)
+                continue
+            
+            for (_, future, _), score in zip(group, scores):
+                future.set_result(float(score))
+    
+    @staticmethod
+    def _bucket(value: int) -> str:
+        """Power-of-two histogram bucket label: 0, 1, 2, 3-4, 5-8, ..."""
+        if value <= 2:
+            return str(value)
+        upper = 1 << (value - 1).bit_length()
+        return f"{upper // 2 + 1}-{upper}"
+    
+    def _record(self, histogram: Dict[str, int], value: int):
+        """Count one observation; caller holds the stats lock."""
+        bucket = self._bucket(value)
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+    
+    @staticmethod
+    def _sorted_histogram(histogram: Dict[str, int]) -> Dict[str, int]:
+        """Histogram ordered by bucket lower bound."""
+        return dict(sorted(histogram.items(), key=lambda item: int(item[0].split('-')[0])))
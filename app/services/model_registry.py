@@ -0,0 +1,207 @@
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Any, List, Optional, Tuple
+import threading
+from app.core.config import settings
+import logging
+
+if TYPE_CHECKING:
+    # sklearn and torch are imported when the models are first loaded
+    from app.ml.random_forest_model import RandomForestDetector
+    from app.ml.lstm_model import LSTMDetector
+
+logger = logging.getLogger(__name__)
+
+# (mtime_ns, size) of a model file, or None if it does not exist
+FileState = Optional[Tuple[int, int]]
+
+
+class ModelSet:
+    """One version of the loaded models; never modified after it is published.
+    
+    A detector is None if its model could not be loaded.
+    """
+    
+    def __init__(
+        self,
+        version: int,
+        rf_detector: Optional["RandomForestDetector"],
+        lstm_detector: Optional["LSTMDetector"],
+        files: Dict[str, FileState]
+    ):
+        self.version = version
+        self.rf_detector = rf_detector
+        self.lstm_detector = lstm_detector
+        self.files = files
+        self.loaded_at = datetime.now()
+    
+    @property
+    def model_version(self) -> str:
+        """Combined version of the model files, part of every score cache key."""
+        rf_version = getattr(self.rf_detector, 'model_version', None)
+        lstm_version = getattr(self.lstm_detector, 'model_version', None)
+        return f"rf={rf_version};lstm={lstm_version}"
+    
+    def describe(self) -> Dict[str, Any]:
+        """Version details for the admin API and logs."""
+        return {
+            'version': self.version,
+            'model_version': self.model_version,
+            'loaded_at': self.loaded_at,
+            'random_forest': getattr(self.rf_detector, 'model_version', None),
+            'lstm': getattr(self.lstm_detector, 'model_version', None)
+        }
+
+
+class ModelRegistry:
+    """Process-wide owner of the Random Forest and LSTM models.
+    
+    Models are loaded once per process, on the first current() call (the
+    startup warm-up, or else the first request), and shared by detection
+    and explainability. current() returns the published ModelSet; callers use
+    the set they got for the whole request, so a reload only affects
+    requests that start after it and in-flight ones finish on the old
+    models, which are freed once nothing refers to them. A reload loads the
+    changed files into new detectors and publishes them with one reference
+    swap; a file that fails to load keeps its previous model. With
+    MODEL_WATCH_INTERVAL set, a thread reloads when a model file's mtime or
+    size changes; replace model files with an atomic rename. MODEL_MEMORY_MODE
+    "mmap" shares the model memory between worker processes.
+    """
+    
+    def __init__(self, rf_model_path: str = None, lstm_model_path: str = None):
+        self.rf_model_path = rf_model_path or settings.random_forest_model_path
+        self.lstm_model_path = lstm_model_path or settings.lstm_model_path
+        self.memory_mode = settings.model_memory_mode
+        if self.memory_mode not in ('private', 'mmap'):
+            raise ValueError(f"Unknown model memory mode: {self.memory_mode}")
+        self._reload_lock = threading.Lock()
+        self._listeners: List[Callable[[ModelSet], None]] = []
+        self._current: Optional[ModelSet] = None
+        
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def current(self) -> ModelSet:
+        """The models to use for a request, loading them if this is the first call."""
+        models = self._current
+        if models is None:
+            with self._reload_lock:
+                if self._current is None:
+                    self._current = self._load(None)
+                models = self._current
+        return models
+    
+    @property
+    def loaded(self) -> bool:
+        """Whether the models have been loaded."""
+        return self._current is not None
+    
+    def mapped_paths(self) -> List[str]:
+        """Files and directories the models are memory-mapped from in "mmap" mode."""
+        return [settings.model_mmap_dir, self.lstm_model_path]
+    
+    def add_listener(self, callback: Callable[[ModelSet], None]):
+        """Call back with the new ModelSet after every reload."""
+        self._listeners.append(callback)
+    
+    def reload(self, force: bool = True) -> Dict[str, Any]:
+        """Load changed model files (all files with force) and publish them as a new version."""
+        with self._reload_lock:
+            previous = self._current
+            if not force and previous is not None and self._file_states() == previous.files:
+                return {'reloaded': False, **previous.describe()}
+            
+            models = self._load(previous, force)
+            self._current = models
+            for callback in self._listeners:
+                try:
+                    callback(models)
+                except Exception as e:
+                    logger.error(f"Model reload listener failed: {e}")
+        
+        logger.info(f"Published models version {models.version}: {models.model_version}")
+        return {'reloaded': True, **models.describe()}
+    
+    def start_watching(self, interval: float = None):
+        """Check the model files every interval seconds in a background thread."""
+        interval = settings.model_watch_interval if interval is None else interval
+        if self._thread is not None or interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._watch, args=(interval,), name="model-watch", daemon=True)
+        self._thread.start()
+    
+    def shutdown(self, wait: bool = True):
+        """Stop the watcher thread."""
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+    
+    def _watch(self, interval: float):
+        """Watcher loop: reload when a model file changes."""
+        while not self._stop.wait(interval):
+            try:
+                self.reload(force=False)
+            except Exception as e:
+                logger.error(f"Model reload failed: {e}")
+    
+    def _load(self, previous: Optional[ModelSet], force: bool = True) -> ModelSet:
+        """Build the next ModelSet, reusing detectors whose files have not changed."""
+        from app.ml.random_forest_model import RandomForestDetector
+        from app.ml.lstm_model import LSTMDetector, configure_threads
+        
+        configure_threads(settings.torch_num_threads, settings.torch_interop_threads)
+        
+        files = self._file_states()
+        rf_detector = previous.rf_detector if previous else None
+        lstm_detector = previous.lstm_detector if previous else None
+        
+        if previous is None or force or files[self.rf_model_path] != previous.files.get(self.rf_model_path):
+            try:
+                detector = RandomForestDetector(
+                    inference_backend=settings.rf_inference_backend,
+                    mmap_dir=settings.model_mmap_dir if self.memory_mode == 'mmap' else None
+                )
+                detector.load_model(self.rf_model_path)
+                rf_detector = detector
+                logger.info("Random Forest model loaded successfully")
+            except Exception as e:
+                logger.warning(f"Failed to load Random Forest model: {e}")
+        
+        if previous is None or force or files[self.lstm_model_path] != previous.files.get(self.lstm_model_path):
+            try:
+                detector = LSTMDetector(
+                    mmap=self.memory_mode == 'mmap',
+                    inference_backend=settings.lstm_inference_backend
+                )
+                detector.load_model(self.lstm_model_path)
+                lstm_detector = detector
+                logger.info(f"LSTM model loaded successfully ({detector.backend} inference)")
+            except Exception as e:
+                logger.warning(f"Failed to load LSTM model: {e}")
+        
+        return ModelSet((previous.version if previous else 0) + 1, rf_detector, lstm_detector, files)
+    
+    def _file_states(self) -> Dict[str, FileState]:
+        """Current mtime and size of each model file."""
+        states = {}
+        for path in (self.rf_model_path, self.lstm_model_path):
+            try:
+                stat = Path(path).stat()
+                states[path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                states[path] = None
+        return states
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """The process-wide registry, loading the models on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
@@ -0,0 +1,200 @@
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Any, List
+import threading
+from sqlalchemy import and_, exists, false, text
+from sqlalchemy.engine import Engine
+from app.core.config import settings
+from app.core.database import SessionLocal, engine
+from app.core.partitioning import PARTITIONED_TABLES, ensure_partitions, list_partitions, partitioning_enabled
+from app.models.database import Event, Detection
+from app.services.stats_rollup import StatsRollup
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionService:
+    """Removes events and detections created before the retention window.
+    
+    The cutoff is midnight retention_days days ago, so whole days expire
+    together. On PostgreSQL with daily partitions, expired partitions are
+    dropped, or detached with mode "detach" to stay as standalone tables for
+    cold storage, in the same transaction that subtracts their rows from the
+    /stats rollup. Any remaining expired rows (SQLite, unpartitioned tables,
+    default partitions) are deleted in batches, one transaction each. With
+    archiving enabled, new detections are exported to the Parquet archive
+    first and nothing is removed if that fails. Each pass also creates
+    upcoming daily partitions.
+    """
+    
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        bind: Engine = engine,
+        retention_days: int = None,
+        mode: str = None,
+        batch_size: int = None
+    ):
+        self.session_factory = session_factory
+        self.bind = bind
+        self.retention_days = settings.retention_days if retention_days is None else retention_days
+        self.mode = mode or settings.retention_mode
+        self.batch_size = max(1, batch_size or settings.retention_delete_batch_size)
+        self.stats_rollup = StatsRollup()
+        self.archiver = None
+        if settings.archive_enabled:
+            # pyarrow is only imported when archiving is enabled
+            from app.services.archive import ParquetArchiver
+            self.archiver = ParquetArchiver(session_factory=session_factory)
+        if self.mode not in ('drop', 'detach'):
+            raise ValueError(f"Unknown retention mode: {self.mode}")
+        
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def cutoff(self) -> datetime:
+        """Rows created before this are expired."""
+        return datetime.combine(date.today() - timedelta(days=self.retention_days), time.min)
+    
+    def run_once(self) -> Dict[str, Any]:
+        """Create upcoming partitions and remove expired data; returns what was done."""
+        result = {
+            'partitions_created': ensure_partitions(self.bind),
+            'partitions_removed': [],
+            'archived': 0,
+            'events_deleted': 0,
+            'detections_deleted': 0
+        }
+        if self.retention_days <= 0:
+            return result
+        
+        if self.archiver is not None:
+            result['archived'] = self.archiver.export()['exported']
+        
+        cutoff = self.cutoff()
+        if partitioning_enabled(self.bind):
+            result['partitions_removed'] = self._remove_partitions(cutoff)
+        result['detections_deleted'] = self._delete_detections(cutoff)
+        result['events_deleted'] = self._delete_events(cutoff)
+        
+        logger.info(
+            f"Retention before {cutoff:%Y-%m-%d}: removed partitions {result['partitions_removed']}, "
+            f"deleted {result['events_deleted']} events and {result['detections_deleted']} detections"
+        )
+        return result
+    
+    def expired_counts(self) -> Dict[str, int]:
+        """Counters of the rows a run would remove, without removing them."""
+        cutoff = self.cutoff()
+        db = self.session_factory()
+        try:
+            return self.stats_rollup.count(
+                db,
+                and_(
+                    Event.created_at < cutoff,
+                    ~exists().where(and_(Detection.event_id == Event.id, Detection.created_at >= cutoff))
+                ),
+                Detection.created_at < cutoff
+            )
+        finally:
+            db.close()
+    
+    def start(self):
+        """Run a pass now and then every retention_interval_minutes in a background thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+    
+    def shutdown(self, wait: bool = True):
+        """Stop the background thread after its current pass."""
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+    
+    def _run(self):
+        """Background loop; a failed pass is retried at the next interval."""
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Retention pass failed: {e}")
+            self._stop.wait(settings.retention_interval_minutes * 60)
+    
+    def _remove_partitions(self, cutoff: datetime) -> List[str]:
+        """Drop or detach the daily partitions of every day before the cutoff."""
+        expired: Dict[date, Dict[str, str]] = {}
+        for table in PARTITIONED_TABLES:
+            for partition, day in list_partitions(self.bind, table):
+                if day < cutoff.date():
+                    expired.setdefault(day, {})[table] = partition
+        
+        removed = []
+        for day in sorted(expired):
+            partitions = expired[day]
+            db = self.session_factory()
+            try:
+                # tableoid limits the counts to the partitions, not same-day rows in the default partition
+                counts = self.stats_rollup.count(
+                    db,
+                    text(f"events.tableoid = '{partitions['events']}'::regclass") if 'events' in partitions else false(),
+                    text(f"detections.tableoid = '{partitions['detections']}'::regclass") if 'detections' in partitions else false()
+                )
+                self.stats_rollup.record_removed(db, counts)
+                for table, partition in partitions.items():
+                    if self.mode == 'detach':
+                        db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+                    else:
+                        db.execute(text(f"DROP TABLE {partition}"))
+                db.commit()
+                removed.extend(partitions.values())
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+        return removed
+    
+    def _delete_detections(self, cutoff: datetime) -> int:
+        """Delete expired detections in batches; returns the number deleted."""
+        deleted = 0
+        while True:
+            db = self.session_factory()
+            try:
+                ids = [row.id for row in db.query(Detection.id).filter(
+                    Detection.created_at < cutoff
+                ).limit(self.batch_size).with_for_update().all()]
+                if not ids:
+                    return deleted
+                
+                self.stats_rollup.record_removed(db, self.stats_rollup.count(db, false(), Detection.id.in_(ids)))
+                db.query(Detection).filter(Detection.id.in_(ids)).delete(synchronize_session=False)
+                db.commit()
+                deleted += len(ids)
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+    
+    def _delete_events(self, cutoff: datetime) -> int:
+        """Delete expired events that no remaining detection refers to; returns the number deleted."""
+        deleted = 0
+        while True:
+            db = self.session_factory()
+            try:
+                ids = [row.id for row in db.query(Event.id).filter(
+                    and_(Event.created_at < cutoff, ~exists().where(Detection.event_id == Event.id))
+                ).limit(self.batch_size).with_for_update().all()]
+                if not ids:
+                    return deleted
+                
+                self.stats_rollup.record_removed(db, {'total_events': len(ids)})
+                db.query(Event).filter(Event.id.in_(ids)).delete(synchronize_session=False)
+                db.commit()
+                deleted += len(ids)
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
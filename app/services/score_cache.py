@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+import hashlib
+import json
+import threading
+import time
+from app.core.config import settings
+
+# Event fields that fully determine extracted features and model scores
+KEY_FIELDS = ('process_name', 'command_line', 'parent_image', 'user', 'integrity_level')
+
+
+class ScoreCache:
+    """Bounded LRU cache of feature vectors and scores for repeated events.
+    
+    Entries are keyed by a hash of the scoring-relevant event fields and the
+    loaded model versions, so a model change never returns a stale score.
+    Entries expire after a TTL; the least recently used entry is evicted once
+    the cache is full. Safe to share between request threads.
+    """
+    
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None):
+        self.max_entries = max_entries if max_entries is not None else settings.score_cache_max_entries
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.score_cache_ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+    
+    @staticmethod
+    def make_key(event_data: Dict[str, Any], model_version: str) -> str:
+        """Content hash of the scoring-relevant event fields and the model version."""
+        # extract_features only adds timestamp placeholders when a timestamp is present
+        material = [event_data.get(field) or '' for field in KEY_FIELDS]
+        material += [bool(event_data.get('timestamp')), model_version]
+        return hashlib.sha256(json.dumps(material).encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for key, or None if missing or expired."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            
+            stored_at, entry = item
+            if self.ttl_seconds and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+    
+    def put(self, key: str, entry: Dict[str, Any]):
+        """Store an entry, evicting least recently used entries beyond max_entries."""
+        if self.max_entries <= 0:
+            return
+        
+        with self._lock:
+            self._entries[key] = (time.monotonic(), entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """Drop every entry, e.g. after models are reloaded."""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,205 @@
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Tuple
+import threading
+import time
+import numpy as np
+from app.core.config import settings
+from app.ml.feature_extraction import event_host
+
+
+class _Lineage:
+    """Recent LSTM input vectors of one host/parent lineage and the LSTM state after them."""
+    
+    __slots__ = ('lock', 'window', 'state', 'absorbed', 'model_version', 'feature_names', 'last_seen')
+    
+    def __init__(self, length: int):
+        # Guards every field but last_seen, which the scorer's lock guards
+        self.lock = threading.Lock()
+        self.window = deque(maxlen=length)
+        self.state = None
+        self.absorbed = 0
+        self.model_version = None
+        self.feature_names = None
+        self.last_seen = 0.0
+
+
+class SequenceScorer:
+    """Scores events with the LSTM in the context of recent events of the same lineage.
+    
+    A lineage is the host plus the parent process image (or only the host
+    with key "host"). Each lineage keeps its last `length` LSTM input vectors
+    and the LSTM (h, c) state after the events it has absorbed. A new event
+    costs one LSTM step from that state. Once the state has absorbed
+    2 * length - 1 events it is rebuilt from the buffered window, so the
+    score always reflects between `length` and 2 * length - 1 recent events
+    at an amortized cost of about two steps per event. A model reload
+    rebuilds the state from the window on the next event.
+    
+    Lineages not seen for idle_seconds are dropped, as are the least
+    recently seen ones beyond max_keys, which bounds memory. Safe to share
+    between request threads: the scorer's lock only covers finding, creating
+    and dropping lineages, and each lineage has a lock of its own held while
+    a batch advances it, so batches on different lineages run their LSTM
+    steps concurrently and each lineage absorbs one batch at a time, in
+    batch order.
+    """
+    
+    KEY_MODES = ('host_parent', 'host')
+    
+    def __init__(
+        self,
+        length: int = None,
+        max_keys: int = None,
+        idle_seconds: float = None,
+        key_mode: str = None
+    ):
+        self.length = max(1, length or settings.lstm_sequence_length)
+        self.max_keys = max(1, max_keys or settings.lstm_sequence_max_keys)
+        self.idle_seconds = settings.lstm_sequence_idle_seconds if idle_seconds is None else idle_seconds
+        self.key_mode = key_mode or settings.lstm_sequence_key
+        if self.key_mode not in self.KEY_MODES:
+            raise ValueError(f"Unknown LSTM sequence key: {self.key_mode}")
+        self._lineages: "OrderedDict[str, _Lineage]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.steps = 0
+        self.rebuilds = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def key_for(self, event_data: Dict[str, Any]) -> str:
+        """Lineage key of an event."""
+        host = event_host(event_data.get('raw_event_data')).lower()
+        if self.key_mode == 'host':
+            return host
+        return f"{host}|{(event_data.get('parent_image') or '').lower()}"
+    
+    def score_batch(self, detector, keys: List[str], matrix: np.ndarray) -> np.ndarray:
+        """LSTM scores for a matrix of vectors (in detector.feature_names order), in order, each after its lineage's earlier events."""
+        scores = np.zeros(len(keys), dtype=np.float64)
+        if not keys:
+            return scores
+        
+        # Round r advances every lineage by its r-th event in the batch, one LSTM call for all of them
+        positions: Dict[str, List[int]] = {}
+        for index, key in enumerate(keys):
+            positions.setdefault(key, []).append(index)
+        rounds = max(len(indices) for indices in positions.values())
+        
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            lineages = {key: self._lineage(key, now) for key in positions}
+            self._evict()
+        
+        # Lock the batch's lineages in key order, so batches sharing lineages cannot deadlock
+        ordered = [lineages[key] for key in sorted(lineages)]
+        for lineage in ordered:
+            lineage.lock.acquire()
+        try:
+            steps = rebuilds = 0
+            for r in range(rounds):
+                items = [(indices[r], lineages[key]) for key, indices in positions.items() if len(indices) > r]
+                round_steps, round_rebuilds = self._advance(detector, items, matrix, scores)
+                steps += round_steps
+                rebuilds += round_rebuilds
+        finally:
+            for lineage in ordered:
+                lineage.lock.release()
+        
+        with self._lock:
+            self.steps += steps
+            self.rebuilds += rebuilds
+        return scores
+    
+    def clear(self):
+        """Drop every lineage."""
+        with self._lock:
+            self._lineages.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Counters and current size."""
+        with self._lock:
+            return {
+                'lineages': len(self._lineages),
+                'max_keys': self.max_keys,
+                'length': self.length,
+                'key': self.key_mode,
+                'steps': self.steps,
+                'rebuilds': self.rebuilds,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+    
+    def _advance(self, detector, items: List[Tuple[int, _Lineage]], matrix: np.ndarray, scores: np.ndarray) -> Tuple[int, int]:
+        """Absorb one event per lineage: one batched step for most, a window rebuild for the rest.
+        
+        Caller holds the lineages' locks; returns the number of steps and rebuilds.
+        """
+        stepped = []
+        rebuilt: Dict[int, List[Tuple[int, _Lineage]]] = {}
+        for index, lineage in items:
+            if lineage.model_version != detector.model_version:
+                # Buffered vectors only carry over if the new model reads the same features
+                if lineage.feature_names != detector.feature_names:
+                    lineage.window.clear()
+                lineage.model_version = detector.model_version
+                lineage.feature_names = detector.feature_names
+                lineage.state = None
+            
+            # A copy, so the window does not keep the whole batch matrix alive
+            lineage.window.append(np.array(matrix[index], dtype=np.float32))
+            if lineage.state is None or lineage.absorbed >= 2 * self.length - 1:
+                rebuilt.setdefault(len(lineage.window), []).append((index, lineage))
+            else:
+                stepped.append((index, lineage))
+        
+        if stepped:
+            h = np.concatenate([lineage.state[0] for _, lineage in stepped], axis=1)
+            c = np.concatenate([lineage.state[1] for _, lineage in stepped], axis=1)
+            sequences = np.stack([matrix[index] for index, _ in stepped])[:, None, :]
+            self._run(detector, stepped, sequences, (h, c), scores)
+            for _, lineage in stepped:
+                lineage.absorbed += 1
+        
+        for window_size, group in rebuilt.items():
+            sequences = np.stack([np.stack(lineage.window) for _, lineage in group])
+            self._run(detector, group, sequences, None, scores)
+            for _, lineage in group:
+                lineage.absorbed = window_size
+        
+        return len(stepped), sum(len(group) for group in rebuilt.values())
+    
+    def _run(self, detector, items: List[Tuple[int, _Lineage]], sequences: np.ndarray, state, scores: np.ndarray):
+        """One LSTM call for a group of lineages; stores each score and each lineage's new state."""
+        group_scores, (h, c) = detector.predict_sequence(sequences, state)
+        for position, (index, lineage) in enumerate(items):
+            scores[index] = group_scores[position]
+            # (num_layers, 1, hidden_size) copies, independent of the batch arrays
+            lineage.state = (h[:, position:position + 1].copy(), c[:, position:position + 1].copy())
+    
+    def _lineage(self, key: str, now: float) -> _Lineage:
+        """Lineage for key, created if new and marked as most recently seen; caller holds the lock."""
+        lineage = self._lineages.get(key)
+        if lineage is None:
+            lineage = _Lineage(self.length)
+            self._lineages[key] = lineage
+        lineage.last_seen = now
+        self._lineages.move_to_end(key)
+        return lineage
+    
+    def _expire(self, now: float):
+        """Drop lineages idle for longer than idle_seconds; caller holds the lock."""
+        if not self.idle_seconds:
+            return
+        while self._lineages:
+            key, lineage = next(iter(self._lineages.items()))
+            if now - lineage.last_seen <= self.idle_seconds:
+                break
+            del self._lineages[key]
+            self.expirations += 1
+    
+    def _evict(self):
+        """Drop the least recently seen lineages beyond max_keys; caller holds the lock."""
+        while len(self._lineages) > self.max_keys:
+            self._lineages.popitem(last=False)
+            self.evictions += 1
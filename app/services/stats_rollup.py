@@ -0,0 +1,135 @@
+from typing import Dict, Iterable, Optional
+from datetime import datetime
+import random
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models.database import Event, Detection, SystemStats
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The system_stats rows holding the live counters: ROLLUP_ID up to ROLLUP_ID + ROLLUP_SHARDS - 1
+ROLLUP_ID = 1
+ROLLUP_SHARDS = 16
+
+COUNTER_FIELDS = ('total_events', 'total_detections', 'malicious_detections', 'false_positives', 'false_negatives')
+
+
+class StatsRollup:
+    """Incrementally maintained /stats counters, sharded over ROLLUP_SHARDS system_stats rows.
+    
+    Writers add their deltas with one UPDATE ... SET x = x + n inside the same
+    transaction as the rows they insert or change, so the counters commit or
+    roll back with the data and /stats sums ROLLUP_SHARDS rows instead of
+    counting whole tables. Each transaction updates one shard picked at
+    random, so concurrent writers rarely wait on the same row lock; deltas
+    should still be recorded just before commit to keep it short. Retention
+    subtracts the rows it removes. rebuild() recounts from the tables into
+    the first shard and zeroes the others, e.g. after rows are changed
+    outside the application.
+    """
+    
+    def record_inserts(self, db: Session, events: int, malicious_flags: Iterable[bool]):
+        """Count newly inserted events and their detections."""
+        flags = list(malicious_flags)
+        self._increment(
+            db,
+            total_events=events,
+            total_detections=len(flags),
+            malicious_detections=sum(1 for flag in flags if flag)
+        )
+    
+    def record_feedback(self, db: Session, is_malicious: bool, previous: Optional[str], feedback: Optional[str]):
+        """Count a change of analyst feedback on one detection."""
+        label = 'false_positive' if is_malicious else 'false_negative'
+        delta = int(feedback == label) - int(previous == label)
+        if delta:
+            self._increment(db, **{f"{label}s": delta})
+    
+    def get(self, db: Session) -> Dict[str, int]:
+        """Current counters, summed over the shards; rebuilds the rollup if shards are missing."""
+        shards, *sums = db.query(
+            func.count(SystemStats.id),
+            *[func.sum(getattr(SystemStats, field)) for field in COUNTER_FIELDS]
+        ).filter(self._shard_filter()).one()
+        if shards < ROLLUP_SHARDS:
+            row = self.rebuild(db)
+            db.commit()
+            return {field: getattr(row, field) or 0 for field in COUNTER_FIELDS}
+        return {field: int(value or 0) for field, value in zip(COUNTER_FIELDS, sums)}
+    
+    def ensure(self, db: Session):
+        """Create the rollup shards from the tables if any is missing; caller commits."""
+        if db.query(func.count(SystemStats.id)).filter(self._shard_filter()).scalar() < ROLLUP_SHARDS:
+            self.rebuild(db)
+    
+    def record_removed(self, db: Session, counts: Dict[str, int]):
+        """Subtract counts (from count()) of rows being deleted in this transaction."""
+        self._increment(db, **{field: -counts.get(field, 0) for field in COUNTER_FIELDS})
+    
+    def count(self, db: Session, event_filter=None, detection_filter=None) -> Dict[str, int]:
+        """Count every counter from the tables, optionally over a subset of rows."""
+        events = db.query(func.count(Event.id))
+        detections = db.query(func.count(Detection.id))
+        if event_filter is not None:
+            events = events.filter(event_filter)
+        if detection_filter is not None:
+            detections = detections.filter(detection_filter)
+        
+        return {
+            'total_events': events.scalar() or 0,
+            'total_detections': detections.scalar() or 0,
+            'malicious_detections': detections.filter(
+                Detection.is_malicious == True
+            ).scalar() or 0,
+            'false_positives': detections.filter(
+                Detection.is_malicious == True,
+                Detection.analyst_feedback == 'false_positive'
+            ).scalar() or 0,
+            'false_negatives': detections.filter(
+                Detection.is_malicious == False,
+                Detection.analyst_feedback == 'false_negative'
+            ).scalar() or 0
+        }
+    
+    def rebuild(self, db: Session) -> SystemStats:
+        """Recount every counter from the tables into the first shard and zero the rest; caller commits.
+        
+        Returns the first shard, which then holds the totals.
+        """
+        db.flush()
+        counts = self.count(db)
+        now = datetime.now()
+        
+        rows = []
+        for shard in range(ROLLUP_SHARDS):
+            row = db.get(SystemStats, ROLLUP_ID + shard)
+            if row is None:
+                row = SystemStats(id=ROLLUP_ID + shard)
+                db.add(row)
+            for field in COUNTER_FIELDS:
+                setattr(row, field, counts[field] if shard == 0 else 0)
+            row.timestamp = now
+            rows.append(row)
+        db.flush()
+        logger.info(f"Rebuilt stats rollup: {counts}")
+        return rows[0]
+    
+    def _increment(self, db: Session, **deltas: int):
+        """Add deltas to a random rollup shard in the caller's transaction."""
+        deltas = {field: value for field, value in deltas.items() if value}
+        if not deltas:
+            return
+        
+        values = {getattr(SystemStats, field): getattr(SystemStats, field) + value for field, value in deltas.items()}
+        values[SystemStats.timestamp] = datetime.now()
+        shard_id = ROLLUP_ID + random.randrange(ROLLUP_SHARDS)
+        updated = db.query(SystemStats).filter(SystemStats.id == shard_id).update(values, synchronize_session=False)
+        if not updated:
+            # Shards not created yet: count the tables, including this transaction's rows
+            self.rebuild(db)
+    
+    @staticmethod
+    def _shard_filter():
+        """Filter selecting the rollup shard rows."""
+        return SystemStats.id.between(ROLLUP_ID, ROLLUP_ID + ROLLUP_SHARDS - 1)
@@ -0,0 +1,122 @@
+from datetime import datetime
+from typing import Dict, Any, Optional
+import threading
+import time
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.services.detection import DetectionService
+from app.services.explainability import ExplainabilityService
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Synthetic event run through the pipeline at startup; it is never stored
+WARMUP_EVENT = {
+    'event_id': '1',
+    'timestamp': datetime(2000, 1, 1),
+    'process_name': 'C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\powershell.exe',
+    'command_line': 'powershell.exe -NoProfile -EncodedCommand SQBFAFgAIAAoAE4AZQB3AC0ATwBiAGoAZQBjAHQAKQA=',
+    'parent_image': 'C:\\Windows\\explorer.exe',
+    'user': 'WARMUP\\user',
+    'integrity_level': 'Medium',
+    'raw_event_data': None
+}
+
+STATE_PENDING = 'pending'
+STATE_RUNNING = 'running'
+STATE_READY = 'ready'
+STATE_FAILED = 'failed'
+
+
+class WarmupService:
+    """Loads the models and warms up the pipeline before the API reports ready.
+    
+    Stages run in order and are timed: a database round trip and model
+    loading, then with WARMUP_ENABLED feature extraction and single-event
+    (micro-batched, if enabled) and batch scoring of a synthetic event, and
+    building the SHAP and LIME explainers. Nothing is stored and no LLM is called. Requests that arrive
+    earlier still work; they wait for the model load instead. /ready reports
+    ready once this has finished, and with REQUIRE_MODELS only if both
+    models loaded.
+    """
+    
+    def __init__(
+        self,
+        detection_service: DetectionService,
+        explainability_service: ExplainabilityService,
+        session_factory=SessionLocal
+    ):
+        self.detection_service = detection_service
+        self.explainability_service = explainability_service
+        self.session_factory = session_factory
+        self.state = STATE_PENDING
+        self.error: Optional[str] = None
+        self.stage_ms: Dict[str, float] = {}
+        self._thread = None
+    
+    def start(self, background: bool = None):
+        """Run the warm-up, in a background thread unless background is False."""
+        background = settings.warmup_background if background is None else background
+        if not background:
+            self.run()
+            return
+        self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        self._thread.start()
+    
+    def run(self):
+        """Run every stage, recording how long each took."""
+        self.state = STATE_RUNNING
+        started = time.perf_counter()
+        stages = [
+            ('database', self._check_database),
+            ('models', self.detection_service.model_registry.current)
+        ]
+        if settings.warmup_enabled:
+            stages.append(('scoring', self._score))
+            stages.append(('explainers', self._build_explainers))
+        
+        try:
+            for name, stage in stages:
+                stage_started = time.perf_counter()
+                stage()
+                self.stage_ms[name] = round((time.perf_counter() - stage_started) * 1000, 1)
+        except Exception as e:
+            self.state = STATE_FAILED
+            self.error = f"{name}: {e}"
+            logger.error(f"Warm-up failed at stage {name}: {e}")
+            return
+        
+        self.state = STATE_READY
+        logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s: {self.stage_ms}")
+    
+    def status(self) -> Dict[str, Any]:
+        """Readiness and the details behind it, for /ready."""
+        registry = self.detection_service.model_registry
+        models = registry.current() if registry.loaded else None
+        loaded = {
+            'random_forest': bool(models and models.rf_detector),
+            'lstm': bool(models and models.lstm_detector)
+        }
+        ready = self.state == STATE_READY and (not settings.require_models or all(loaded.values()))
+        return {
+            'ready': ready,
+            'state': self.state,
+            'models_loaded': loaded,
+            'model_version': models.version if models else None,
+            'stage_ms': dict(self.stage_ms),
+            'error': self.error
+        }
+    
+    def _check_database(self):
+        db = self.session_factory()
+        try:
+            db.execute(text("SELECT 1"))
+        finally:
+            db.close()
+    
+    def _score(self):
+        self._features = self.detection_service.warm_up(dict(WARMUP_EVENT))
+    
+    def _build_explainers(self):
+        self.explainability_service.warm_up(dict(WARMUP_EVENT), self._features)
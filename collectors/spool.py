@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Tuple
+
+
+# Position in the spool: (segment number, byte offset in that segment)
+Position = Tuple[int, int]
+
+
+class EventSpool:
+    """Append-only on-disk queue of collector events, with per-source checkpoints.
+    
+    Events are appended as JSON lines to numbered segment files
+    (segment-NNNNNNNNNNNN.jsonl); a new segment starts once the current one
+    reaches segment_max_bytes. cursor.json holds the position of the first
+    event not yet acknowledged by the backend; fully acknowledged segments
+    are deleted. Appends block while the spool holds max_total_bytes, so a
+    long backend outage pauses the collector instead of filling the disk.
+    
+    Each line carries its source (e.g. an EVTX file) and record number, and
+    checkpoints.json holds the highest record number spooled per source. The
+    checkpoint is written after the lines, and on startup it is raised to
+    any record found in unacknowledged lines, so a crash between the two
+    neither re-reads nor loses records.
+    """
+    
+    def __init__(
+        self,
+        directory: str,
+        segment_max_bytes: int = 16 * 1024 * 1024,
+        max_total_bytes: int = 1024 * 1024 * 1024,
+        fsync: bool = False
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_max_bytes = segment_max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.fsync = fsync
+        self.cursor_path = self.directory / 'cursor.json'
+        self.checkpoint_path = self.directory / 'checkpoints.json'
+        
+        # Appends notify waiting readers; acks notify appenders waiting for space
+        self._condition = threading.Condition()
+        self._segments = sorted(int(path.stem.split('-')[1]) for path in self.directory.glob('segment-*.jsonl'))
+        self._sizes = {segment: self._segment_path(segment).stat().st_size for segment in self._segments}
+        self._cursor = self._read_json(self.cursor_path, {'segment': 0, 'offset': 0})
+        self._cursor = (self._cursor['segment'], self._cursor['offset'])
+        self._checkpoints: Dict[str, int] = self._read_json(self.checkpoint_path, {})
+        self._writer = None
+        self.pending = 0
+        
+        self._remove_acknowledged()
+        self._recover()
+    
+    @property
+    def total_bytes(self) -> int:
+        """Bytes on disk across all segments, acknowledged parts included."""
+        return sum(self._sizes.values())
+    
+    def checkpoint(self, source: str) -> int:
+        """Highest record number spooled from a source (0 if none)."""
+        with self._condition:
+            return self._checkpoints.get(source, 0)
+    
+    def reset_checkpoint(self, source: str):
+        """Forget a source's checkpoint so it is read from the start."""
+        with self._condition:
+            if self._checkpoints.pop(source, None) is not None:
+                self._write_json(self.checkpoint_path, self._checkpoints)
+    
+    def append(
+        self,
+        items: List[Tuple[Optional[int], Dict[str, Any]]],
+        source: Optional[str] = None,
+        checkpoint: Optional[int] = None
+    ):
+        """Spool (record number, event) pairs and advance the source's checkpoint.
+        
+        checkpoint is the last record read from the source, which can be past
+        the last spooled event when later records were filtered out. Blocks
+        while the spool is over its disk budget and still has events the
+        sender has not acknowledged.
+        """
+        if not items and checkpoint is None:
+            return
+        lines = ''.join(
+            json.dumps({'src': source, 'rec': record, 'event': event}) + '\n'
+            for record, event in items
+        ).encode('utf-8')
+        
+        with self._condition:
+            warned = False
+            while self.pending and self.total_bytes + len(lines) > self.max_total_bytes:
+                if not warned:
+                    print(f"Spool is full ({self.total_bytes / 2**20:.0f} MiB); waiting for the backend to catch up")
+                    warned = True
+                self._condition.wait(1.0)
+            
+            if items:
+                writer = self._open_writer()
+                writer.write(lines)
+                writer.flush()
+                if self.fsync:
+                    os.fsync(writer.fileno())
+                self._sizes[self._segments[-1]] += len(lines)
+                self.pending += len(items)
+            
+            records = [record for record, _ in items if record is not None]
+            if checkpoint is not None:
+                records.append(checkpoint)
+            if source is not None and records and max(records) > self._checkpoints.get(source, 0):
+                self._checkpoints[source] = max(records)
+                self._write_json(self.checkpoint_path, self._checkpoints)
+            self._condition.notify_all()
+    
+    def read(self, max_events: int, max_bytes: int, timeout: float = None) -> Tuple[List[Dict[str, Any]], Position]:
+        """Next unacknowledged events (at least one if any arrive within timeout) and the position after them.
+        
+        Reading does not move the cursor; call ack with the returned position
+        once the events are delivered. Until then the same events are read again.
+        """
+        with self._condition:
+            if not self.pending and timeout:
+                self._condition.wait(timeout)
+            start, offset = self._cursor
+            segments = [segment for segment in self._segments if segment >= start]
+        
+        events = []
+        size = 0
+        position = self._cursor
+        for segment in segments:
+            if segment != start:
+                offset = 0
+            with open(self._segment_path(segment), 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Torn last line of a crashed append, or one still being written
+                        break
+                    if events and (len(events) >= max_events or size + len(line) > max_bytes):
+                        return events, position
+                    events.append(json.loads(line)['event'])
+                    size += len(line)
+                    offset += len(line)
+                    position = (segment, offset)
+        return events, position
+    
+    def ack(self, position: Position, count: int):
+        """Mark everything before position as delivered and delete segments that are done."""
+        with self._condition:
+            self._cursor = position
+            self.pending = max(0, self.pending - count)
+            self._write_json(self.cursor_path, {'segment': position[0], 'offset': position[1]})
+            self._remove_acknowledged()
+            self._condition.notify_all()
+    
+    def wait_empty(self, timeout: float = None) -> bool:
+        """Wait until every spooled event is acknowledged; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self.pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining if remaining is not None else 1.0)
+        return True
+    
+    def close(self):
+        """Close the segment being written."""
+        with self._condition:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+    
+    def _open_writer(self):
+        """Segment file to append to, starting a new one when the current one is full; caller holds the lock."""
+        if self._segments and self._sizes[self._segments[-1]] < self.segment_max_bytes:
+            if self._writer is None:
+                self._writer = open(self._segment_path(self._segments[-1]), 'ab')
+            return self._writer
+        
+        if self._writer is not None:
+            self._writer.close()
+        segment = self._segments[-1] + 1 if self._segments else self._cursor[0] + 1
+        self._segments.append(segment)
+        self._sizes[segment] = 0
+        self._writer = open(self._segment_path(segment), 'ab')
+        return self._writer
+    
+    def _remove_acknowledged(self):
+        """Delete segments entirely before the cursor; caller holds the lock (or is __init__)."""
+        segment, offset = self._cursor
+        # A fully read segment that is no longer appended to is done as well
+        if (segment in self._sizes and offset >= self._sizes[segment]
+                and self._segments and segment != self._segments[-1]):
+            segment, offset = self._segments[self._segments.index(segment) + 1], 0
+            self._cursor = (segment, offset)
+            self._write_json(self.cursor_path, {'segment': segment, 'offset': offset})
+        
+        for done in [s for s in self._segments if s < segment]:
+            self._segment_path(done).unlink(missing_ok=True)
+            self._segments.remove(done)
+            del self._sizes[done]
+    
+    def _recover(self):
+        """Count unacknowledged events and raise checkpoints to records spooled but not checkpointed."""
+        segment, offset = self._cursor
+        updated = False
+        for current in [s for s in self._segments if s >= segment]:
+            with open(self._segment_path(current), 'rb') as f:
+                f.seek(offset if current == segment else 0)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    record = json.loads(line)
+                    self.pending += 1
+                    if record['src'] is not None and record['rec'] is not None:
+                        if record['rec'] > self._checkpoints.get(record['src'], 0):
+                            self._checkpoints[record['src']] = record['rec']
+                            updated = True
+        # Drop a torn final line so later appends start on a line boundary
+        self._truncate_torn_tail()
+        if updated:
+            self._write_json(self.checkpoint_path, self._checkpoints)
+        if self.pending:
+            print(f"Resuming with {self.pending:,} spooled events not yet delivered")
+    
+    def _truncate_torn_tail(self):
+        """Cut a partial last line left by a crash mid-append off the newest segment."""
+        if not self._segments:
+            return
+        segment = self._segments[-1]
+        path = self._segment_path(segment)
+        with open(path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+                self._sizes[segment] = end
+    
+    def _segment_path(self, segment: int) -> Path:
+        return self.directory / f"segment-{segment:012d}.jsonl"
+    
+    @staticmethod
+    def _read_json(path: Path, default: Any) -> Any:
+        try:
+            return json.loads(path.read_text())
+        except FileNotFoundError:
+            return default
+    
+    @staticmethod
+    def _write_json(path: Path, value: Any):
+        """Replace a small state file atomically."""
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(value))
+        os.replace(tmp_path, path)
@@ -1,8 +1,12 @@
 import requests
+from requests.adapters import HTTPAdapter
+import gzip
 import json
+import random
+import threading
 import time
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple
 import sys
 import os
 
@@ -10,26 +14,114 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.core.config import settings
+from collectors.spool import EventSpool
+
+
+# Responses worth retrying
+RETRY_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+# Rejections of the batch content (malformed event, batch too large): split the batch to isolate the refused events
+SPLIT_STATUS_CODES = (400, 413, 422)
+
+# Outcomes of one POST
+SENT = 'sent'
+REJECTED = 'rejected'
+UNAVAILABLE = 'unavailable'
+
+# EVTX records read between spool appends (and checkpoint updates)
+SPOOL_CHUNK_RECORDS = 100
 
 
 class WindowsEventCollector:
-    """Collects Windows events from Sysmon and streams to detection backend."""
+    """Collects Windows events from Sysmon and streams to detection backend.
     
-    def __init__(self, backend_url: str = None):
+    Parsed events are appended to an on-disk spool (see EventSpool) and a
+    sender thread drains it, posting batches to the batch endpoint
+    gzip-compressed over one keep-alive session, once batch_max_events or
+    batch_max_bytes is reached or the oldest unsent event has waited
+    batch_max_wait seconds. Failed posts are retried with exponential
+    backoff; a batch that still fails stays spooled and is retried until the
+    backend is back. A batch the backend rejects for its content (400, 413,
+    422) is split in halves and resent until the refused events are
+    isolated; those are appended to dead_letter.jsonl in the spool directory
+    with the rejection, so one malformed event costs no other event. In file
+    mode the last spooled EVTX record number is checkpointed per file, so a
+    restarted collector continues where it stopped. Throughput stats are
+    printed every stats_interval seconds instead of one line per event.
+    """
+    
+    def __init__(
+        self,
+        backend_url: str = None,
+        batch_max_events: int = None,
+        batch_max_bytes: int = None,
+        batch_max_wait: float = None,
+        spool_dir: str = None
+    ):
         self.backend_url = backend_url or f"http://{settings.api_host}:{settings.api_port}"
         self.event_endpoint = f"{self.backend_url}/api/v1/events"
+        self.batch_endpoint = f"{self.backend_url}/api/v1/events/batch"
         self.running = False
+        
+        self.batch_max_events = min(batch_max_events or settings.collector_batch_max_events, settings.max_batch_size)
+        self.batch_max_bytes = batch_max_bytes or settings.collector_batch_max_bytes
+        self.batch_max_wait = settings.collector_batch_max_wait if batch_max_wait is None else batch_max_wait
+        
+        # One pooled keep-alive connection instead of a new TCP connection per event
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        
+        self.spool = EventSpool(
+            spool_dir or settings.collector_spool_dir,
+            segment_max_bytes=settings.collector_spool_segment_bytes,
+            max_total_bytes=settings.collector_spool_max_bytes,
+            fsync=settings.collector_spool_fsync
+        )
+        self.dead_letter_path = self.spool.directory / 'dead_letter.jsonl'
+        # Parsed events (with their record numbers) not yet appended to the spool
+        self._pending: List[tuple] = []
+        self._sender = None
+        self._draining = threading.Event()
+        
+        self.stats = {'events_sent': 0, 'batches_sent': 0, 'bytes_raw': 0, 'bytes_sent': 0,
+                      'retries': 0, 'events_dead_lettered': 0, 'malicious': 0}
+        self._stats_started = time.monotonic()
+        self._stats_printed = self._stats_started
+        self._stats_last = dict(self.stats)
     
-    def collect_events_from_file(self, evtx_file_path: str):
-        """Collect events from EVTX file and send to backend."""
+    def collect_events_from_file(self, evtx_file_path: str, from_start: bool = False):
+        """Collect events from EVTX file and send to backend, resuming after the file's checkpoint."""
         try:
             import Evtx.Evtx as evtx
             
+            source = os.path.abspath(evtx_file_path)
+            if from_start:
+                self.spool.reset_checkpoint(source)
+            checkpoint = self.spool.checkpoint(source)
+            if checkpoint:
+                print(f"Resuming {source} after record {checkpoint}")
+            
+            self.start_sender()
             with evtx.Evtx(evtx_file_path) as log:
-                for record in log.records():
-                    event_data = self._parse_event_record(record)
-                    if event_data:
-                        self._send_event(event_data)
+                spooled_through = processed = checkpoint
+                for chunk in log.chunks():
+                    # Whole chunks that were spooled before are skipped without parsing
+                    if chunk.log_last_record_number() <= checkpoint:
+                        continue
+                    for record in chunk.records():
+                        number = record.record_num()
+                        if number <= checkpoint:
+                            continue
+                        event_data = self._parse_event_record(record)
+                        if event_data:
+                            self._send_event(event_data, number)
+                        processed = number
+                        if processed - spooled_through >= SPOOL_CHUNK_RECORDS:
+                            self._spool_pending(source, processed)
+                            spooled_through = processed
+                self._spool_pending(source, processed)
+            self.close()
+            self._print_stats(final=True)
         except ImportError:
             print("ERROR: evtx library not available. Install with: pip install python-evtx")
             sys.exit(1)
@@ -39,6 +131,7 @@ class WindowsEventCollector:
     def collect_events_realtime(self):
         """Collect events in real-time from Windows Event Log."""
         self.running = True
+        self.start_sender()
         
         try:
             if sys.platform != 'win32':
@@ -70,8 +163,10 @@ class WindowsEventCollector:
                     if event_data:
                         self._send_event(event_data)
                 
+                self._spool_pending()
                 time.sleep(0.5)
             
+            self.close()
             win32evtlog.CloseEventLog(handle)
         except ImportError:
             print("ERROR: pywin32 not available. Install with: pip install pywin32")
@@ -116,7 +211,8 @@ class WindowsEventCollector:
                         event_data['integrity_level'] = value
             
             event_data['timestamp'] = datetime.now()
-            event_data['raw_event_data'] = xml
+            # The API takes raw_event_data as an object
+            event_data['raw_event_data'] = {'xml': xml}
             
             return event_data if event_data.get('command_line') else None
         except Exception as e:
@@ -151,32 +247,171 @@ class WindowsEventCollector:
             print(f"Error parsing win32 event: {e}")
             return None
     
-    def _send_event(self, event_data: Dict[str, Any]):
-        """Send event to backend API."""
-        try:
-            payload = {
-                'event_id': event_data.get('event_id', ''),
-                'timestamp': event_data.get('timestamp', datetime.now()).isoformat(),
-                'process_name': event_data.get('process_name', ''),
-                'command_line': event_data.get('command_line', ''),
-                'parent_image': event_data.get('parent_image'),
-                'user': event_data.get('user'),
-                'integrity_level': event_data.get('integrity_level'),
-                'raw_event_data': event_data.get('raw_event_data')
-            }
+    def _send_event(self, event_data: Dict[str, Any], record: int = None):
+        """Queue an event for the spool; record is its EVTX record number, if read from a file."""
+        payload = {
+            'event_id': event_data.get('event_id', ''),
+            'timestamp': event_data.get('timestamp', datetime.now()).isoformat(),
+            'process_name': event_data.get('process_name', ''),
+            'command_line': event_data.get('command_line', ''),
+            'parent_image': event_data.get('parent_image'),
+            'user': event_data.get('user'),
+            'integrity_level': event_data.get('integrity_level'),
+            'raw_event_data': event_data.get('raw_event_data')
+        }
+        self._pending.append((record, payload))
+    
+    def _spool_pending(self, source: str = None, checkpoint: int = None):
+        """Append queued events to the spool, moving the source's checkpoint to the last record read."""
+        self.spool.append(self._pending, source=source, checkpoint=checkpoint)
+        self._pending = []
+    
+    def start_sender(self):
+        """Start the thread that sends spooled events, including those left by a previous run."""
+        if self._sender is not None:
+            return
+        self._draining.clear()
+        self._sender = threading.Thread(target=self._send_spooled, name="collector-sender", daemon=True)
+        self._sender.start()
+    
+    def close(self):
+        """Spool queued events and wait until the spool is sent; what the backend cannot take stays spooled."""
+        self._spool_pending()
+        self._draining.set()
+        if self._sender is not None:
+            self._sender.join()
+            self._sender = None
+        if self.spool.pending:
+            print(f"{self.spool.pending:,} events could not be sent and stay spooled for the next run")
+        self.spool.close()
+    
+    def _send_spooled(self):
+        """Sender loop: post spooled events in batches and acknowledge each batch once delivered."""
+        batch_started = None
+        while True:
+            events, position = self.spool.read(self.batch_max_events, self.batch_max_bytes, timeout=0.5)
+            if not events:
+                if self._draining.is_set():
+                    return
+                self._print_stats()
+                continue
             
-            response = requests.post(
-                self.event_endpoint,
-                json=payload,
-                timeout=10
-            )
-            response.raise_for_status()
+            # Wait for a fuller batch, unless more is already spooled or the oldest event is due
+            if not self._draining.is_set() and len(events) < self.batch_max_events and len(events) >= self.spool.pending:
+                batch_started = batch_started or time.monotonic()
+                if time.monotonic() - batch_started < self.batch_max_wait:
+                    time.sleep(min(0.05, self.batch_max_wait))
+                    continue
+            batch_started = None
             
-            print(f"Event sent: {event_data.get('process_name')} - {event_data.get('command_line', '')[:50]}")
-        except requests.exceptions.RequestException as e:
-            print(f"Error sending event to backend: {e}")
-        except Exception as e:
-            print(f"Unexpected error sending event: {e}")
+            if not self._post_batch(events):
+                if self._draining.is_set():
+                    return
+                print(f"Backend unavailable; {self.spool.pending:,} events stay spooled, "
+                      f"retrying in {settings.collector_backoff_max:.0f}s")
+                self._draining.wait(settings.collector_backoff_max)
+                continue
+            self.spool.ack(position, len(events))
+            self._print_stats()
+    
+    def _post_batch(self, events: List[Dict[str, Any]]) -> bool:
+        """Deliver a batch, splitting it while the backend rejects its content; single refused events are dead-lettered.
+        
+        Returns False if the backend could not be reached, so the batch stays
+        spooled (halves already delivered are sent again, at least once).
+        """
+        outcome, detail = self._post_events(events)
+        if outcome == SENT:
+            return True
+        if outcome == UNAVAILABLE:
+            return False
+        if len(events) == 1:
+            self._dead_letter(events[0], detail)
+            return True
+        middle = len(events) // 2
+        return self._post_batch(events[:middle]) and self._post_batch(events[middle:])
+    
+    def _dead_letter(self, event: Dict[str, Any], reason: str):
+        """Keep an event the backend refuses, with the reason, instead of dropping it."""
+        print(f"Backend rejected event {event.get('event_id', '')}, written to {self.dead_letter_path}: {reason}")
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'rejected_at': datetime.now().isoformat(), 'reason': reason, 'event': event}) + '\n')
+        self.stats['events_dead_lettered'] += 1
+    
+    def _post_events(self, events: List[Dict[str, Any]]) -> Tuple[str, str]:
+        """POST one gzip-compressed JSON array, retrying transient failures with exponential backoff.
+        
+        Returns (SENT, ''), (REJECTED, reason) if the backend refused the
+        content, or (UNAVAILABLE, error) if it could not be reached or refused
+        the request itself (e.g. 401, 404), which retrying later may fix.
+        """
+        raw = json.dumps(events).encode('utf-8')
+        body = gzip.compress(raw, compresslevel=6)
+        headers = {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
+        
+        for attempt in range(settings.collector_max_retries + 1):
+            retry_after = None
+            try:
+                response = self.session.post(
+                    self.batch_endpoint,
+                    data=body,
+                    headers=headers,
+                    timeout=settings.collector_timeout
+                )
+                if response.status_code < 400:
+                    result = response.json()
+                    self.stats['events_sent'] += len(events)
+                    self.stats['batches_sent'] += 1
+                    self.stats['bytes_raw'] += len(raw)
+                    self.stats['bytes_sent'] += len(body)
+                    self.stats['malicious'] += result.get('malicious_count', 0)
+                    return SENT, ''
+                if response.status_code in SPLIT_STATUS_CODES:
+                    return REJECTED, f"HTTP {response.status_code} {response.text[:500]}"
+                if response.status_code not in RETRY_STATUS_CODES:
+                    print(f"Backend refused batch of {len(events)} events: "
+                          f"HTTP {response.status_code} {response.text[:200]}; check the backend URL and settings")
+                    return UNAVAILABLE, f"HTTP {response.status_code}"
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get('Retry-After')
+            except requests.exceptions.RequestException as e:
+                error = str(e)
+            
+            if attempt == settings.collector_max_retries:
+                print(f"Error sending batch of {len(events)} events after {attempt + 1} attempts: {error}")
+                return UNAVAILABLE, error
+            
+            delay = min(settings.collector_backoff_max, settings.collector_backoff_base * (2 ** attempt))
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            # Jitter keeps many collectors from retrying in lockstep
+            delay *= random.uniform(0.5, 1.0)
+            self.stats['retries'] += 1
+            print(f"Batch send failed ({error}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+    
+    def _print_stats(self, final: bool = False):
+        """Print throughput since the last report, every stats_interval seconds."""
+        now = time.monotonic()
+        if not final and now - self._stats_printed < settings.collector_stats_interval:
+            return
+        
+        elapsed = max(now - (self._stats_started if final else self._stats_printed), 1e-9)
+        base = {key: 0 for key in self.stats} if final else self._stats_last
+        sent = self.stats['events_sent'] - base['events_sent']
+        raw = self.stats['bytes_raw'] - base['bytes_raw']
+        compressed = self.stats['bytes_sent'] - base['bytes_sent']
+        print(
+            f"{'Total' if final else 'Sent'}: {sent:,} events ({sent / elapsed:.1f}/s) in "
+            f"{self.stats['batches_sent'] - base['batches_sent']:,} batches, "
+            f"{compressed / 1024:.0f} KiB sent (gzip {raw / compressed if compressed else 0:.1f}x), "
+            f"{self.stats['malicious'] - base['malicious']:,} malicious, "
+            f"{self.stats['retries'] - base['retries']:,} retries, "
+            f"{self.stats['events_dead_lettered'] - base['events_dead_lettered']:,} dead-lettered, "
+            f"{self.spool.pending:,} spooled"
+        )
+        self._stats_printed = now
+        self._stats_last = dict(self.stats)
 
 
 def main():
@@ -188,16 +423,25 @@ def main():
                        help='Collection mode: file or realtime')
     parser.add_argument('--file', type=str, help='Path to EVTX file (for file mode)')
     parser.add_argument('--backend-url', type=str, help='Backend API URL')
+    parser.add_argument('--batch-size', type=int, help='Maximum events per batch (default: COLLECTOR_BATCH_MAX_EVENTS)')
+    parser.add_argument('--batch-wait', type=float, help='Seconds before a partial batch is sent (default: COLLECTOR_BATCH_MAX_WAIT)')
+    parser.add_argument('--spool-dir', type=str, help='Spool and checkpoint directory (default: COLLECTOR_SPOOL_DIR)')
+    parser.add_argument('--from-start', action='store_true', help='Ignore the checkpoint and read the EVTX file from the first record')
     
     args = parser.parse_args()
     
-    collector = WindowsEventCollector(backend_url=args.backend_url)
+    collector = WindowsEventCollector(
+        backend_url=args.backend_url,
+        batch_max_events=args.batch_size,
+        batch_max_wait=args.batch_wait,
+        spool_dir=args.spool_dir
+    )
     
     if args.mode == 'file':
         if not args.file:
             print("ERROR: --file required for file mode")
             sys.exit(1)
-        collector.collect_events_from_file(args.file)
+        collector.collect_events_from_file(args.file, from_start=args.from_start)
     else:
         print("Starting real-time event collection...")
         print("Press Ctrl+C to stop")
@@ -206,6 +450,8 @@ def main():
         except KeyboardInterrupt:
             print("\nStopping event collection...")
             collector.running = False
+            collector.close()
+            collector._print_stats(final=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Create upcoming daily partitions and remove events and detections past the retention window
+"""
+
+import argparse
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.services.retention import RetentionService
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply the events/detections retention policy once')
+    parser.add_argument('--days', type=int, default=settings.retention_days,
+                        help='Keep this many days before today (default: RETENTION_DAYS; 0 keeps everything)')
+    parser.add_argument('--mode', choices=['drop', 'detach'], default=settings.retention_mode,
+                        help='Drop expired partitions or detach them as standalone tables (PostgreSQL partitions only)')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+    
+    args = parser.parse_args()
+    service = RetentionService(retention_days=args.days, mode=args.mode)
+    
+    if args.days <= 0:
+        print("Retention is disabled (--days 0); only creating upcoming partitions")
+    else:
+        print(f"Removing data created before {service.cutoff():%Y-%m-%d}")
+    
+    if args.dry_run:
+        counts = service.expired_counts() if args.days > 0 else {}
+        for field, value in counts.items():
+            print(f"  {field:<24} {value:>12,}")
+        return
+    
+    result = service.run_once()
+    for key, value in result.items():
+        print(f"  {key:<24} {value if isinstance(value, list) else f'{value:,}'}")
+
+
+if __name__ == "__main__":
+    main()
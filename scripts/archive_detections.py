@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Append detections and their events to the Parquet archive, from the last watermark
+"""
+
+import argparse
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.services.archive import ParquetArchiver
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export new detections to the Parquet archive')
+    parser.add_argument('--archive-dir', type=str, default=settings.archive_dir, help='Archive directory')
+    parser.add_argument('--batch-size', type=int, default=settings.archive_batch_size, help='Detections per batch')
+    parser.add_argument('--lag-seconds', type=float, default=settings.archive_lag_seconds,
+                        help='Only archive detections older than this')
+    
+    args = parser.parse_args()
+    
+    archiver = ParquetArchiver(args.archive_dir, batch_size=args.batch_size, lag_seconds=args.lag_seconds)
+    print(f"Archiving to {archiver.dataset_dir} after detection {archiver.read_watermark()}")
+    result = archiver.export()
+    print(f"Exported {result['exported']:,} detections in {result['files']} files; watermark {result['watermark']}")
+
+
+if __name__ == "__main__":
+    main()
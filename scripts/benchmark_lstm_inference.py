@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Compare eager, TorchScript and int8-quantized LSTM inference: latency and score differences
+"""
+
+import argparse
+import copy
+import csv
+import time
+import numpy as np
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.ml.lstm_model import LSTMDetector, configure_threads
+from app.core.config import settings
+
+
+def load_rows(detector: LSTMDetector, data_path: str, max_rows: int):
+    """Feature rows and labels (None if the CSV has none) from an event CSV, or random rows."""
+    if data_path:
+        with open(data_path, newline='', encoding='utf-8') as f:
+            events = [row for _, row in zip(range(max_rows), csv.DictReader(f))]
+        extractor = detector.feature_extractor
+        features = [extractor.extract_features(event) for event in events]
+        label_field = next((field for field in ('label', 'is_malicious') if events and field in events[0]), None)
+        labels = None
+        if label_field:
+            labels = np.array([str(event[label_field]).strip().lower() in ('1', '1.0', 'true') for event in events])
+        return extractor.build_matrix(features, detector.feature_names), labels
+    
+    rng = np.random.default_rng(42)
+    return rng.random((max_rows, detector.input_size)).astype(np.float32) * 10, None
+
+
+def time_call(fn, iterations: int) -> float:
+    """Median latency of fn() in milliseconds."""
+    fn()  # warm-up
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark eager, scripted and quantized LSTM inference')
+    parser.add_argument('--model-path', type=str, default=settings.lstm_model_path, help='Path to the LSTM checkpoint')
+    parser.add_argument('--data-path', type=str, help='Event CSV used to build feature rows, with optional label column')
+    parser.add_argument('--max-rows', type=int, default=5000, help='Maximum rows to compare')
+    parser.add_argument('--batch-sizes', type=str, default='1,8,64,256', help='Comma-separated batch sizes to time')
+    parser.add_argument('--iterations', type=int, default=200, help='Timed iterations per batch size')
+    parser.add_argument('--threads', type=int, default=settings.torch_num_threads,
+                        help='torch intra-op threads (default: TORCH_NUM_THREADS; 0 keeps the torch default)')
+    parser.add_argument('--threshold', type=float, default=0.5, help='Score threshold for decision agreement')
+    
+    args = parser.parse_args()
+    configure_threads(args.threads, settings.torch_interop_threads)
+    
+    eager = LSTMDetector(device='cpu', inference_backend='eager')
+    eager.load_model(args.model_path)
+    detectors = {'eager': eager}
+    for backend in ('scripted', 'quantized'):
+        # Built in memory, so exports on disk are not needed
+        detector = copy.copy(eager)
+        detector.model = eager.script_module(quantize=backend == 'quantized')
+        detectors[backend] = detector
+    
+    X, labels = load_rows(eager, args.data_path, args.max_rows)
+    print(f"Comparing on {len(X):,} rows with {args.threads or 'default'} torch threads")
+    
+    expected = eager.predict_batch(X)
+    print(f"\n{'backend':<10} {'max |diff|':>11} {'mean |diff|':>12} {'flipped':>8}" + (f" {'accuracy':>9}" if labels is not None else ''))
+    for name, detector in detectors.items():
+        scores = detector.predict_batch(X)
+        diff = np.abs(scores - expected)
+        flipped = int(((scores >= args.threshold) != (expected >= args.threshold)).sum())
+        line = f"{name:<10} {diff.max():>11.3e} {diff.mean():>12.3e} {flipped:>8}"
+        if labels is not None:
+            line += f" {((scores >= args.threshold) == labels).mean():>9.4f}"
+        print(line)
+    
+    names = list(detectors)
+    print(f"\n{'batch':>6} " + ' '.join(f"{name + ' ms':>13}" for name in names) + f" {'scripted':>9} {'quantized':>10}")
+    rows = [(str(size), X[np.arange(int(size)) % len(X)]) for size in args.batch_sizes.split(',')]
+    for label, batch in rows + [('step', None)]:
+        timings = []
+        for detector in detectors.values():
+            if batch is None:
+                # One event of a lineage from its carried state (LSTM_SEQUENCE_ENABLED)
+                _, state = detector.predict_sequence(X[None, :8])
+                timings.append(time_call(lambda: detector.predict_sequence(X[None, :1], state), args.iterations))
+            else:
+                timings.append(time_call(lambda: detector.predict_batch(batch), args.iterations))
+        print(f"{label:>6} " + ' '.join(f"{ms:>13.3f}" for ms in timings) +
+              f" {timings[0] / timings[1]:>8.1f}x {timings[0] / timings[2]:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
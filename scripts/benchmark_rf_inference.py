@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Verify and benchmark the compiled Random Forest backend against sklearn predict_proba
+"""
+
+import argparse
+import csv
+import time
+import numpy as np
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.ml.random_forest_model import RandomForestDetector
+from app.ml.compiled_forest import CompiledForest
+from app.core.config import settings
+
+
+def load_rows(detector: RandomForestDetector, data_path: str, max_rows: int) -> np.ndarray:
+    """Build feature rows from an event CSV, or fall back to the model's background data."""
+    if data_path:
+        with open(data_path, newline='', encoding='utf-8') as f:
+            events = [row for _, row in zip(range(max_rows), csv.DictReader(f))]
+        extractor = detector.feature_extractor
+        features = [extractor.extract_features(event) for event in events]
+        return extractor.build_matrix(features, detector.feature_names)
+    
+    if detector.background_data is not None:
+        return np.asarray(detector.background_data, dtype=np.float32)
+    
+    rng = np.random.default_rng(42)
+    return rng.random((max_rows, len(detector.feature_names))).astype(np.float32) * 10
+
+
+def time_call(fn, X: np.ndarray, iterations: int) -> float:
+    """Median latency of fn(X) in milliseconds."""
+    fn(X)  # warm-up
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(X)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify and benchmark compiled Random Forest inference')
+    parser.add_argument('--model-path', type=str, default=settings.random_forest_model_path, help='Path to Random Forest model')
+    parser.add_argument('--data-path', type=str, help='Event CSV used to build feature rows (default: model background data)')
+    parser.add_argument('--max-rows', type=int, default=5000, help='Maximum rows to verify')
+    parser.add_argument('--batch-sizes', type=str, default='1,8,32,256', help='Comma-separated batch sizes to time')
+    parser.add_argument('--iterations', type=int, default=200, help='Timed iterations per batch size')
+    parser.add_argument('--tolerance', type=float, default=1e-9, help='Maximum allowed absolute probability difference')
+    
+    args = parser.parse_args()
+    
+    detector = RandomForestDetector()
+    detector.load_model(args.model_path)
+    sklearn_model = detector.model
+    
+    start = time.perf_counter()
+    compiled = CompiledForest.from_sklearn(sklearn_model)
+    print(f"Compiled {compiled.n_trees} trees ({len(compiled.feature):,} nodes, depth {compiled.max_depth}) "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+    
+    X = load_rows(detector, args.data_path, args.max_rows)
+    print(f"Verifying on {len(X):,} rows...")
+    
+    expected = sklearn_model.predict_proba(X)
+    actual = compiled.predict_proba(X)
+    max_diff = float(np.abs(expected - actual).max()) if len(X) else 0.0
+    print(f"  Max absolute difference: {max_diff:.3e} (tolerance {args.tolerance:.1e})")
+    
+    if max_diff > args.tolerance:
+        print("  FAILED: compiled forest does not match predict_proba")
+        sys.exit(1)
+    print("  OK")
+    
+    print(f"\n{'batch':>6} {'sklearn ms':>12} {'compiled ms':>12} {'speedup':>9}")
+    for batch_size in [int(size) for size in args.batch_sizes.split(',')]:
+        batch = X[np.arange(batch_size) % len(X)]
+        sklearn_ms = time_call(sklearn_model.predict_proba, batch, args.iterations)
+        compiled_ms = time_call(compiled.predict_proba, batch, args.iterations)
+        print(f"{batch_size:>6} {sklearn_ms:>12.3f} {compiled_ms:>12.3f} {sklearn_ms / compiled_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
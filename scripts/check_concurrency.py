@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Check that read endpoints stay responsive while POST /events is saturated
+"""
+
+import argparse
+import threading
+import time
+import uuid
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+
+def saturate_events(base_url: str, stop: threading.Event, counts: dict, lock: threading.Lock):
+    """Post unique events back to back until stopped."""
+    session = requests.Session()
+    while not stop.is_set():
+        # Unique command lines so every request is scored rather than served from the score cache
+        event = {
+            'event_id': str(uuid.uuid4()),
+            'timestamp': datetime.now().isoformat(),
+            'process_name': 'powershell.exe',
+            'command_line': f'powershell.exe -nop -w hidden -enc {uuid.uuid4().hex}',
+            'parent_image': 'C:\\Windows\\explorer.exe',
+            'user': 'DESKTOP\\analyst',
+            'integrity_level': 'Medium'
+        }
+        try:
+            response = session.post(f"{base_url}/api/v1/events", json=event, timeout=60)
+            key = 'ok' if response.status_code == 200 else 'failed'
+        except requests.RequestException:
+            key = 'failed'
+        with lock:
+            counts[key] += 1
+
+
+def probe(base_url: str, path: str, stop: threading.Event, interval: float) -> list:
+    """Time GET requests to one path until stopped; failed requests are recorded as None."""
+    session = requests.Session()
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            response = session.get(f"{base_url}{path}", timeout=30)
+            latencies.append((time.perf_counter() - start) * 1000 if response.status_code == 200 else None)
+        except requests.RequestException:
+            latencies.append(None)
+        time.sleep(interval)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Probe /health and /detections latency while /events is saturated')
+    parser.add_argument('--url', type=str, default='http://localhost:8000', help='API base URL')
+    parser.add_argument('--event-clients', type=int, default=16, help='Concurrent clients posting events')
+    parser.add_argument('--duration', type=float, default=15.0, help='Seconds to saturate /events')
+    parser.add_argument('--interval', type=float, default=0.1, help='Seconds between probe requests')
+    parser.add_argument('--max-p95-ms', type=float, default=500.0, help='Fail if a probe p95 latency exceeds this')
+    
+    args = parser.parse_args()
+    base_url = args.url.rstrip('/')
+    
+    stop = threading.Event()
+    counts = {'ok': 0, 'failed': 0}
+    lock = threading.Lock()
+    probe_paths = ['/health', '/api/v1/detections?limit=20']
+    
+    print(f"Saturating {base_url}/api/v1/events with {args.event_clients} clients for {args.duration:.0f}s...")
+    with ThreadPoolExecutor(max_workers=args.event_clients + len(probe_paths)) as executor:
+        for _ in range(args.event_clients):
+            executor.submit(saturate_events, base_url, stop, counts, lock)
+        probes = {path: executor.submit(probe, base_url, path, stop, args.interval) for path in probe_paths}
+        
+        time.sleep(args.duration)
+        stop.set()
+        results = {path: future.result() for path, future in probes.items()}
+    
+    print(f"\nPOST /api/v1/events: {counts['ok']:,} ok, {counts['failed']:,} failed "
+          f"({counts['ok'] / args.duration:.1f} events/s)")
+    
+    print(f"\n{'endpoint':<30} {'requests':>9} {'failed':>7} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    passed = True
+    for path, latencies in results.items():
+        timings = np.array([latency for latency in latencies if latency is not None])
+        failed = len(latencies) - len(timings)
+        if len(timings) == 0:
+            print(f"{path:<30} {len(latencies):>9} {failed:>7} {'-':>9} {'-':>9} {'-':>9}")
+            passed = False
+            continue
+        
+        p50, p95 = np.percentile(timings, [50, 95])
+        print(f"{path:<30} {len(latencies):>9} {failed:>7} {p50:>9.1f} {p95:>9.1f} {timings.max():>9.1f}")
+        if failed or p95 > args.max_p95_ms:
+            passed = False
+    
+    print(f"\n{'PASSED' if passed else 'FAILED'}: probe p95 limit {args.max_p95_ms:.0f} ms")
+    if not passed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
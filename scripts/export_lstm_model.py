@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Export the LSTM checkpoint as TorchScript, and optionally int8-quantized, modules for CPU inference
+"""
+
+import argparse
+import numpy as np
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.ml.lstm_model import LSTMDetector
+from app.core.config import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the LSTM model for scripted or quantized CPU inference')
+    parser.add_argument('--model-path', type=str, default=settings.lstm_model_path, help='Path to the LSTM checkpoint')
+    parser.add_argument('--quantize', action='store_true',
+                        help='Also export a dynamically int8-quantized module (preferred by LSTM_INFERENCE_BACKEND=auto)')
+    parser.add_argument('--tolerance', type=float, default=1e-5,
+                        help='Maximum allowed absolute score difference of the scripted module')
+    
+    args = parser.parse_args()
+    
+    detector = LSTMDetector(device='cpu', inference_backend='eager')
+    detector.load_model(args.model_path)
+    written = detector.export(quantize=args.quantize)
+    
+    # Verify each export through the same loader the API uses
+    rng = np.random.default_rng(42)
+    X = rng.random((256, detector.input_size)).astype(np.float32) * 10
+    expected = detector.predict_batch(X)
+    failed = False
+    for backend, path in written.items():
+        exported = LSTMDetector(device='cpu', inference_backend=backend)
+        exported.load_model(args.model_path)
+        if exported.backend != backend:
+            print(f"  FAILED: {path} could not be loaded back")
+            failed = True
+            continue
+        max_diff = float(np.abs(exported.predict_batch(X) - expected).max())
+        print(f"Wrote {path} ({backend}): max absolute score difference {max_diff:.3e}")
+        if backend == 'scripted' and max_diff > args.tolerance:
+            print(f"  FAILED: scripted module differs from the eager model by more than {args.tolerance:.1e}")
+            failed = True
+    
+    if failed:
+        # Do not leave a mismatching module for the API to prefer
+        for path in written.values():
+            Path(path).unlink()
+        sys.exit(1)
+    print("Running servers pick the export up on the next reload (POST /api/v1/admin/models/reload)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
-from app.core.database import Base, engine
+from app.core.database import Base, engine, SessionLocal, create_indexes
+from app.core.partitioning import create_partitioned_tables
 from app.models.database import Event, Detection, SystemStats
+from app.services.stats_rollup import StatsRollup
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -10,8 +12,17 @@ def init_database():
     """Initialize database tables."""
     try:
         logger.info("Creating database tables...")
+        create_partitioned_tables(engine)
         Base.metadata.create_all(bind=engine)
+        create_indexes()
         logger.info("Database tables created successfully.")
+        
+        db = SessionLocal()
+        try:
+            StatsRollup().ensure(db)
+            db.commit()
+        finally:
+            db.close()
     except Exception as e:
         logger.error(f"Error creating database tables: {e}")
         raise
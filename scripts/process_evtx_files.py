@@ -1,8 +1,15 @@
 import argparse
 import json
 import csv
+import os
+import textwrap
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
 from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
 import sys
 
 try:
@@ -12,25 +19,47 @@ except ImportError:
     EVTX_AVAILABLE = False
     print("WARNING: python-evtx not available. Install with: pip install python-evtx")
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
 
-def parse_evtx_file(evtx_path: str) -> list:
-    """Parse EVTX file and extract events."""
+FIELDNAMES = ['event_id', 'timestamp', 'process_name', 'command_line',
+              'parent_image', 'user', 'integrity_level', 'label']
+
+# EVTX chunks (64 KiB, a few hundred records) per parse task; big files are split across workers
+CHUNKS_PER_TASK = 64
+# Rows per Parquet row group
+PARQUET_ROW_GROUP_SIZE = 50000
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+# (file path, first chunk, end chunk or None for the rest of the file, label)
+Task = Tuple[str, int, Optional[int], int]
+
+
+def iter_evtx_events(evtx_path: str, first_chunk: int = 0, end_chunk: int = None) -> Iterator[dict]:
+    """Yield the events of an EVTX file, or of the chunks first_chunk to end_chunk - 1."""
     if not EVTX_AVAILABLE:
         raise ImportError("python-evtx library not available")
     
-    events = []
-    
     with evtx.Evtx(evtx_path) as log:
-        for record in log.records():
-            try:
-                event_data = parse_event_record(record)
-                if event_data:
-                    events.append(event_data)
-            except Exception as e:
-                print(f"Error parsing record: {e}")
-                continue
-    
-    return events
+        for chunk in islice(log.chunks(), first_chunk, end_chunk):
+            for record in chunk.records():
+                try:
+                    event_data = parse_event_record(record)
+                    if event_data:
+                        yield event_data
+                except Exception as e:
+                    print(f"Error parsing record: {e}")
+                    continue
+
+
+def parse_evtx_file(evtx_path: str) -> list:
+    """Parse EVTX file and extract events."""
+    return list(iter_evtx_events(evtx_path))
 
 
 def parse_event_record(record) -> dict:
@@ -79,49 +108,172 @@ def parse_event_record(record) -> dict:
     return None
 
 
-def save_events_to_csv(events: list, output_path: str):
-    """Save events to CSV file."""
-    if not events:
-        print("No events to save.")
+def plan_tasks(evtx_files: List[Path], label: int, chunks_per_task: int = CHUNKS_PER_TASK) -> List[Task]:
+    """Split the files into parse tasks of at most chunks_per_task chunks each."""
+    tasks = []
+    for evtx_file in evtx_files:
+        try:
+            with evtx.Evtx(str(evtx_file)) as log:
+                chunk_count = log.get_file_header().chunk_count()
+        except Exception as e:
+            print(f"  Could not read header of {evtx_file.name}, parsing it as one task: {e}")
+            chunk_count = 0
+        
+        if chunk_count <= chunks_per_task:
+            tasks.append((str(evtx_file), 0, None, label))
+            continue
+        for first in range(0, chunk_count, chunks_per_task):
+            # The last task reads to the end, including chunks the header does not count yet
+            end = first + chunks_per_task if first + chunks_per_task < chunk_count else None
+            tasks.append((str(evtx_file), first, end, label))
+    return tasks
+
+
+def parse_task(task: Task) -> Tuple[Task, list, Optional[str]]:
+    """Parse one task in a worker; returns the task, its labelled events and an error message, if any."""
+    path, first_chunk, end_chunk, label = task
+    events = []
+    try:
+        for event in iter_evtx_events(path, first_chunk, end_chunk):
+            event['label'] = label
+            events.append(event)
+    except Exception as e:
+        return task, events, str(e)
+    return task, events, None
+
+
+def run_tasks(tasks: List[Task], workers: int) -> Iterator[Tuple[Task, list, Optional[str]]]:
+    """Yield parse results in task order, keeping at most two tasks per worker in flight.
+    
+    The window bounds memory: results wait for the writer instead of
+    piling up, however many files there are.
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield parse_task(task)
         return
     
-    fieldnames = ['event_id', 'timestamp', 'process_name', 'command_line', 
-                  'parent_image', 'user', 'integrity_level', 'label']
+    remaining = iter(tasks)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque(pool.submit(parse_task, task) for task in islice(remaining, workers * 2))
+        while in_flight:
+            result = in_flight.popleft().result()
+            next_task = next(remaining, None)
+            if next_task is not None:
+                in_flight.append(pool.submit(parse_task, next_task))
+            yield result
+
+
+class EventWriter:
+    """Writes events to an output file as they arrive; the file is created with the first event."""
     
-    with open(output_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        for event in events:
-            row = {
-                'event_id': event.get('event_id', ''),
-                'timestamp': event.get('timestamp', ''),
-                'process_name': event.get('process_name', ''),
-                'command_line': event.get('command_line', ''),
-                'parent_image': event.get('parent_image', ''),
-                'user': event.get('user', ''),
-                'integrity_level': event.get('integrity_level', ''),
-                'label': event.get('label', 0)  # Default to benign
-            }
-            writer.writerow(row)
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.count = 0
+        self._file = None
+    
+    def write(self, events: list):
+        if not events:
+            return
+        if self._file is None:
+            self._open()
+        self._write(events)
+        self.count += len(events)
     
-    print(f"Saved {len(events)} events to {output_path}")
+    def close(self):
+        if self._file is None:
+            print("No events to save.")
+            return
+        self._close()
+        print(f"Saved {self.count} events to {self.output_path}")
+    
+    def _open(self):
+        self._file = open(self.output_path, 'w', newline='', encoding='utf-8')
+    
+    def _write(self, events: list):
+        raise NotImplementedError
+    
+    def _close(self):
+        self._file.close()
 
 
-def save_events_to_json(events: list, output_path: str):
-    """Save events to JSON file."""
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(events, f, indent=2, default=str)
+class CSVEventWriter(EventWriter):
+    """Save events to CSV file."""
     
-    print(f"Saved {len(events)} events to {output_path}")
+    def _open(self):
+        super()._open()
+        self._writer = csv.DictWriter(self._file, fieldnames=FIELDNAMES)
+        self._writer.writeheader()
+    
+    def _write(self, events: list):
+        self._writer.writerows(event_row(event) for event in events)
+
+
+class JSONEventWriter(EventWriter):
+    """Save events to JSON file, as one indented array."""
+    
+    def _write(self, events: list):
+        for i, event in enumerate(events):
+            self._file.write('[\n' if self.count == 0 and i == 0 else ',\n')
+            self._file.write(textwrap.indent(json.dumps(event, indent=2, default=str), '  '))
+    
+    def _close(self):
+        self._file.write('\n]')
+        super()._close()
+
+
+class ParquetEventWriter(EventWriter):
+    """Save events to Parquet file, in row groups of PARQUET_ROW_GROUP_SIZE rows."""
+    
+    def __init__(self, output_path: str):
+        if not PYARROW_AVAILABLE:
+            raise ImportError("pyarrow is required for Parquet output: pip install pyarrow")
+        super().__init__(output_path)
+        # Written batches are kept as Arrow tables, far smaller than row dicts, until a row group is full
+        self._tables = []
+        self._buffered = 0
+        self._schema = pa.schema([(name, pa.int64() if name == 'label' else pa.string()) for name in FIELDNAMES])
+    
+    def _open(self):
+        self._file = pq.ParquetWriter(self.output_path, self._schema)
+    
+    def _write(self, events: list):
+        self._tables.append(pa.Table.from_pylist([event_row(event) for event in events], schema=self._schema))
+        self._buffered += len(events)
+        if self._buffered >= PARQUET_ROW_GROUP_SIZE:
+            self._flush()
+    
+    def _close(self):
+        self._flush()
+        self._file.close()
+    
+    def _flush(self):
+        if self._tables:
+            self._file.write_table(pa.concat_tables(self._tables), row_group_size=self._buffered)
+            self._tables = []
+            self._buffered = 0
+
+
+WRITERS = {'csv': CSVEventWriter, 'json': JSONEventWriter, 'parquet': ParquetEventWriter}
+
+
+def event_row(event: dict) -> dict:
+    """Output row with every column, missing fields empty and label defaulting to benign."""
+    row = {name: event.get(name) or '' for name in FIELDNAMES[:-1]}
+    row['label'] = event.get('label', 0)
+    return row
 
 
 def main():
     parser = argparse.ArgumentParser(description='Process EVTX files and extract events')
     parser.add_argument('--input-dir', type=str, required=True, help='Input directory containing EVTX files')
     parser.add_argument('--output-dir', type=str, required=True, help='Output directory for processed files')
-    parser.add_argument('--format', choices=['csv', 'json'], default='csv', help='Output format')
+    parser.add_argument('--format', choices=sorted(WRITERS), default='csv', help='Output format')
     parser.add_argument('--label', type=int, default=0, help='Label for events (0=benign, 1=malicious)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Parser processes (default: one per CPU; 1 parses in this process)')
+    parser.add_argument('--chunks-per-task', type=int, default=CHUNKS_PER_TASK,
+                        help='EVTX chunks per parse task; larger files are split across workers')
     
     args = parser.parse_args()
     
@@ -134,41 +286,41 @@ def main():
     output_dir.mkdir(parents=True, exist_ok=True)
     
     # Find all EVTX files
-    evtx_files = list(input_dir.glob('*.evtx'))
+    evtx_files = sorted(input_dir.glob('*.evtx'))
     
     if not evtx_files:
         print(f"No EVTX files found in {input_dir}")
         return
     
-    print(f"Found {len(evtx_files)} EVTX files")
+    tasks = plan_tasks(evtx_files, args.label, max(1, args.chunks_per_task))
+    print(f"Found {len(evtx_files)} EVTX files ({len(tasks)} parse tasks, {args.workers} workers)")
     
-    all_events = []
+    writer = WRITERS[args.format](str(output_dir / f"events.{args.format}"))
+    file_events = {}
+    tasks_left = {}
+    for task in tasks:
+        tasks_left[task[0]] = tasks_left.get(task[0], 0) + 1
     
-    for evtx_file in evtx_files:
-        print(f"Processing {evtx_file.name}...")
-        try:
-            events = parse_evtx_file(str(evtx_file))
-            for event in events:
-                event['label'] = args.label
-            all_events.extend(events)
-            print(f"  Extracted {len(events)} events")
-        except Exception as e:
-            print(f"  Error processing {evtx_file.name}: {e}")
+    started = last_progress = time.monotonic()
+    for done, (task, events, error) in enumerate(run_tasks(tasks, args.workers), 1):
+        path = task[0]
+        writer.write(events)
+        file_events[path] = file_events.get(path, 0) + len(events)
+        if error:
+            print(f"  Error processing {Path(path).name} (from chunk {task[1]}): {error}")
+        
+        tasks_left[path] -= 1
+        if not tasks_left[path]:
+            print(f"  {Path(path).name}: extracted {file_events.pop(path)} events")
+        
+        now = time.monotonic()
+        if now - last_progress >= PROGRESS_INTERVAL or done == len(tasks):
+            print(f"Progress: {done}/{len(tasks)} tasks, {writer.count:,} events "
+                  f"({writer.count / (now - started):,.0f}/s)")
+            last_progress = now
     
-    # Save combined events
-    if all_events:
-        output_file = output_dir / f"events.{args.format}"
-        if args.format == 'csv':
-            save_events_to_csv(all_events, str(output_file))
-        else:
-            save_events_to_json(all_events, str(output_file))
-    else:
-        print("No events extracted.")
+    writer.close()
 
 
 if __name__ == "__main__":
     main()
-
-
-
-
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Query the Parquet detection archive with DuckDB
+"""
+
+import argparse
+from pathlib import Path
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pandas as pd
+from app.core.config import settings
+from app.services.archive import ArchiveQuery
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the Parquet detection archive')
+    parser.add_argument('--archive-dir', type=str, default=settings.archive_dir, help='Archive directory')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    top = subparsers.add_parser('top-processes', help='Most frequent process names per score bucket')
+    top.add_argument('--days', type=int, default=90, help='Days back from today')
+    top.add_argument('--bucket-width', type=float, default=0.1, help='Malicious score bucket width')
+    top.add_argument('--limit', type=int, default=5, help='Process names per bucket')
+    
+    sql = subparsers.add_parser('sql', help='Run SQL against the "detections" view')
+    sql.add_argument('query', type=str, help='e.g. "SELECT host, count(*) FROM detections GROUP BY host"')
+    
+    args = parser.parse_args()
+    
+    archive = ArchiveQuery(args.archive_dir)
+    start = time.perf_counter()
+    if args.command == 'top-processes':
+        result = archive.top_processes(days=args.days, bucket_width=args.bucket_width, limit=args.limit)
+    else:
+        result = archive.sql(args.query)
+    seconds = time.perf_counter() - start
+    
+    with pd.option_context('display.max_rows', 200, 'display.width', 200, 'display.max_colwidth', 80):
+        print(result.to_string(index=False))
+    print(f"\n{len(result):,} rows in {seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Check or rebuild the /stats counter rollup from the events and detections tables
+"""
+
+import argparse
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.database import SessionLocal
+from app.services.stats_rollup import StatsRollup, COUNTER_FIELDS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check or rebuild the /stats counter rollup')
+    parser.add_argument('--check', action='store_true', help='Only compare the rollup with a full recount')
+    
+    args = parser.parse_args()
+    rollup = StatsRollup()
+    
+    db = SessionLocal()
+    try:
+        current = rollup.get(db)
+        recounted = {field: getattr(rollup.rebuild(db), field) for field in COUNTER_FIELDS}
+        
+        print(f"{'counter':<24} {'rollup':>12} {'recount':>12}")
+        for field in COUNTER_FIELDS:
+            marker = '' if current[field] == recounted[field] else '  <- drift'
+            print(f"{field:<24} {current[field]:>12,} {recounted[field]:>12,}{marker}")
+        
+        drifted = current != recounted
+        if args.check:
+            db.rollback()
+            if drifted:
+                raise SystemExit(1)
+            return
+        
+        db.commit()
+        print("\nRollup rebuilt" if drifted else "\nRollup already matched; timestamp refreshed")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
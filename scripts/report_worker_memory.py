@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Report the memory use of every worker of a running API server (Linux only)
+
+Run with the same model settings as the server. The total PSS is what the
+workers really use together; with MODEL_MEMORY_MODE=mmap the model mappings
+are shared, so their PSS per worker drops as workers are added.
+"""
+
+import argparse
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.core.memory import process_memory, child_pids
+from app.services.model_registry import ModelRegistry
+
+
+def find_server_pid() -> int:
+    """PID of the outermost process started with app.main:app as an argument."""
+    servers = {}
+    for cmdline_path in Path('/proc').glob('[0-9]*/cmdline'):
+        try:
+            arguments = cmdline_path.read_bytes().decode(errors='replace').split('\0')
+        except OSError:
+            continue
+        if 'app.main:app' in arguments:
+            pid = int(cmdline_path.parent.name)
+            servers[pid] = child_pids(pid)
+    children = {child for pids in servers.values() for child in pids}
+    masters = [pid for pid in servers if pid not in children]
+    if not masters:
+        raise SystemExit("No running app.main:app server found; pass --pid")
+    return min(masters)
+
+
+def process_role(pid: int) -> str:
+    """worker, or helper for multiprocessing's resource tracker."""
+    try:
+        cmdline = Path(f'/proc/{pid}/cmdline').read_bytes().decode(errors='replace')
+    except OSError:
+        return 'worker'
+    return 'helper' if 'resource_tracker' in cmdline else 'worker'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report RSS, PSS and shared model memory per API worker')
+    parser.add_argument('--pid', type=int, help='PID of the uvicorn master (default: find app.main:app)')
+    
+    args = parser.parse_args()
+    master_pid = args.pid or find_server_pid()
+    mapped_paths = ModelRegistry().mapped_paths()
+    mib = 1024 * 1024
+    
+    print(f"Model memory mode: {settings.model_memory_mode}")
+    print(f"{'PID':>8} {'Role':<8} {'RSS MiB':>9} {'PSS MiB':>9} {'Shared':>9} {'Private':>9} {'Model RSS':>10} {'Model PSS':>10}")
+    totals = {'rss_bytes': 0, 'pss_bytes': 0}
+    for role, pid in [('master', master_pid)] + [(process_role(pid), pid) for pid in child_pids(master_pid)]:
+        try:
+            memory = process_memory(pid, mapped_paths)
+        except OSError as e:
+            print(f"{pid:>8} {role:<8} unreadable: {e}")
+            continue
+        totals['rss_bytes'] += memory['rss_bytes']
+        totals['pss_bytes'] += memory['pss_bytes']
+        print(
+            f"{pid:>8} {role:<8} {memory['rss_bytes'] / mib:>9.1f} {memory['pss_bytes'] / mib:>9.1f} "
+            f"{memory['shared_bytes'] / mib:>9.1f} {memory['private_bytes'] / mib:>9.1f} "
+            f"{memory['model_rss_bytes'] / mib:>10.1f} {memory['model_pss_bytes'] / mib:>10.1f}"
+        )
+    
+    print(f"Total RSS: {totals['rss_bytes'] / mib:.1f} MiB (counts shared pages once per process)")
+    print(f"Total PSS: {totals['pss_bytes'] / mib:.1f} MiB (physical memory actually used)")
+
+
+if __name__ == "__main__":
+    main()
@@ -33,31 +33,16 @@ def load_data(data_path: str) -> tuple:
     feature_extractor = FeatureExtractor()
     feature_names = feature_extractor.get_feature_names()
     
-    X = []
-    y = []
-    
-    for _, row in df.iterrows():
-        event_data = {
-            'command_line': row.get('command_line', ''),
-            'process_name': row.get('process_name', ''),
-            'parent_image': row.get('parent_image', ''),
-            'user': row.get('user', ''),
-            'integrity_level': row.get('integrity_level', ''),
-            'timestamp': row.get('timestamp')
-        }
-        
-        features = feature_extractor.extract_features(event_data)
-        feature_vector = [features.get(name, 0.0) for name in feature_names]
-        X.append(feature_vector)
-        
-        # Label: 0 for benign, 1 for malicious
-        label = row.get('label', row.get('is_malicious', 0))
-        if isinstance(label, bool):
-            label = 1 if label else 0
-        y.append(label)
-    
-    X = np.array(X, dtype=np.float32)
-    y = np.array(y, dtype=np.float32)
+    X = feature_extractor.extract_batch(df)
+    
+    # Label: 0 for benign, 1 for malicious
+    if 'label' in df.columns:
+        labels = df['label']
+    elif 'is_malicious' in df.columns:
+        labels = df['is_malicious']
+    else:
+        labels = pd.Series(0, index=df.index)
+    y = labels.to_numpy(dtype=np.float32)
     
     logger.info(f"Feature matrix shape: {X.shape}")
     logger.info(f"Labels: {sum(y)} malicious, {len(y) - sum(y)} benign")
@@ -17,6 +17,7 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from app.ml.feature_extraction import FeatureExtractor
+from app.ml.random_forest_model import RandomForestDetector
 
 def load_data_with_weights(data_path: str):
     """Load data and extract features with weights."""
@@ -40,34 +41,9 @@ def load_data_with_weights(data_path: str):
     feature_extractor = FeatureExtractor()
     feature_names = feature_extractor.get_feature_names()
     
-    X = []
-    y = []
-    sample_weights = []
-    
-    for idx, row in df.iterrows():
-        event_data = {
-            'command_line': row.get('command_line', ''),
-            'process_name': row.get('process_name', ''),
-            'parent_image': row.get('parent_image', ''),
-            'user': row.get('user', ''),
-            'integrity_level': row.get('integrity_level', ''),
-            'timestamp': row.get('timestamp')
-        }
-        
-        features = feature_extractor.extract_features(event_data)
-        feature_vector = [features.get(name, 0.0) for name in feature_names]
-        X.append(feature_vector)
-        
-        label = row.get('label', 0)
-        if isinstance(label, bool):
-            label = 1 if label else 0
-        y.append(label)
-        
-        sample_weights.append(weights[idx])
-    
-    X = np.array(X, dtype=np.float32)
-    y = np.array(y, dtype=np.float32)
-    sample_weights = np.array(sample_weights, dtype=np.float32)
+    X = feature_extractor.extract_batch(df)
+    y = (df['label'] if 'label' in df.columns else pd.Series(0, index=df.index)).to_numpy(dtype=np.float32)
+    sample_weights = np.asarray(weights, dtype=np.float32)
     
     print(f"  Feature matrix shape: {X.shape}")
     print(f"  Labels: {sum(y)} malicious, {len(y) - sum(y)} benign")
@@ -111,7 +87,8 @@ def train_with_weights(X_train, y_train, X_test, y_test, sample_weights_train, f
     # Save model
     model_data = {
         'model': model,
-        'feature_names': feature_names
+        'feature_names': feature_names,
+        'background_data': RandomForestDetector.sample_background(X_train)
     }
     Path(output_path).parent.mkdir(parents=True, exist_ok=True)
     joblib.dump(model_data, output_path)
